@@ -1,19 +1,63 @@
-from sqlalchemy import select
+from typing import Optional
 
-from app.database import async_session_maker
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_dao_session
 from app.dao.base import BaseDAO
 from app.boosts.models import Improvements
+from app.users.models import Users
 
 
 class ImprovementsDAO(BaseDAO):
     model = Improvements
 
     @classmethod
-    async def get_user_boost_by_name(cls, user_id: int, boost_name: str):
-        async with async_session_maker() as session:
+    async def get_user_boost_by_name(cls, user_id: int, boost_name: str, session: AsyncSession = None):
+        async with get_dao_session(session) as session:
             query = select(cls.model.__table__.columns).where(
                 cls.model.user_id == user_id,
                 cls.model.name == boost_name
             )
             result = await session.execute(query)
             return result.mappings().first()
+
+    @classmethod
+    async def save_purchase(
+            cls,
+            boost_id: Optional[int],
+            boost_data: dict,
+            user_data: dict,
+            session: AsyncSession = None
+    ):
+        """
+        Сохраняет купленное улучшение и новые значения пользователя одной транзакцией.
+
+        Args:
+            boost_id (int, None): Идентификатор улучшения пользователя, None - улучшение покупается впервые.
+            boost_data (dict): Данные улучшения, включая `user_id`.
+            user_data (dict): Новые значения полей пользователя (баланс и характеристики улучшения).
+            session (AsyncSession): Сессия базы данных запроса, None - открыть новую.
+
+        Returns:
+            Запись улучшения (mapping) после сохранения.
+
+        Notes:
+            Если любая из записей завершилась ошибкой, транзакция откатывается и ничего не сохраняется.
+        """
+        async with get_dao_session(session) as session:
+            try:
+                if boost_id is None:
+                    query = insert(cls.model).values(**boost_data)
+                else:
+                    query = update(cls.model).where(cls.model.id == boost_id).values(**boost_data)
+                result = await session.execute(query.returning(cls.model.__table__.columns))
+                boost = result.mappings().first()
+                await session.execute(
+                    update(Users).where(Users.id == boost_data["user_id"]).values(**user_data)
+                )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            return boost
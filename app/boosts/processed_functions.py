@@ -1,17 +1,23 @@
 from typing import Optional, Tuple
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.users.dao import UsersDAO
 from app.boosts.dao import ImprovementsDAO
-from app.exceptions import BadRequestException
-from app.utils.users_init import add_user_data_to_redis
+from app.redis_init import get_redis
+from app.exceptions import BadRequestException, NotEnoughFundsException
+from app.utils.users_init import add_user_data_to_redis, add_autoclicker_user
+from app.utils.leaderboard import set_user_balance
+from app.redis_helpers.functions import call_function
 from app.game_data.game_entity_models import GameBoostsRegistry
-from app.utils.data_processing_funcs import restore_types_from_redis
+from app.utils.data_processing_funcs import get_user_data_key, to_milli_blocks
 
 
 async def get_level_purchased_boost(
         user_id: int,
         boost_name: str,
-        boost_details: dict
+        boost_details: dict,
+        session: AsyncSession = None
 ) -> Optional[Tuple[int, Optional[int]]]:
     """
     Получает уровень, до которого прокачается покупаемое пользователем улучшение (если он его покупал),
@@ -21,6 +27,7 @@ async def get_level_purchased_boost(
         user_id (int): Идентификатор пользователя.
         boost_name (str): Название улучшения.
         boost_details: Характеристики и описание улучшения.
+        session (AsyncSession): Сессия базы данных запроса, None - открыть новую.
 
     Returns:
         tuple: Кортеж, содержащий:
@@ -30,7 +37,7 @@ async def get_level_purchased_boost(
     Raises:
         BadRequestException: Если текущий уровень улучшения пользователя достиг максимального.
     """
-    user_boost = await ImprovementsDAO.get_user_boost_by_name(user_id, boost_name)
+    user_boost = await ImprovementsDAO.get_user_boost_by_name(user_id, boost_name, session=session)
     boost_max_levels = boost_details["max_levels"]
 
     if not user_boost:
@@ -45,41 +52,88 @@ async def get_level_purchased_boost(
         raise BadRequestException
 
 
-async def recalculate_user_data_in_dbs(
+async def purchase_boost(
         current_user: dict,
         boost_name: str,
         boost_price: float,
-        boost_value: str
-) -> None:
+        boost_value: str,
+        boost_id: Optional[int],
+        boost_data: dict,
+        session: AsyncSession = None
+):
     """
-    Обновляет в Redis и базе значения баланса и улучшений пользователя в зависимости от купленного им улучшения.
+    Списывает цену улучшения с баланса пользователя, сохраняет купленное улучшение и обновляет
+    в Redis и базе значения улучшений пользователя в зависимости от купленного им улучшения.
 
     Args:
         current_user (dict): Словарь с данными пользователя, включая `id`, `username` и `blocks_balance`.
         boost_name (str): Название купленного улучшения.
-        boost_price (float): Цена улучшения.
+        boost_price (float): Цена улучшения в блоках.
         boost_value (int): Значение улучшения, устанавливаемое для соответствующего параметра пользователя.
+        boost_id (int, None): Идентификатор улучшения пользователя, None - улучшение покупается впервые.
+        boost_data (dict): Данные улучшения для записи в базу.
+        session (AsyncSession): Сессия базы данных запроса, None - открыть новую.
 
     Returns:
-        None
+        Запись купленного улучшения (mapping).
+
+    Raises:
+        NotEnoughFundsException: Если средств на балансе пользователя недостаточно для покупки.
 
     Notes:
-        - Если пользователь покупает не автокликер и у него еще нет автокликера, то время хранения
-          его данных в Redis - 1 час. Иначе - бесконечно. Это нужно для подсчета баланса в фоне.
+        - Баланс изменяется в Redis одним вызовом функции "spend_balance" (проверка баланса,
+          начисление автокликера и списание цены), поэтому одновременные клики или покупки
+          не теряют обновления баланса.
+        - Улучшение и новые значения пользователя сохраняются в базе одной транзакцией
+          (см. `ImprovementsDAO.save_purchase`). Если сохранить их не удалось, цена и прежнее
+          значение улучшения возвращаются пользователю в Redis функцией "refund_balance".
+        - Если пользователь покупает автокликер, после сохранения покупки его данные хранятся
+          в Redis бессрочно и он добавляется в индекс для подсчета баланса в фоне.
     """
+    user_update = {}
     if boost_name.lower() == "autoclicker":
-        current_user["clicks_per_sec"] = int(boost_value)
+        user_update["clicks_per_sec"] = int(boost_value)
     elif boost_name.lower() == "multiplier":
-        current_user["blocks_per_click"] = float(boost_value)
-
-    current_user["blocks_balance"] = round(float(current_user["blocks_balance"]) - boost_price, 3)
-    await add_user_data_to_redis(current_user, balance_update=True)
-
-    if current_user.get("redis_tag", None):
-        del current_user["redis_tag"]
-
-    deserialized_data = restore_types_from_redis(current_user)
-    await UsersDAO.edit(int(current_user["id"]), **deserialized_data)
+        user_update["blocks_per_click"] = float(boost_value)
+
+    redis_client = await get_redis()
+    user_id = int(current_user["id"])
+    user_data_key = get_user_data_key(user_id)
+    current_time = datetime.now().timestamp()
+    price = to_milli_blocks(boost_price)
+    spend_args = [price, current_time, *[v for pair in user_update.items() for v in pair]]
+
+    result = await call_function(redis_client, "spend_balance", keys=[user_data_key], args=spend_args)
+    if result is None:
+        # данные пользователя успели удалиться из Redis, записываем их заново и повторяем
+        await add_user_data_to_redis(current_user)
+        result = await call_function(redis_client, "spend_balance", keys=[user_data_key], args=spend_args)
+    if result is None or not int(result[0]):
+        raise NotEnoughFundsException
+
+    _, new_balance, username, earned, old_value = result
+    try:
+        boost = await ImprovementsDAO.save_purchase(
+            boost_id,
+            boost_data,
+            {"blocks_balance": int(new_balance), "last_update_time": int(current_time), **user_update},
+            session=session
+        )
+    except Exception:
+        # покупка не сохранена, возвращаем цену и прежнее значение улучшения
+        refund_args = [price]
+        for field in user_update:
+            refund_args.extend((field, old_value))
+        refunded = await call_function(redis_client, "refund_balance", keys=[user_data_key], args=refund_args)
+        if refunded is not None:
+            # блоки автокликера, начисленные перед списанием, учитываются как добытые
+            await set_user_balance(refunded[1], refunded[0], redis_client, earned)
+        raise
+
+    await set_user_balance(username, new_balance, redis_client, earned)
+    if user_update.get("clicks_per_sec"):
+        await add_autoclicker_user(user_id, redis_client)
+    return boost
 
 
 async def get_boost_details(
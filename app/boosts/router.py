@@ -3,13 +3,15 @@ from typing import Optional
 from fastapi import APIRouter, Depends
 
 from app.redis_init import get_redis
+from app.database import get_session
 from app.boosts.dao import ImprovementsDAO
-from app.users.models import Users
-from app.users.dependencies import get_current_user
+from app.users.models import Users, UserRole
+from app.users.dependencies import get_current_user, get_current_user_fields
 from app.utils.boosts_init import get_boosts_registry
+from app.utils.data_processing_funcs import to_milli_blocks
 from app.boosts.processed_functions import (
     get_level_purchased_boost,
-    recalculate_user_data_in_dbs,
+    purchase_boost,
     get_boost_details
 )
 from app.exceptions import (
@@ -26,7 +28,7 @@ router = APIRouter(
 
 
 @router.get("")
-async def get_user_boosts(language: str = "en", current_user=Depends(get_current_user)) -> dict:
+async def get_user_boosts(language: str = "en", current_user=Depends(get_current_user_fields())) -> dict:
     """
     Возвращает информацию о всех улучшениях пользователя, включая приобретённые и доступные для покупки.
 
@@ -41,7 +43,7 @@ async def get_user_boosts(language: str = "en", current_user=Depends(get_current
                 - Для приобретённых улучшений включены текущие характеристики и уровень.
                 - Для доступных улучшений включены базовые характеристики.
     """
-    user_boosts = await ImprovementsDAO.find_by_user_id(int(current_user["id"]))
+    user_boosts = await ImprovementsDAO.find_by_user_id(current_user["id"])
     boosts_registry = await get_boosts_registry()
     user_boosts_names = []
     summary_data = {}
@@ -78,7 +80,11 @@ async def get_user_boosts(language: str = "en", current_user=Depends(get_current
 
 
 @router.get("/upgrade/{boost_name}")
-async def upgrade_boost(boost_name: str, current_user=Depends(get_current_user)) -> dict:
+async def upgrade_boost(
+        boost_name: str,
+        current_user=Depends(get_current_user),
+        session=Depends(get_session)
+) -> dict:
     """
     Покупка улучшения за игровую валюту (blocks).
     Повышает уровень улучшения для пользователя, если достаточно средств на балансе.
@@ -87,6 +93,7 @@ async def upgrade_boost(boost_name: str, current_user=Depends(get_current_user))
     Args:
         boost_name (str): Название улучшения, которое нужно приобрести или улучшить.
         current_user: Текущий пользователь.
+        session: Сессия базы данных запроса.
 
     Returns:
         dict: Словарь с данными о прокаченном улучшении, включающий:
@@ -107,35 +114,33 @@ async def upgrade_boost(boost_name: str, current_user=Depends(get_current_user))
     user_id = int(current_user["id"])
 
     # получить уровень и характеристики ПОКУПАЕМОГО улучшения для этого юзера
-    level_purchased_boost, boost_id = await get_level_purchased_boost(user_id, boost_name, boost)
+    level_purchased_boost, boost_id = await get_level_purchased_boost(user_id, boost_name, boost, session)
     boost_level_details = boost["levels"][f"{level_purchased_boost}"]
     boost_value = boost_level_details[1]
     boost_price = float(boost_level_details[0])
 
     # сравнить стоимость улучшения с текущим балансом юзера
-    if float(current_user["blocks_balance"]) >= boost_price:
-        boost_data = {
-            "user_id": user_id,
-            "name": boost_name,
-            "purchase_date": date.today(),
-            "level": level_purchased_boost,
-            "redis_key": boost_name
-        }
-        # добавить/изменить boost в базе
-        if not boost_id:
-            boost = await ImprovementsDAO.add(**boost_data)
-        else:
-            boost = await ImprovementsDAO.edit(boost_id, **boost_data)
-        # пересчитать в Redis blocks_balance, clicks_per_sec, blocks_per_click
-        await recalculate_user_data_in_dbs(current_user, boost_name, boost_price, boost_value)
-
-        boost_data = dict(boost)
-        keys_to_remove = ["id", "user_id", "purchase_date", "redis_key"]
-        [boost_data.pop(key, None) for key in keys_to_remove]
-        return boost_data
-    else:
+    if int(current_user["blocks_balance"]) < to_milli_blocks(boost_price):
         raise NotEnoughFundsException
 
+    boost_data = {
+        "user_id": user_id,
+        "name": boost_name,
+        "purchase_date": date.today(),
+        "level": level_purchased_boost,
+        "redis_key": boost_name
+    }
+    # списать цену, добавить/изменить boost в базе и пересчитать в Redis и базе
+    # blocks_balance, clicks_per_sec, blocks_per_click (баланс проверяется еще раз атомарно при списании)
+    boost = await purchase_boost(
+        current_user, boost_name, boost_price, boost_value, boost_id, boost_data, session
+    )
+
+    boost_data = dict(boost)
+    keys_to_remove = ["id", "user_id", "purchase_date", "redis_key"]
+    [boost_data.pop(key, None) for key in keys_to_remove]
+    return boost_data
+
 
 @router.get("/buy/{boost_name}")
 async def buy_boost(boost_name: str, user: Users = Depends(get_current_user), redis=Depends(get_redis)):
@@ -152,7 +157,7 @@ async def add_boost_for_user(
         level: int,
         redis_key: str,
         image_id: Optional[int] = None,
-        current_user=Depends(get_current_user)
+        current_user=Depends(get_current_user_fields("role"))
 ):
     """
     Добавляет новое улучшение для пользователя. Доступно только для администратора.
@@ -172,7 +177,7 @@ async def add_boost_for_user(
     Raises:
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     await ImprovementsDAO.add(
@@ -187,7 +192,7 @@ async def add_boost_for_user(
 
 
 @router.delete("/boost/{boost_id}")
-async def delete_user_boost(boost_id: int, current_user=Depends(get_current_user)):
+async def delete_user_boost(boost_id: int, current_user=Depends(get_current_user_fields("role"))):
     """
     Удаляет улучшение по его идентификатору. Доступно только для администратора.
 
@@ -202,7 +207,7 @@ async def delete_user_boost(boost_id: int, current_user=Depends(get_current_user
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
         ObjectNotFoundException: Если улучшение с указанным идентификатором не найдено.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     item = await ImprovementsDAO.find_one_or_none(id=boost_id)
@@ -0,0 +1,132 @@
+import asyncio
+from typing import Optional
+
+from app.config import settings
+from app.utils.logger_init import logger
+from app.users.dependencies import load_users_data
+from app.utils.users_init import apply_clicks_batch
+from app.clicks.ws_updates import get_websocket_updates
+from app.utils.mining_chance_init import get_mining_chance_singleton
+
+
+class ClicksBuffer:
+    """
+    Буфер кликов пользователей в памяти процесса (write-behind).
+
+    Клики пользователей суммируются в памяти и периодически применяются к данным в Redis
+    одним пакетом команд (см. `apply_clicks_batch`). В буфере хранится только количество кликов,
+    данные пользователей, которых нет в Redis, загружаются при сбросе буфера.
+
+    Attributes:
+        flush_interval (float): Период сброса буфера в Redis (в секундах).
+        max_users (int): Максимальное количество пользователей в буфере. При его достижении
+            запрос ожидает сброса буфера (backpressure).
+    """
+    def __init__(self, flush_interval_ms: int, max_users: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_users = max_users
+        self._users_clicks: dict[int, int] = {}
+        self._lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def add(self, user_id: int, clicks: int) -> None:
+        """
+        Добавляет клики пользователя в буфер.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            clicks (int): Количество кликов.
+        """
+        user_id = int(user_id)
+        while True:
+            async with self._lock:
+                if user_id in self._users_clicks or len(self._users_clicks) < self.max_users:
+                    self._users_clicks[user_id] = self._users_clicks.get(user_id, 0) + clicks
+                    return
+            # буфер заполнен, сбрасываем его не дожидаясь периодического сброса
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Применяет все накопленные клики к данным пользователей в Redis.
+
+        Новые балансы отправляются пользователям, подключенным к процессу по WebSocket.
+        """
+        async with self._flush_lock:
+            async with self._lock:
+                users_clicks, self._users_clicks = self._users_clicks, {}
+            if not users_clicks:
+                return
+
+            mining_chance = get_mining_chance_singleton().get_value()
+            sent_users = set()
+            try:
+                results = await apply_clicks_batch(users_clicks, mining_chance, sent_users)
+                missing_ids = [user_id for user_id, result in results.items() if result is None]
+                if missing_ids:
+                    # данных пользователей нет в Redis, загружаем их и применяем клики повторно
+                    loaded_ids = await load_users_data(missing_ids)
+                    if loaded_ids:
+                        results.update(await apply_clicks_batch(
+                            {user_id: users_clicks[user_id] for user_id in loaded_ids}, mining_chance, sent_users
+                        ))
+            except Exception:
+                # возвращаем в буфер только клики, не отправленные в Redis. Отправленные клики могли быть
+                # применены, поэтому они не повторяются, чтобы не начислить баланс дважды
+                async with self._lock:
+                    for user_id, clicks in users_clicks.items():
+                        if user_id in sent_users:
+                            continue
+                        self._users_clicks[user_id] = self._users_clicks.get(user_id, 0) + clicks
+                if sent_users:
+                    logger.warning(
+                        f"Clicks of {len(sent_users)} users were not requeued after a failed flush "
+                        f"and may have been lost."
+                    )
+                raise
+
+            websocket_updates = get_websocket_updates()
+            for user_id, result in results.items():
+                if result is not None:
+                    websocket_updates.send(user_id, {"blocks_balance": result[0]})
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.error(f"Ошибка при сбросе буфера кликов в Redis: {err}")
+
+    def start(self) -> None:
+        """Запускает периодический сброс буфера."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+            logger.info("Clicks buffer started.")
+
+    async def stop(self) -> None:
+        """Останавливает периодический сброс и сбрасывает оставшиеся в буфере клики."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        logger.info("Clicks buffer stopped.")
+
+
+clicks_buffer = None
+
+
+def get_clicks_buffer() -> ClicksBuffer:
+    # буфер создается при первом обращении, внутри работающего цикла событий
+    global clicks_buffer
+    if clicks_buffer is None:
+        clicks_buffer = ClicksBuffer(
+            flush_interval_ms=settings.CLICKS_BUFFER_FLUSH_MS,
+            max_users=settings.CLICKS_BUFFER_MAX_USERS
+        )
+    return clicks_buffer
@@ -1,16 +1,22 @@
+import asyncio
 from typing import Optional
+from datetime import datetime
 from json import JSONDecodeError
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request, Depends, WebSocket, WebSocketDisconnect, status
 
 from app.config import settings
 from app.redis_init import get_redis
 from app.utils.logger_init import logger
 from app.utils.rate_limiter import limiter
-from app.exceptions import ClicksDataException
-from app.users.dependencies import get_current_user
-from app.utils.users_init import add_user_data_to_redis
-from app.utils.users_init import calculate_items_won
+from app.exceptions import PoCException, ClicksDataException, TokenAbsentException, TokenExpiredException
+from app.clicks.clicks_buffer import get_clicks_buffer
+from app.clicks.stream_consumer import add_clicks_event_to_stream
+from app.clicks.ws_updates import get_websocket_updates
+from app.users.token_cache import is_token_revoked
+from app.users.dependencies import get_current_user_id, get_user_data, decode_access_token
+from app.utils.users_init import apply_clicks_to_user
 from app.utils.mining_chance_init import get_mining_chance_singleton
+from app.utils.data_processing_funcs import from_milli_blocks
 
 router = APIRouter(
     prefix="/clicks",
@@ -22,7 +28,7 @@ router = APIRouter(
 @limiter.limit(f"{int(60/settings.SEND_CLICKS_PERIOD)}/minute")  # Ограничение количества запросов с одного ip
 async def receive_clicks(
         request: Request,
-        current_user=Depends(get_current_user),
+        user_id: int = Depends(get_current_user_id),
         redis_client=Depends(get_redis)
 ) -> Optional[dict]:
     """
@@ -31,7 +37,7 @@ async def receive_clicks(
 
     Args:
         request (Request): Объект запроса, содержащий данные о кликах от фронтенда.
-        current_user: Текущий пользователь.
+        user_id (int): Идентификатор текущего пользователя.
         redis_client: Клиент Redis для взаимодействия с базой данных.
 
     Returns:
@@ -41,10 +47,15 @@ async def receive_clicks(
         ClicksDataException: Если данные о кликах не были переданы или они некорректны.
 
     Notes:
-        - В случае успешного получения количества кликов происходит обновление
-          баланса пользователя в Redis с учётом вероятности добычи.
+        - В случае успешного получения количества кликов происходит атомарное обновление
+          баланса пользователя в Redis с учётом вероятности добычи (см. `apply_clicks_to_user`).
         - Также рассчитывается количество выпавших игровых предметов, если они
           были получены, возвращается сообщение о выигрыше предметов.
+        - Если CLICKS_INGEST_MODE == "buffer", данные пользователя не загружаются, клики накапливаются
+          в буфере процесса и применяются пакетом, сообщение о выигрыше предметов не возвращается.
+        - Если CLICKS_INGEST_MODE == "stream", данные пользователя не загружаются, клики
+          записываются событием в Redis Stream и применяются обработчиками
+          из `app.clicks.stream_consumer`.
     """
     # получаем количество кликов с фронтенда (int)
     try:
@@ -59,17 +70,136 @@ async def receive_clicks(
         logger.error("JSONDecodeError while receiving clicks")
         return
 
+    result = await process_clicks(user_id, clicks, redis_client)
+    if result["items_won"]:
+        return {"detail": "you won rare items"}
+
+
+async def process_clicks(user_id: int, clicks: int, redis_client) -> dict:
+    """
+    Применяет клики пользователя в соответствии с режимом CLICKS_INGEST_MODE.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        clicks (int): Количество кликов.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        dict: Словарь, включающий:
+            - blocks_balance (float, None): Новый баланс пользователя или None, если клики
+              будут применены позже (режимы "buffer" и "stream").
+            - items_won (int): Количество выпавших игровых предметов.
+
+    Notes:
+        Клики применяются к актуальным данным пользователя в Redis. Если данных в Redis нет,
+        они загружаются заново (`get_user_data`), а не перезаписываются ранее загруженными,
+        чтобы не потерять уже примененные клики.
+    """
+    if settings.CLICKS_INGEST_MODE == "stream":
+        await add_clicks_event_to_stream(user_id, clicks, redis_client)
+        return {"blocks_balance": None, "items_won": 0}
+
+    if settings.CLICKS_INGEST_MODE == "buffer":
+        # клики будут применены при очередном сбросе буфера, данные пользователя при этом не загружаются
+        await get_clicks_buffer().add(user_id, clicks)
+        return {"blocks_balance": None, "items_won": 0}
+
     singleton = get_mining_chance_singleton()
     mining_chance = singleton.get_value()
 
-    # обновляем баланс пользователя, в зависимости от вероятности добычи блока
-    current_user["blocks_balance"] = round(
-        float(current_user["blocks_balance"]) + (clicks * float(current_user["blocks_per_click"]) * mining_chance),
-        3
-    )
-    await add_user_data_to_redis(current_user, balance_update=True)
+    # обновляем баланс пользователя, в зависимости от вероятности добычи блока,
+    # и подсчитываем выпали ли игровые предметы и сколько
+    result = await apply_clicks_to_user({"id": user_id}, clicks, mining_chance)
+    if result is None:
+        # данные пользователя успели удалиться из Redis, загружаем их заново и повторяем
+        await get_user_data(user_id)
+        result = await apply_clicks_to_user({"id": user_id}, clicks, mining_chance)
 
-    # подсчитываем выпали ли игровые предметы и сколько
-    count_won_items = await calculate_items_won(int(current_user["id"]), clicks, redis_client)
-    if count_won_items:
-        return {"detail": "you won rare items"}
+    new_balance, items_won = result if result is not None else (None, 0)
+    return {"blocks_balance": new_balance, "items_won": items_won}
+
+
+async def send_websocket_messages(websocket: WebSocket, queue) -> None:
+    """Отправляет клиенту сообщения из очереди соединения (см. `WebSocketUpdates`)."""
+    while True:
+        message = await queue.get()
+        await websocket.send_json(message)
+
+
+@router.websocket("/ws")
+async def clicks_websocket(websocket: WebSocket, redis_client=Depends(get_redis)) -> None:
+    """
+    Канал для отправки кликов и получения обновлений баланса по WebSocket.
+
+    Пользователь аутентифицируется один раз при подключении (по cookie с JWT-токеном),
+    получает сообщение {"blocks_balance": ..., "mining_chance": ...}, затем отправляет пакеты кликов
+    вида {"clicks": <int>} и получает в ответ {"blocks_balance": ...}. Кроме ответов сервер
+    сам отправляет сообщения {"mining_chance": ...} при изменении шанса добычи,
+    {"items_won": ...} при выпадении предметов и {"blocks_balance": ...} после применения кликов
+    из буфера (см. `app.clicks.ws_updates`).
+
+    Args:
+        websocket (WebSocket): Соединение с клиентом.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Notes:
+        - Количество кликов в пакете ограничивается 20 кликами в секунду
+          с момента получения предыдущего пакета.
+        - По истечении срока действия токена соединение закрывается.
+        - Данные пользователя, загруженные при подключении, используются только для первого
+          сообщения с балансом, клики применяются к актуальным данным в Redis.
+        - Все сообщения соединения отправляются из одной очереди, поэтому ответы на клики
+          и сообщения сервера не отправляются одновременно.
+    """
+    try:
+        token = websocket.cookies.get("poc_access_token")
+        if not token:
+            raise TokenAbsentException
+        payload = decode_access_token(token)
+        user_id = int(payload.get("sub"))
+        if await is_token_revoked(token, user_id, redis_client):
+            raise TokenExpiredException
+        current_user = await get_user_data(user_id)
+    except PoCException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    websocket_updates = get_websocket_updates()
+    queue = websocket_updates.connect(user_id)
+    sender = asyncio.create_task(send_websocket_messages(websocket, queue))
+    websocket_updates.put(queue, {
+        "blocks_balance": from_milli_blocks(current_user["blocks_balance"]),
+        "mining_chance": get_mining_chance_singleton().get_value()
+    })
+
+    last_batch_time = datetime.now().timestamp()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            current_time = datetime.now().timestamp()
+            if int(payload["exp"]) < current_time:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+            clicks = data.get("clicks") if isinstance(data, dict) else None
+            if not isinstance(clicks, int) or clicks < 0:
+                websocket_updates.put(queue, {"detail": ClicksDataException.detail})
+                continue
+
+            # не больше 20 кликов в секунду
+            max_clicks = int((current_time - last_batch_time) * 20)
+            clicks = min(clicks, max_clicks)
+            last_batch_time = current_time
+
+            # выпавшие предметы приходят отдельным сообщением сервера
+            result = await process_clicks(user_id, clicks, redis_client)
+            websocket_updates.put(queue, {"blocks_balance": result["blocks_balance"]})
+    except WebSocketDisconnect:
+        pass
+    except JSONDecodeError:
+        logger.error("JSONDecodeError while receiving clicks over websocket")
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+    finally:
+        websocket_updates.disconnect(user_id, queue)
+        sender.cancel()
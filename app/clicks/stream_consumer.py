@@ -0,0 +1,228 @@
+"""
+Обработчик событий кликов из Redis Stream.
+
+События кликов пользователя записываются в партицию stream по его идентификатору
+(у каждой партиции свой хеш-тег). Партицию в каждый момент обрабатывает один обработчик,
+взявший её аренду в Redis, поэтому события одного пользователя применяются по порядку.
+
+Запуск (можно запускать несколько процессов, каждый с уникальным именем):
+    python -m app.clicks.stream_consumer [consumer_name]
+"""
+import os
+import sys
+import socket
+import asyncio
+import redis.exceptions as r_exc
+
+from app.config import settings
+from app.redis_init import get_redis
+from app.utils.logger_init import logger
+from app.users.dependencies import load_users_data
+from app.utils.game_items_init import init_game_items
+from app.redis_helpers.updates_listener import get_updates_listener
+from app.utils.mining_chance_init import (
+    init_mining_chance,
+    start_mining_chance_updates,
+    get_mining_chance_singleton
+)
+from app.utils.users_init import apply_clicks_batch
+from app.utils.data_processing_funcs import acquire_lease, release_lease
+
+
+def get_clicks_stream_partition(user_id: int) -> int:
+    """Возвращает номер партиции stream событий кликов, в которую пишутся клики пользователя."""
+    return user_id % settings.CLICKS_STREAM_PARTITIONS
+
+
+def get_clicks_stream_key(partition: int) -> str:
+    """Возвращает ключ партиции stream событий кликов."""
+    return f"clicks_stream:{{cs{partition}}}"
+
+
+def get_clicks_stream_lease_key(partition: int) -> str:
+    """Возвращает ключ аренды партиции stream событий кликов (в том же слоте, что и партиция)."""
+    return f"clicks_stream_lease:{{cs{partition}}}"
+
+
+async def add_clicks_event_to_stream(user_id: int, clicks: int, redis_client) -> None:
+    """
+    Добавляет событие кликов пользователя в партицию Redis Stream.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        clicks (int): Количество кликов.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+    """
+    await redis_client.xadd(
+        get_clicks_stream_key(get_clicks_stream_partition(user_id)),
+        {"user_id": user_id, "clicks": clicks},
+        maxlen=settings.CLICKS_STREAM_MAXLEN // settings.CLICKS_STREAM_PARTITIONS,
+        approximate=True
+    )
+
+
+async def create_clicks_consumer_groups(redis_client) -> None:
+    """Создаёт группу обработчиков событий кликов (и сам stream) в каждой партиции, если её ещё нет."""
+    for partition in range(settings.CLICKS_STREAM_PARTITIONS):
+        try:
+            await redis_client.xgroup_create(
+                get_clicks_stream_key(partition),
+                settings.CLICKS_STREAM_GROUP,
+                id="0",
+                mkstream=True
+            )
+        except r_exc.ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+
+async def apply_clicks_events(events: list, redis_client) -> None:
+    """
+    Применяет пачку событий кликов одной партиции к данным пользователей в Redis.
+
+    Args:
+        events (list): Список событий вида (id, {"user_id": ..., "clicks": ...}) по возрастанию id.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Notes:
+        - Клики одного пользователя из разных событий суммируются.
+        - Вместе с кликами в данные пользователя записывается id последнего события (см. `apply_clicks_batch`).
+          События с id не больше записанного уже применены и пропускаются, поэтому повторная
+          обработка неподтвержденных событий после сбоя не начисляет баланс дважды.
+        - Данные пользователей, которых нет в Redis, загружаются из базы данных, и их клики применяются повторно.
+        - Баланс, таблица лидеров и выпавшие предметы обновляются через `apply_clicks_batch`.
+    """
+    users_clicks = {}
+    users_stream_ids = {}
+    for event_id, event in events:
+        if not event:
+            # событие было удалено из stream при обрезке
+            continue
+        user_id = int(event["user_id"])
+        users_clicks[user_id] = users_clicks.get(user_id, 0) + int(event["clicks"])
+        users_stream_ids[user_id] = event_id
+    if not users_clicks:
+        return
+
+    mining_chance = get_mining_chance_singleton().get_value()
+    results = await apply_clicks_batch(users_clicks, mining_chance, stream_ids=users_stream_ids)
+    missing_ids = [user_id for user_id, result in results.items() if result is None]
+    if missing_ids:
+        # данных пользователей нет в Redis, загружаем их и применяем клики повторно
+        loaded_ids = await load_users_data(missing_ids)
+        if loaded_ids:
+            await apply_clicks_batch(
+                {user_id: users_clicks[user_id] for user_id in loaded_ids},
+                mining_chance,
+                stream_ids=users_stream_ids
+            )
+
+
+async def process_clicks_events(stream_key: str, events: list, consumer_name: str, redis_client) -> None:
+    """Применяет события партиции и подтверждает их обработку в группе."""
+    if not events:
+        return
+    await apply_clicks_events(events, redis_client)
+    await redis_client.xack(
+        stream_key,
+        settings.CLICKS_STREAM_GROUP,
+        *[event_id for event_id, _ in events]
+    )
+    logger.debug(f"Consumer {consumer_name} applied {len(events)} clicks events from {stream_key}.")
+
+
+async def process_clicks_partition(partition: int, consumer_name: str, redis_client) -> int:
+    """
+    Обрабатывает события партиции, если удалось взять её аренду.
+
+    Args:
+        partition (int): Номер партиции.
+        consumer_name (str): Уникальное имя обработчика в группе (владелец аренды).
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        int: Количество обработанных событий (0, если партицию обрабатывает другой обработчик).
+
+    Notes:
+        Сначала по порядку повторно обрабатываются все неподтвержденные события партиции
+        (в том числе полученные упавшим обработчиком), они забираются через XAUTOCLAIM. Новые события
+        читаются только после них, поэтому события пользователя не применяются раньше предыдущих.
+    """
+    lease_key = get_clicks_stream_lease_key(partition)
+    if not await acquire_lease(lease_key, consumer_name, settings.CLICKS_STREAM_LEASE_MS, redis_client):
+        return 0
+
+    stream_key = get_clicks_stream_key(partition)
+    processed = 0
+    try:
+        start_id = "0-0"
+        while True:
+            start_id, claimed_events, _ = await redis_client.xautoclaim(
+                stream_key,
+                settings.CLICKS_STREAM_GROUP,
+                consumer_name,
+                min_idle_time=0,
+                start_id=start_id,
+                count=settings.CLICKS_STREAM_BATCH_SIZE
+            )
+            await process_clicks_events(stream_key, claimed_events, consumer_name, redis_client)
+            processed += len(claimed_events)
+            if start_id == "0-0":
+                break
+
+        response = await redis_client.xreadgroup(
+            settings.CLICKS_STREAM_GROUP,
+            consumer_name,
+            {stream_key: ">"},
+            count=settings.CLICKS_STREAM_BATCH_SIZE
+        )
+        events = response[0][1] if response else []
+        await process_clicks_events(stream_key, events, consumer_name, redis_client)
+        processed += len(events)
+    finally:
+        await release_lease(lease_key, consumer_name, redis_client)
+    return processed
+
+
+async def run_clicks_stream_consumer(consumer_name: str) -> None:
+    """
+    Бесконечно обрабатывает события кликов из партиций Redis Stream в составе группы обработчиков.
+
+    Args:
+        consumer_name (str): Уникальное имя обработчика в группе.
+
+    Notes:
+        - Обработчик по очереди берет аренду свободных партиций и обрабатывает их события
+          (см. `process_clicks_partition`). Если новых событий нет ни в одной партиции,
+          обработчик ждет CLICKS_STREAM_BLOCK_MS.
+        - При падении обработчика его аренда истекает через CLICKS_STREAM_LEASE_MS,
+          и неподтвержденные события партиции обрабатывает другой обработчик.
+        - Событие может быть обработано повторно (при падении между применением и подтверждением),
+          но его клики применяются один раз: данные пользователя хранят id последнего примененного события.
+          Исключение - данные пользователя без автокликера, удаленные из Redis по истечении
+          их времени хранения до повторной обработки.
+    """
+    redis_client = await get_redis()
+    await init_game_items()
+    await init_mining_chance()
+    start_mining_chance_updates()
+    get_updates_listener().start()
+    await create_clicks_consumer_groups(redis_client)
+    logger.info(f"Clicks stream consumer {consumer_name} started.")
+
+    while True:
+        processed = 0
+        for partition in range(settings.CLICKS_STREAM_PARTITIONS):
+            try:
+                processed += await process_clicks_partition(partition, consumer_name, redis_client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error(f"Ошибка обработки событий кликов партиции {partition} в {consumer_name}: {err}")
+        if not processed:
+            await asyncio.sleep(settings.CLICKS_STREAM_BLOCK_MS / 1000)
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else f"{socket.gethostname()}-{os.getpid()}"
+    asyncio.run(run_clicks_stream_consumer(name))
@@ -0,0 +1,93 @@
+"""
+Сообщения, которые сервер сам отправляет пользователям, подключенным по WebSocket (см. `/clicks/ws`).
+
+- {"mining_chance": ...} - новый шанс добычи, отправляется всем соединениям процесса при его изменении.
+- {"items_won": ...} - выпавшие пользователю предметы. Выпадения считает процесс, применивший клики
+  (или воркер Celery для автокликера), и публикует их в канал ITEMS_DROP_CHANNEL, поэтому сообщение
+  доставляется соединениям пользователя в любом процессе приложения.
+- {"blocks_balance": ...} - новый баланс после сброса буфера кликов процесса (CLICKS_INGEST_MODE == "buffer").
+"""
+import json
+import asyncio
+from typing import Optional
+
+from app.utils.items_drop import ITEMS_DROP_CHANNEL
+from app.redis_helpers.updates_listener import get_updates_listener
+from app.utils.mining_chance_init import add_mining_chance_handler
+
+
+class WebSocketUpdates:
+    """
+    Очереди сообщений WebSocket-соединений пользователей процесса.
+
+    Каждое соединение получает свою очередь, из которой сообщения отправляет одна задача
+    соединения, поэтому ответы на клики и сообщения сервера не отправляются одновременно.
+
+    Attributes:
+        queue_size (int): Максимальное количество неотправленных сообщений соединения. Если клиент
+            не успевает их получать, новые сообщения пропускаются.
+    """
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._users_queues: dict[int, set[asyncio.Queue]] = {}
+
+    def connect(self, user_id: int) -> asyncio.Queue:
+        """Создает очередь сообщений нового соединения пользователя."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._users_queues.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def disconnect(self, user_id: int, queue: asyncio.Queue) -> None:
+        """Удаляет очередь закрытого соединения пользователя."""
+        user_queues = self._users_queues.get(user_id)
+        if user_queues is None:
+            return
+        user_queues.discard(queue)
+        if not user_queues:
+            del self._users_queues[user_id]
+
+    def send(self, user_id: int, message: dict) -> None:
+        """Добавляет сообщение в очереди всех соединений пользователя."""
+        for queue in self._users_queues.get(user_id, ()):
+            self.put(queue, message)
+
+    def broadcast(self, message: dict) -> None:
+        """Добавляет сообщение в очереди всех соединений процесса."""
+        for user_queues in self._users_queues.values():
+            for queue in user_queues:
+                self.put(queue, message)
+
+    @staticmethod
+    def put(queue: asyncio.Queue, message: dict) -> None:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # клиент не успевает получать сообщения, сообщение пропускается
+            pass
+
+
+websocket_updates: Optional[WebSocketUpdates] = None
+
+
+def get_websocket_updates() -> WebSocketUpdates:
+    global websocket_updates
+    if websocket_updates is None:
+        websocket_updates = WebSocketUpdates()
+    return websocket_updates
+
+
+async def handle_items_drop_message(message: str) -> None:
+    """Отправляет соединениям пользователя сообщение о выпавших предметах из канала ITEMS_DROP_CHANNEL."""
+    data = json.loads(message)
+    get_websocket_updates().send(int(data["user_id"]), {"items_won": int(data["items_won"])})
+
+
+def handle_mining_chance_change(value: float) -> None:
+    """Отправляет новый шанс добычи всем соединениям процесса."""
+    get_websocket_updates().broadcast({"mining_chance": value})
+
+
+def start_websocket_updates() -> None:
+    """Подписывает процесс на события, отправляемые по WebSocket. Нужно вызывать до запуска слушателя обновлений."""
+    get_updates_listener().subscribe(ITEMS_DROP_CHANNEL, handle_items_drop_message)
+    add_mining_chance_handler(handle_mining_chance_change)
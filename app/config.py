@@ -13,15 +13,32 @@ class Settings(BaseSettings):
     DB_USER: str = "postgres"
     DB_PASS: str = "root"
     DB_NAME: str = "mydb"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STREAM_BATCH_SIZE: int = 1000
 
     BACKEND_DOMAIN: str = "http://127.0.0.1:8000"
     FRONTEND_DOMAIN: str = "http://127.0.0.1:3000"
     SEND_CLICKS_PERIOD: int = 3
+    CLICKS_INGEST_MODE: str = "direct"  # "direct" - сразу в Redis, "buffer" - буфер в памяти, "stream" - Redis Stream
+    CLICKS_BUFFER_FLUSH_MS: int = 200
+    CLICKS_BUFFER_MAX_USERS: int = 10000
+    CLICKS_STREAM_MAXLEN: int = 1000000
+    CLICKS_STREAM_PARTITIONS: int = 8
+    CLICKS_STREAM_GROUP: str = "clicks_appliers"
+    CLICKS_STREAM_BATCH_SIZE: int = 500
+    CLICKS_STREAM_BLOCK_MS: int = 1000
+    CLICKS_STREAM_LEASE_MS: int = 30000
 
     ENCRYPTION_KEY: str
     JWT_SECRET_KEY: str
     ALGORITHM: str = "HS256"
     JWT_TOKEN_DELAY_MINUTES: int = 30
+    JWT_CACHE_SIZE: int = 10000
     ORIGINS: list = ["http://127.0.0.1:8000", "http://127.0.0.1:3000"]
     SET_COOKIE_SECURE: bool = False  # Установите True, если используете HTTPS
 
@@ -45,7 +62,22 @@ class Settings(BaseSettings):
     REDIS_NODE_TAG_1: str = "{group1}"
     REDIS_NODE_TAG_2: str = "{group2}"
     REDIS_NODE_TAG_3: str = "{group3}"
+    REDIS_LEGACY_KEYS_MIGRATION: bool = True
+    USER_COLD_DATA_TTL: int = 3600
+    LEADERBOARD_SHARDS: int = 8
+    LEADERBOARD_SNAPSHOT_SIZE: int = 100
+    LEADERBOARD_SNAPSHOT_PERIOD: int = 10
+    LEADERBOARD_CACHE_SECONDS: int = 5
+    LEADERBOARD_PAGE_MAX_OFFSET: int = 10000
+    LEADERBOARD_EARNED_TTL: int = 691200
+    MINING_CHANCE_PERIOD: int = 3600
+    MINING_CHANCE_POLL_PERIOD: int = 30
     START_INIT_FUNCS: bool = True
+    AUTOCLICKER_RECALC_PERIOD: int = 60
+    AUTOCLICKER_PERSIST_PERIOD: int = 300
+    AUTOCLICKER_PARTITIONS: int = 16
+    AUTOCLICKER_LEASE_MS: int = 120000
+    AUTOCLICKER_ENGINE: str = "lua"  # "lua" - пересчет в Redis, "numpy" - пересчет на стороне приложения
     GAME_DATA_DIR: str = "app/game_data"
 
 
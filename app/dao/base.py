@@ -1,74 +1,139 @@
+from typing import AsyncIterator, Optional, Sequence
+
 from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import async_session_maker
+from app.config import settings
+from app.database import get_dao_session
 
 
 class BaseDAO:
     model = None
 
     @classmethod
-    async def find_all(cls, offset: int = 0, limit: int = None):
-        async with async_session_maker() as session:
-            query = select(cls.model.__table__.columns)
+    async def find_all(cls, after_id: int = None, limit: int = None, session: AsyncSession = None):
+        """
+        Возвращает записи, упорядоченные по первичному ключу.
+
+        Страница выбирается по ключу (`WHERE id > after_id ORDER BY id LIMIT limit`), а не через OFFSET,
+        поэтому ее стоимость не зависит от позиции в таблице. Следующую страницу нужно запрашивать
+        с `after_id`, равным id последней записи предыдущей страницы. Для обхода всех записей
+        используйте `stream_all`.
+        """
+        async with get_dao_session(session) as session:
+            query = select(cls.model.__table__.columns).order_by(cls.model.id)
+            if after_id is not None:
+                query = query.filter(cls.model.id > after_id)
             if limit is not None:
-                query = query.offset(offset).limit(limit)
+                query = query.limit(limit)
             result = await session.execute(query)
             return result.mappings().all()
 
     @classmethod
-    async def find_by_model_id(cls, model_id: int):
-        async with async_session_maker() as session:
+    def _select_columns(cls, columns: Optional[Sequence[str]] = None):
+        if columns is None:
+            return select(cls.model.__table__.columns)
+        # первичный ключ нужен для пагинации по ключу
+        names = ["id", *[name for name in columns if name != "id"]]
+        return select(*[cls.model.__table__.columns[name] for name in names])
+
+    @classmethod
+    async def stream_all(
+            cls,
+            *criteria,
+            batch_size: int = None,
+            columns: Optional[Sequence[str]] = None,
+            session: AsyncSession = None,
+            **filter_by
+    ) -> AsyncIterator[list]:
+        """
+        Возвращает все записи пакетами, упорядоченными по первичному ключу (пагинация по ключу).
+
+        Args:
+            *criteria: Условия фильтрации SQLAlchemy.
+            batch_size (int): Размер пакета, по умолчанию DB_STREAM_BATCH_SIZE.
+            columns (Sequence[str]): Загружаемые колонки (id загружается всегда), None - все колонки.
+            session (AsyncSession): Сессия базы данных, None - новая сессия на каждый пакет.
+            **filter_by: Условия фильтрации по равенству значений колонок.
+
+        Yields:
+            list: Записи (mappings) размером не более `batch_size`.
+
+        Notes:
+            Каждый пакет выбирается запросом `WHERE id > <последний id> ORDER BY id LIMIT <batch_size>`
+            по индексу первичного ключа, поэтому стоимость пакета не зависит от его позиции в таблице
+            (в отличие от OFFSET). Соединение не удерживается между пакетами.
+        """
+        batch_size = batch_size or settings.DB_STREAM_BATCH_SIZE
+        query = cls._select_columns(columns).filter(*criteria).filter_by(**filter_by)
+        query = query.order_by(cls.model.id).limit(batch_size)
+        last_id = None
+        while True:
+            batch_query = query if last_id is None else query.filter(cls.model.id > last_id)
+            async with get_dao_session(session) as batch_session:
+                result = await batch_session.execute(batch_query)
+                records = result.mappings().all()
+            if not records:
+                break
+            yield records
+            if len(records) < batch_size:
+                break
+            last_id = records[-1]["id"]
+
+    @classmethod
+    async def find_by_model_id(cls, model_id: int, session: AsyncSession = None):
+        async with get_dao_session(session) as session:
             query = select(cls.model.__table__.columns).filter_by(id=model_id)
             result = await session.execute(query)
             return result.mappings().first()
 
     @classmethod
-    async def find_by_user_id(cls, user_id: int):
-        async with async_session_maker() as session:
+    async def find_by_user_id(cls, user_id: int, session: AsyncSession = None):
+        async with get_dao_session(session) as session:
             query = select(cls.model.__table__.columns).filter_by(user_id=user_id)
             result = await session.execute(query)
             return result.mappings().all()
 
     @classmethod
-    async def find_by_key(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_by_key(cls, session: AsyncSession = None, **filter_by):
+        async with get_dao_session(session) as session:
             query = select(cls.model.__table__.columns).filter_by(**filter_by)
             result = await session.execute(query)
             return result.mappings().first()
 
     @classmethod
-    async def count_records_by_key(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def count_records_by_key(cls, session: AsyncSession = None, **filter_by):
+        async with get_dao_session(session) as session:
             query = select(func.count()).select_from(cls.model.__table__).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar()
 
     @classmethod
-    async def find_one_or_none(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_one_or_none(cls, session: AsyncSession = None, **filter_by):
+        async with get_dao_session(session) as session:
             query = select(cls.model.__table__.columns).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()  # return model id or null
 
     @classmethod
-    async def add(cls, **data):
-        async with async_session_maker() as session:
+    async def add(cls, session: AsyncSession = None, **data):
+        async with get_dao_session(session) as session:
             query = insert(cls.model).values(**data).returning(cls.model.__table__.columns)
             result = await session.execute(query)
             await session.commit()
             return result.mappings().first()
 
     @classmethod
-    async def edit(cls, model_id: int, **data):
-        async with async_session_maker() as session:
+    async def edit(cls, model_id: int, session: AsyncSession = None, **data):
+        async with get_dao_session(session) as session:
             query = update(cls.model).where(cls.model.id == model_id).values(**data).returning(cls.model.__table__.columns)
             result = await session.execute(query)
             await session.commit()
             return result.mappings().first()
 
     @classmethod
-    async def delete(cls, user_id: int):
-        async with async_session_maker() as session:
+    async def delete(cls, user_id: int, session: AsyncSession = None):
+        async with get_dao_session(session) as session:
             query = delete(cls.model).where(cls.model.id == user_id)
             await session.execute(query)
             await session.commit()
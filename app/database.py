@@ -1,3 +1,6 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.pool import NullPool
@@ -13,13 +16,82 @@ DB_NAME = settings.DB_NAME
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
-# NullPool - отключает объединение в пул.
-# Не позволяет Engine использовать какое-либо соединение более одного раза
-# В случае асинхронного кода, каждая задача будет использовать свою уникальную сессию
-# https://docs.sqlalchemy.org/en/20/core/pooling.html#pool-disconnects
+
+def get_engine_options() -> dict:
+    """
+    Возвращает параметры движка SQLAlchemy из настроек приложения.
+
+    Notes:
+        - Если DB_POOL_SIZE == 0, пул соединений отключается (NullPool): каждая сессия открывает
+          новое соединение. Это нужно, например, при подключении через pgbouncer в режиме transaction.
+        - Подготовленные выражения кешируются для каждого соединения пула (кеш asyncpg и кеш
+          диалекта SQLAlchemy), поэтому повторные запросы DAO не разбираются сервером заново.
+          При DB_STATEMENT_CACHE_SIZE == 0 кеши отключены (тоже требуется для pgbouncer).
+    """
+    options = {
+        "connect_args": {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+    if settings.DB_POOL_SIZE <= 0:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    return options
+
+
+engine = create_async_engine(DATABASE_URL, **get_engine_options())
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """
+    Зависимость FastAPI: одна сессия (и одно соединение из пула) на весь запрос.
+
+    Сессию можно передать в методы DAO (аргумент `session`), чтобы несколько запросов
+    к базе данных в одном обработчике не занимали соединение пула каждый раз заново.
+    """
+    async with async_session_maker() as session:
+        yield session
+
+
+@asynccontextmanager
+async def get_dao_session(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    """Возвращает переданную сессию запроса или открывает новую сессию на время вызова DAO."""
+    if session is not None:
+        yield session
+        return
+    async with async_session_maker() as new_session:
+        yield new_session
+
+
+def get_pool_stats() -> dict:
+    """
+    Возвращает состояние пула соединений с базой данных.
+
+    Returns:
+        dict: Размер пула, количество свободных и занятых соединений, количество соединений
+            сверх размера пула и текстовое описание состояния от SQLAlchemy.
+    """
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return {"pool": "NullPool"}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "status": pool.status(),
+    }
+
+
 class Base(DeclarativeBase):
     pass
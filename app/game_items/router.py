@@ -4,7 +4,8 @@ from datetime import date
 
 from app.game_items.dao import GameItemsDAO
 from app.game_items.schemas import SGameItem
-from app.users.dependencies import get_current_user
+from app.users.models import UserRole
+from app.users.dependencies import get_current_user_fields
 from app.exceptions import AccessDeniedException, ObjectNotFoundException
 
 router = APIRouter(
@@ -14,7 +15,7 @@ router = APIRouter(
 
 
 @router.get("")
-async def get_user_items(current_user=Depends(get_current_user)) -> list[SGameItem]:
+async def get_user_items(current_user=Depends(get_current_user_fields())) -> list[SGameItem]:
     """
     Возвращает список игровых предметов пользователя.
 
@@ -24,7 +25,7 @@ async def get_user_items(current_user=Depends(get_current_user)) -> list[SGameIt
     Returns:
         list[SGameItem]: Список игровых предметов, принадлежащих текущему пользователю.
     """
-    return await GameItemsDAO.find_by_user_id(int(current_user["id"]))
+    return await GameItemsDAO.find_by_user_id(current_user["id"])
 
 
 @router.get("/add_item")
@@ -34,7 +35,7 @@ async def add_item(
         date_at_mine: date,
         redis_key: str,
         image_id: Optional[int] = None,
-        current_user=Depends(get_current_user)
+        current_user=Depends(get_current_user_fields("role"))
 ):
     """
     Добавляет новый игровой предмет для пользователя. Доступно только для администратора.
@@ -53,7 +54,7 @@ async def add_item(
     Raises:
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     await GameItemsDAO.add(
@@ -67,7 +68,7 @@ async def add_item(
 
 
 @router.delete("/{item_id}")
-async def delete_item(item_id: int, current_user=Depends(get_current_user)):
+async def delete_item(item_id: int, current_user=Depends(get_current_user_fields("role"))):
     """
     Удаляет игровой предмет по его идентификатору. Доступно только для администратора.
 
@@ -82,7 +83,7 @@ async def delete_item(item_id: int, current_user=Depends(get_current_user)):
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
         ObjectNotFoundException: Если предмет с указанным идентификатором не найден.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     item = await GameItemsDAO.find_one_or_none(id=item_id)
@@ -1,13 +1,14 @@
 import logging
 from fastapi import APIRouter, UploadFile, File, Depends
 
-from app.config import settings
 from app.redis_init import get_redis
+from app.database import get_pool_stats
 from app.utils.logger_init import logger
-from app.users.dependencies import get_current_user
-from app.redis_helpers.lua_scripts import total_sum_script
+from app.users.models import UserRole
+from app.users.dependencies import get_current_user_fields
+from app.utils.leaderboard import get_total_balance
 from app.general_app_data.schemas import SBoostsFile, SGameItemsFile
-from app.utils.data_processing_funcs import save_json_file, validate_json_file
+from app.utils.data_processing_funcs import save_json_file, validate_json_file, from_milli_blocks
 from app.utils.mining_chance_init import get_mining_chance_singleton
 from app.exceptions import (
     ValueException,
@@ -53,20 +54,32 @@ async def get_total_blocks_generated(redis_client=Depends(get_redis)) -> float:
          float: Количество блоков.
     """
     try:
-        script = redis_client.register_script(total_sum_script)
-        total_sum = await script(keys=[f"users_balances:{settings.REDIS_NODE_TAG_3}"])
-        return total_sum
+        total_sum = await get_total_balance(redis_client)
+        return from_milli_blocks(total_sum)
     except Exception as err:
         logger.error(f"Ошибка получения количества сгенерированных блоков: {err}")
         raise InternalServerError
 
 
+@router.get("/db-pool")
+async def get_db_pool_stats(current_user=Depends(get_current_user_fields("role"))) -> dict:
+    """
+    Возвращает состояние пула соединений с базой данных (только для администратора).
+
+    Returns:
+        dict: Размер пула, количество свободных и занятых соединений и соединений сверх размера пула.
+    """
+    if current_user["role"] != UserRole.admin:
+        raise AccessDeniedException
+    return get_pool_stats()
+
+
 @router.post("/upload-boosts-json")
-async def upload_boosts_json(file: UploadFile = File(...), current_user=Depends(get_current_user)):
+async def upload_boosts_json(file: UploadFile = File(...), current_user=Depends(get_current_user_fields("role"))):
     """
     Загружает и проверяет JSON-файл с данными о бустах.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     try:
@@ -79,11 +92,11 @@ async def upload_boosts_json(file: UploadFile = File(...), current_user=Depends(
 
 
 @router.post("/upload-items-json")
-async def upload_items_json(file: UploadFile = File(...), current_user=Depends(get_current_user)):
+async def upload_items_json(file: UploadFile = File(...), current_user=Depends(get_current_user_fields("role"))):
     """
     Загружает и проверяет JSON-файл с данными об игровых предметах.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     try:
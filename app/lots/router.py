@@ -4,7 +4,8 @@ from datetime import date
 
 from app.lots.dao import LotsDAO
 from app.lots.schemas import SLots
-from app.users.dependencies import get_current_user
+from app.users.models import UserRole
+from app.users.dependencies import get_current_user_fields
 from app.exceptions import AccessDeniedException, ObjectNotFoundException
 
 router = APIRouter(
@@ -14,7 +15,7 @@ router = APIRouter(
 
 
 @router.get("")
-async def get_user_lots(current_user=Depends(get_current_user)) -> list[SLots]:
+async def get_user_lots(current_user=Depends(get_current_user_fields())) -> list[SLots]:
     """
     Возвращает список лотов на продажу игровых предметов текущего пользователя.
 
@@ -24,7 +25,7 @@ async def get_user_lots(current_user=Depends(get_current_user)) -> list[SLots]:
     Returns:
         list[SLots]: Список лотов.
     """
-    return await LotsDAO.find_by_user_id(int(current_user["id"]))
+    return await LotsDAO.find_by_user_id(current_user["id"])
 
 
 @router.get("/add_lot")
@@ -36,7 +37,7 @@ async def add_lot(
         start_price: float,
         best_price: Optional[float],
         best_price_user_id: Optional[int],
-        current_user=Depends(get_current_user)
+        current_user=Depends(get_current_user_fields("role"))
 ):
     """
     Добавляет новый лот для пользователя. Доступно только для администратора.
@@ -57,7 +58,7 @@ async def add_lot(
     Raises:
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     await LotsDAO.add(
@@ -73,7 +74,7 @@ async def add_lot(
 
 
 @router.delete("/{lot_id}")
-async def delete_lot(lot_id: int, current_user=Depends(get_current_user)):
+async def delete_lot(lot_id: int, current_user=Depends(get_current_user_fields("role"))):
     """
     Удаляет лот по его идентификатору. Доступно только для администратора.
 
@@ -88,7 +89,7 @@ async def delete_lot(lot_id: int, current_user=Depends(get_current_user)):
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
         ObjectNotFoundException: Если лот с указанным идентификатором не найден.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     item = await LotsDAO.find_one_or_none(id=lot_id)
@@ -7,17 +7,25 @@ from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.redis_init import init_redis_cluster
+from app.redis_helpers.functions import load_functions_library
 from app.utils.logger_init import logger
 from app.utils.rate_limiter import limiter
+from app.clicks.clicks_buffer import get_clicks_buffer
+from app.clicks.ws_updates import start_websocket_updates
 from app.utils.boosts_init import init_game_boosts
-from app.utils.mining_chance_init import set_mining_chance
+from app.redis_helpers.updates_listener import get_updates_listener
+from app.utils.mining_chance_init import init_mining_chance, start_mining_chance_updates
+from app.utils.leaderboard_snapshot import (
+    load_leaderboard_snapshot,
+    publish_leaderboard_snapshot,
+    start_leaderboard_snapshot_updates
+)
 
 from app.utils.game_items_init import (
     init_game_items,
     set_items_quantity_in_redis
 )
 from app.utils.users_init import (
-    add_top_100_users_to_redis,
     add_all_users_balances_to_redis,
     add_users_with_autoclicker_to_redis
 )
@@ -36,6 +44,7 @@ async def lifespan(app: FastAPI):
     logger.info("The application is launched...")
     global redis_client
     redis_client = await init_redis_cluster()
+    await load_functions_library(redis_client)
     await init_game_items()
     await init_game_boosts()
     set_modified_date()
@@ -43,13 +52,23 @@ async def lifespan(app: FastAPI):
     if settings.START_INIT_FUNCS:
         await set_items_quantity_in_redis()
         await add_all_users_balances_to_redis()
-        await add_top_100_users_to_redis()
         await add_users_with_autoclicker_to_redis()
 
-    await set_mining_chance()
+    await init_mining_chance()
+    start_mining_chance_updates()
+    if not await load_leaderboard_snapshot():
+        await publish_leaderboard_snapshot()
+    start_leaderboard_snapshot_updates()
+    start_websocket_updates()
+    get_updates_listener().start()
     FastAPICache.init(RedisBackend(redis_client), prefix="cache")
+    if settings.CLICKS_INGEST_MODE == "buffer":
+        get_clicks_buffer().start()
     logger.info("The application has been launched.")
     yield
+    if settings.CLICKS_INGEST_MODE == "buffer":
+        await get_clicks_buffer().stop()
+    await get_updates_listener().stop()
     logger.info("Service exited")
 
 app = FastAPI(
@@ -0,0 +1,41 @@
+"""blocks balance in milli blocks.
+
+Revision ID: 8c3e6f1a2d47
+Revises: 2b91caa7612a
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3e6f1a2d47'
+down_revision: Union[str, None] = '2b91caa7612a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # баланс хранится целым числом тысячных долей блока (милли-блоков)
+    op.alter_column(
+        'users',
+        'blocks_balance',
+        existing_type=sa.Float(),
+        type_=sa.BigInteger(),
+        existing_nullable=True,
+        postgresql_using="ROUND(blocks_balance * 1000)::bigint"
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'users',
+        'blocks_balance',
+        existing_type=sa.BigInteger(),
+        type_=sa.Float(),
+        existing_nullable=True,
+        postgresql_using="blocks_balance / 1000.0"
+    )
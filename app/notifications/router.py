@@ -3,7 +3,8 @@ from datetime import date
 
 from app.notifications.dao import NotificationsDAO
 from app.notifications.schemas import SNotifications
-from app.users.dependencies import get_current_user
+from app.users.models import UserRole
+from app.users.dependencies import get_current_user_fields
 from app.exceptions import AccessDeniedException, ObjectNotFoundException
 
 router = APIRouter(
@@ -13,7 +14,7 @@ router = APIRouter(
 
 
 @router.get("")
-async def get_user_notifications(current_user=Depends(get_current_user)) -> list[SNotifications]:
+async def get_user_notifications(current_user=Depends(get_current_user_fields())) -> list[SNotifications]:
     """
     Возвращает список уведомлений пользователя.
 
@@ -23,7 +24,7 @@ async def get_user_notifications(current_user=Depends(get_current_user)) -> list
     Returns:
         list[SNotifications]: Список уведомлений, принадлежащих текущему пользователю.
     """
-    return await NotificationsDAO.find_by_user_id(int(current_user["id"]))
+    return await NotificationsDAO.find_by_user_id(current_user["id"])
 
 
 @router.get("/add_notification")
@@ -31,7 +32,7 @@ async def add_notification(
         user_id: int,
         text: str,
         send_date: date,
-        current_user=Depends(get_current_user)
+        current_user=Depends(get_current_user_fields("role"))
 ):
     """
     Добавляет новое уведомление для пользователя. Доступно только для администратора.
@@ -48,7 +49,7 @@ async def add_notification(
     Raises:
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     await NotificationsDAO.add(
@@ -60,7 +61,7 @@ async def add_notification(
 
 
 @router.delete("/{notification_id}")
-async def delete_notification(notification_id: int, current_user=Depends(get_current_user)):
+async def delete_notification(notification_id: int, current_user=Depends(get_current_user_fields("role"))):
     """
     Удаляет уведомление по его идентификатору. Доступно только для администратора.
 
@@ -75,7 +76,7 @@ async def delete_notification(notification_id: int, current_user=Depends(get_cur
         AccessDeniedException: Если текущий пользователь не имеет прав администратора.
         ObjectNotFoundException: Если уведомление с указанным идентификатором не найдено.
     """
-    if current_user["role"] != "admin":
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     item = await NotificationsDAO.find_one_or_none(id=notification_id)
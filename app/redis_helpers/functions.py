@@ -0,0 +1,198 @@
+"""
+Библиотека функций Redis (FUNCTION LOAD), собранная из lua-скриптов `lua_scripts.py`.
+
+Библиотека загружается на все primary-ноды кластера при запуске приложения, функции
+вызываются по имени командой FCALL. Имя библиотеки и функций содержит версию, поэтому
+во время обновления старые и новые процессы приложения вызывают каждый свою версию функций.
+При изменении любого lua-скрипта нужно увеличить LIBRARY_VERSION.
+
+Клиент redis-py 4.6 разбирает ключи команды локально только для EVAL/EVALSHA, а для FCALL
+запрашивает их у ноды (COMMAND GETKEYS) перед каждым вызовом. Поэтому нода для вызова
+определяется по слоту первого ключа на стороне приложения (см. `get_function_target`).
+"""
+import hashlib
+import redis.exceptions as r_exc
+
+from app.utils.logger_init import logger
+from app.redis_helpers.lua_scripts import (
+    reconcile_total_script,
+    top_users_script,
+    top_earned_users_script,
+    set_users_balances_script,
+    add_user_data_script,
+    recalculate_user_data_script,
+    apply_clicks_script,
+    set_drop_skips_script,
+    release_lease_script,
+    set_accrued_balance_script,
+    spend_balance_script,
+    refund_balance_script
+)
+
+LIBRARY_VERSION = 12
+LIBRARY_NAME = f"poc_v{LIBRARY_VERSION}"
+
+LIBRARY_FUNCTIONS = {
+    "reconcile_total": reconcile_total_script,
+    "top_users": top_users_script,
+    "top_earned_users": top_earned_users_script,
+    "set_users_balances": set_users_balances_script,
+    "add_user_data": add_user_data_script,
+    "recalculate_user_data": recalculate_user_data_script,
+    "apply_clicks": apply_clicks_script,
+    "set_drop_skips": set_drop_skips_script,
+    "release_lease": release_lease_script,
+    "set_accrued_balance": set_accrued_balance_script,
+    "spend_balance": spend_balance_script,
+    "refund_balance": refund_balance_script,
+}
+
+
+def get_function_name(name: str) -> str:
+    """Возвращает имя функции в Redis с учетом версии библиотеки."""
+    return f"{LIBRARY_NAME}_{name}"
+
+
+def build_library_code() -> str:
+    """
+    Собирает исходный код библиотеки функций Redis.
+
+    Тело каждого скрипта оборачивается в функцию с аргументами KEYS и ARGV, поэтому
+    скрипты не нужно переписывать. Дополнительно регистрируется функция "checksum",
+    возвращающая контрольную сумму скриптов, для проверки версии при запуске.
+    """
+    checksum = get_library_checksum()
+    lines = [f"#!lua name={LIBRARY_NAME}"]
+    for name, script in LIBRARY_FUNCTIONS.items():
+        lines.append(
+            f"redis.register_function('{get_function_name(name)}', function(KEYS, ARGV)\n{script}\nend)"
+        )
+    lines.append(
+        f"redis.register_function('{get_function_name('checksum')}', function(KEYS, ARGV)\n"
+        f"return '{checksum}'\nend)"
+    )
+    return "\n".join(lines)
+
+
+def get_library_checksum() -> str:
+    """Возвращает контрольную сумму lua-скриптов библиотеки."""
+    sources = "".join(f"{name}:{script}" for name, script in LIBRARY_FUNCTIONS.items())
+    return hashlib.sha1(sources.encode("utf-8")).hexdigest()
+
+
+def is_function_not_found(err: Exception) -> bool:
+    """Проверяет, что ошибка Redis вызвана отсутствием функции на ноде (например, после failover)."""
+    return isinstance(err, r_exc.ResponseError) and "function not found" in str(err).lower()
+
+
+async def load_functions_library(redis_client) -> None:
+    """
+    Проверяет версию библиотеки функций на каждой primary-ноде кластера и загружает её при необходимости.
+
+    Args:
+        redis_client: Клиент Redis Cluster.
+
+    Notes:
+        Если библиотека с текущей версией уже загружена, но её контрольная сумма отличается
+        (скрипты изменили без увеличения LIBRARY_VERSION), библиотека перезаписывается
+        и в лог пишется предупреждение.
+    """
+    code = build_library_code()
+    checksum = get_library_checksum()
+    for node in redis_client.get_primaries():
+        try:
+            node_checksum = await redis_client.execute_command(
+                "FCALL", get_function_name("checksum"), 0, target_nodes=node
+            )
+        except r_exc.ResponseError as err:
+            if not is_function_not_found(err):
+                raise
+            node_checksum = None
+
+        if node_checksum == checksum:
+            continue
+        if node_checksum is not None:
+            logger.warning(
+                f"Redis functions library {LIBRARY_NAME} on {node.name} differs from the application code, "
+                f"LIBRARY_VERSION should be increased."
+            )
+        await redis_client.execute_command("FUNCTION LOAD", "REPLACE", code, target_nodes=node)
+        logger.info(f"Redis functions library {LIBRARY_NAME} loaded on {node.name}.")
+
+
+def get_function_target(redis_client, keys: list) -> dict:
+    """
+    Возвращает аргументы маршрутизации вызова функции на primary-ноду слота первого ключа.
+
+    Все ключи вызова должны находиться в одном слоте (иметь общий hash tag).
+    Для вызова без ключей нода выбирается клиентом.
+    """
+    if not keys:
+        return {}
+    return {"target_nodes": redis_client.get_node_from_key(keys[0])}
+
+
+async def call_function(redis_client, name: str, keys: list = None, args: list = None):
+    """
+    Вызывает функцию библиотеки по имени.
+
+    Args:
+        redis_client: Клиент Redis Cluster.
+        name (str): Имя функции без версии (ключ LIBRARY_FUNCTIONS).
+        keys (list, optional): Ключи Redis, передаваемые функции.
+        args (list, optional): Аргументы функции.
+
+    Returns:
+        Результат выполнения функции.
+
+    Notes:
+        Если функции нет на ноде (нода перезапустилась без данных или произошел failover),
+        библиотека загружается заново и вызов повторяется один раз.
+    """
+    keys = keys or []
+    args = args or []
+    command = ["FCALL", get_function_name(name), len(keys), *keys, *args]
+    try:
+        return await redis_client.execute_command(*command, **get_function_target(redis_client, keys))
+    except r_exc.ResponseError as err:
+        if not is_function_not_found(err):
+            raise
+        await load_functions_library(redis_client)
+        return await redis_client.execute_command(*command, **get_function_target(redis_client, keys))
+
+
+async def call_functions_pipeline(redis_client, calls: list[tuple[str, list, list]]) -> list:
+    """
+    Вызывает функции библиотеки одним пайплайном.
+
+    Args:
+        redis_client: Клиент Redis Cluster.
+        calls (list[tuple[str, list, list]]): Список вызовов вида (имя функции, ключи, аргументы).
+
+    Returns:
+        list: Результаты вызовов в том же порядке.
+
+    Notes:
+        Вызовы, завершившиеся ошибкой из-за отсутствия функции на ноде, повторяются по одному
+        после перезагрузки библиотеки. Остальные вызовы не повторяются, чтобы не применить их дважды.
+    """
+    async with redis_client.pipeline() as pipe:
+        for name, keys, args in calls:
+            await pipe.execute_command(
+                "FCALL", get_function_name(name), len(keys), *keys, *args,
+                **get_function_target(redis_client, keys)
+            )
+        results = await pipe.execute(raise_on_error=False)
+
+    failed = [i for i, result in enumerate(results) if is_function_not_found(result)]
+    if failed:
+        await load_functions_library(redis_client)
+        for i in failed:
+            name, keys, args = calls[i]
+            results[i] = await call_function(redis_client, name, keys, args)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
@@ -1,12 +1,15 @@
-# Lua-скрипт для подсчета суммы балансов всех пользователей (сгенерированных блоков)
-total_sum_script = f"""
+# Lua-скрипт для сверки суммы балансов пользователей шарда таблицы лидеров (KEYS[1])
+# с поддерживаемым счетчиком этой суммы (KEYS[2]). Балансы - целые числа милли-блоков.
+# Счетчик перезаписывается точной суммой, возвращается пара (значение счетчика до сверки, точная сумма).
+reconcile_total_script = """
 local sum = 0
-local zset_key = KEYS[1]
-local items = redis.call('ZRANGE', zset_key, 0, -1, 'WITHSCORES')
+local items = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
 for i = 2, #items, 2 do
     sum = sum + tonumber(items[i])
 end
-return sum
+local total = tonumber(redis.call('GET', KEYS[2])) or 0
+redis.call('SET', KEYS[2], string.format('%d', sum))
+return {string.format('%d', total), string.format('%d', sum)}
 """
 # Lua-скрипт для получения топ N пользователей по размеру баланса
 top_users_script = """
@@ -24,13 +27,68 @@ end
 
 return result
 """
-# Lua-скрипт для добавления баланса пользователя
-add_user_balance_script = """
+# Lua-скрипт для получения топ N пользователей шарда по блокам, добытым за несколько дней.
+# KEYS[1] - ключ объединения ZSET за дни, KEYS[2] - ключ-отметка построения объединения,
+# KEYS[3..] - ZSET добытых блоков шарда за каждый день. ARGV[1] - время хранения объединения, ARGV[2] - N.
+# Объединение строится заново, только если ключа-отметки нет. Отметка нужна, потому что ZUNIONSTORE
+# пустых ZSET не создает ключ объединения, и его отсутствие не означает, что объединение не построено.
+# Возвращает плоский список (имя пользователя, добыто милли-блоков) по убыванию.
+top_earned_users_script = """
+local union_key = KEYS[1]
+local built_key = KEYS[2]
+local ttl = tonumber(ARGV[1])
+local top_n = tonumber(ARGV[2])
+
+if redis.call('EXISTS', built_key) == 0 then
+    redis.call('ZUNIONSTORE', union_key, #KEYS - 2, unpack(KEYS, 3))
+    redis.call('EXPIRE', union_key, ttl)
+    redis.call('SET', built_key, '1', 'EX', ttl)
+end
+
+return redis.call('ZREVRANGE', union_key, 0, top_n - 1, 'WITHSCORES')
+"""
+# Lua-скрипт для записи балансов пользователей в шард таблицы лидеров (KEYS[1]).
+# ARGV[2..] - тройки (имя пользователя, баланс в милли-блоках, добыто милли-блоков). Вместе с балансами
+# на разницу между новым и старым балансом изменяется счетчик суммы балансов шарда (KEYS[2]) командой INCRBY.
+# Если счетчика нет (удален или истек), он записывается точной суммой балансов шарда после изменения,
+# иначе INCRBY создал бы счетчик, равный только разнице.
+# Если передан KEYS[3] (ZSET добытых за день блоков шарда), добытые пользователем блоки (ровно то,
+# что начислено его балансу) добавляются в него, а время жизни ключа устанавливается в ARGV[1] секунд.
+set_users_balances_script = """
 local balances_key = KEYS[1]
-local username = ARGV[1]
-local balance = tonumber(ARGV[2])
+local total_key = KEYS[2]
+local earned_key = KEYS[3]
+local earned_ttl = tonumber(ARGV[1])
+local delta = 0
+local tracked = false
+local total_exists = redis.call('EXISTS', total_key) == 1
+
+for i = 2, #ARGV, 3 do
+    local balance = tonumber(ARGV[i + 1]) or 0
+    local earned = tonumber(ARGV[i + 2]) or 0
+    local old_balance = tonumber(redis.call('ZSCORE', balances_key, ARGV[i])) or 0
+    redis.call('ZADD', balances_key, balance, ARGV[i])
+    delta = delta + balance - old_balance
+
+    if earned_key and earned > 0 then
+        redis.call('ZINCRBY', earned_key, string.format('%d', earned), ARGV[i])
+        tracked = true
+    end
+end
 
-redis.call("ZADD", balances_key, balance, username)
+if not total_exists then
+    local sum = 0
+    local items = redis.call('ZRANGE', balances_key, 0, -1, 'WITHSCORES')
+    for i = 2, #items, 2 do
+        sum = sum + tonumber(items[i])
+    end
+    redis.call('SET', total_key, string.format('%d', sum))
+elseif delta ~= 0 then
+    redis.call('INCRBY', total_key, string.format('%d', delta))
+end
+if tracked then
+    redis.call('EXPIRE', earned_key, earned_ttl)
+end
 """
 # Lua-скрипт для добавления данных пользователя
 add_user_data_script = """
@@ -42,56 +100,244 @@ redis.call("HMSET", key, unpack(user_data))
 
 if ttl > 0 then
     redis.call("EXPIRE", key, ttl)
+else
+    redis.call("PERSIST", key)
 end
 """
-# Lua-скрипт для пересчета баланса пользователей в зависимости от значения автокликера,
-# умножителя и времени с последнего обновления.
+# Lua-скрипт для пересчета баланса пользователя в зависимости от значения автокликера,
+# умножителя и времени с последнего обновления. Баланс хранится целым числом милли-блоков
+# и увеличивается командой HINCRBY.
+# KEYS[1] - ключ данных пользователя, ARGV[1] - время пересчета.
+# Возвращает имя пользователя, новый баланс, количество кликов автокликера и начисленные милли-блоки
+# или nil, если данных пользователя нет в Redis.
 recalculate_user_data_script = """
-local users_keys = cjson.decode(ARGV[1])
-local current_time = tonumber(ARGV[2])
-local balances_key = ARGV[3]
-local user_clicks = {}
-
--- Обрабатываем каждый ключ
-for _, key in ipairs(users_keys) do
-    local user_data = redis.call('HGETALL', key)
-
-    -- Логика обработки данных
-    local balance = 0
-    local clicks_per_sec = 0
-    local blocks_per_click = 0
-    local last_update_time = 0
-    local username = nil
-
-    -- Проходим по элементам user_data (список ключ-значение)
-    for i = 1, #user_data, 2 do
-        local field = user_data[i]
-        local value = user_data[i + 1]
-
-        if field == "blocks_balance" then
-            balance = tonumber(value) or 0
-        elseif field == "clicks_per_sec" then
-            clicks_per_sec = tonumber(value) or 0
-        elseif field == "blocks_per_click" then
-            blocks_per_click = tonumber(value) or 0
-        elseif field == "last_update_time" then
-            last_update_time = tonumber(value) or 0
-        elseif field == "username" then
-            username = value
+local key = KEYS[1]
+local current_time = tonumber(ARGV[1])
+local user_data = redis.call('HMGET', key, 'blocks_balance', 'clicks_per_sec', 'blocks_per_click', 'last_update_time', 'username')
+
+if user_data[5] == false then
+    -- данных пользователя нет в Redis
+    return nil
+end
+
+local balance = tonumber(user_data[1]) or 0
+local clicks_per_sec = tonumber(user_data[2]) or 0
+local blocks_per_click = tonumber(user_data[3]) or 0
+local last_update_time = tonumber(user_data[4]) or current_time
+
+local timedelta = math.max(current_time - last_update_time, 0)
+local clicks = clicks_per_sec * timedelta
+local earned = math.floor(clicks * blocks_per_click * 1000 + 0.5)
+
+local new_balance = balance
+if earned > 0 then
+    new_balance = redis.call('HINCRBY', key, 'blocks_balance', earned)
+end
+redis.call('HSET', key, 'last_update_time', current_time)
+
+return {user_data[5], new_balance, string.format('%.0f', clicks), earned}
+"""
+# Lua-скрипт для применения кликов пользователя за один вызов.
+# Начисляет блоки за клики (с учетом шанса добычи) и за время работы автокликера
+# с последнего обновления одной командой HINCRBY (баланс в милли-блоках),
+# обновляет "last_update_time" и уменьшает счетчики кликов
+# до следующего выпадения игровых предметов (поля "drop_skip:<item_key>", ключи предметов в ARGV[6..]).
+# Если у ключа есть время жизни (пользователь без автокликера), оно продлевается до ARGV[4] секунд.
+# Если передан ARGV[5] - id последнего события Redis Stream с этими кликами, клики применяются, только
+# если он больше id, записанного в поле "clicks_stream_id" (события еще не применены), и поле обновляется.
+# Истекший или еще не заданный счетчик атомарно заменяется меткой заявки "claimed:<номер>:<время>",
+# поэтому при одновременных вызовах выпадение предмета разыгрывает только один из них. Заявленные
+# другим вызовом счетчики пропускаются; заявка старше DROP_CLAIM_TIMEOUT секунд (вызов завершился
+# с ошибкой и не записал новый счетчик) заявляется заново. Новые значения счетчиков записывает
+# `set_drop_skips_script`.
+# Возвращает новый баланс, имя пользователя, начисленные милли-блоки, метку заявки ('' - нет заявленных
+# счетчиков) и тройки (предмет, клики после выпадения, выпало предметов) для заявленных счетчиков.
+# Если данных пользователя нет в Redis, возвращает nil.
+# Для уже примененных событий возвращает текущий баланс, имя пользователя, 0 и ''.
+apply_clicks_script = """
+local key = KEYS[1]
+local clicks = tonumber(ARGV[1])
+local mining_chance = tonumber(ARGV[2])
+local current_time = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local stream_id = ARGV[5]
+
+if redis.call('EXISTS', key) == 0 then
+    return nil
+end
+if redis.call('TTL', key) > 0 then
+    redis.call('EXPIRE', key, ttl)
+end
+
+local user_data = redis.call(
+    'HMGET', key, 'blocks_balance', 'clicks_per_sec', 'blocks_per_click', 'last_update_time', 'username',
+    'clicks_stream_id'
+)
+
+if stream_id ~= '' then
+    if user_data[6] then
+        local ms, seq = string.match(stream_id, '^(%d+)-(%d+)$')
+        local applied_ms, applied_seq = string.match(user_data[6], '^(%d+)-(%d+)$')
+        ms, seq, applied_ms, applied_seq = tonumber(ms), tonumber(seq), tonumber(applied_ms), tonumber(applied_seq)
+        if ms < applied_ms or (ms == applied_ms and seq <= applied_seq) then
+            -- события уже применены (повторная обработка после сбоя)
+            return {tonumber(user_data[1]) or 0, user_data[5], 0, ''}
         end
     end
+    redis.call('HSET', key, 'clicks_stream_id', stream_id)
+end
+
+local clicks_per_sec = tonumber(user_data[2]) or 0
+local blocks_per_click = tonumber(user_data[3]) or 0
+local last_update_time = tonumber(user_data[4]) or current_time
 
-    -- Логика обработки данных
-    local timedelta = current_time - last_update_time
-    local clicks = clicks_per_sec * timedelta
+-- Клики автокликера с последнего обновления, чтобы не потерять их при обновлении "last_update_time"
+local timedelta = math.max(current_time - last_update_time, 0)
+local autoclicks = clicks_per_sec * timedelta
 
-    -- Обновляем Redis
-    redis.call('HMSET', key, 'blocks_balance', balance + clicks * blocks_per_click, 'last_update_time', current_time)
-    redis.call("ZADD", balances_key, balance, username)
+local earned = math.floor((autoclicks + clicks * mining_chance) * blocks_per_click * 1000 + 0.5)
+local new_balance = redis.call('HINCRBY', key, 'blocks_balance', earned)
+redis.call('HSET', key, 'last_update_time', ARGV[3])
 
-    -- Добавляем результат в список
-    user_clicks[key] = clicks
+local result = {new_balance, user_data[5], earned, ''}
+local total_clicks = math.floor(clicks + autoclicks)
+
+-- Счетчики кликов до следующего выпадения предметов
+local DROP_CLAIM_TIMEOUT = 60
+local claim = nil
+for i = 6, #ARGV do
+    local field = 'drop_skip:' .. ARGV[i]
+    local value = redis.call('HGET', key, field)
+    local skip = tonumber(value)
+    local claimed = false
+    if value and skip == nil then
+        -- счетчик заявлен другим вызовом, пока он не записал новое значение
+        local claim_time = tonumber(string.match(value, '^claimed:%d+:(.+)$')) or 0
+        claimed = current_time - claim_time < DROP_CLAIM_TIMEOUT
+    end
+
+    if skip ~= nil and skip > total_clicks then
+        redis.call('HSET', key, field, string.format('%.0f', skip - total_clicks))
+    elseif not claimed then
+        if claim == nil then
+            claim = 'claimed:' .. redis.call('HINCRBY', key, 'drop_claim_seq', 1) .. ':' .. ARGV[3]
+            result[4] = claim
+        end
+        redis.call('HSET', key, field, claim)
+        table.insert(result, ARGV[i])
+        if skip == nil then
+            -- счетчик еще не задан, выпадения считаются на стороне приложения
+            table.insert(result, string.format('%.0f', total_clicks))
+            table.insert(result, '0')
+        else
+            -- предмет выпал, возвращаем количество кликов после выпадения
+            table.insert(result, string.format('%.0f', total_clicks - skip))
+            table.insert(result, '1')
+        end
+    end
+end
+
+return result
+"""
+# Lua-скрипт для записи новых значений счетчиков кликов до выпадения предметов (KEYS[1] - ключ пользователя).
+# ARGV[1] - метка заявки, которую вернул `apply_clicks_script`, ARGV[2..] - пары (поле, значение).
+# Значение записывается, только если в поле все еще стоит эта заявка (иначе заявка устарела
+# и счетчик заявил другой вызов). Возвращает список записанных полей.
+set_drop_skips_script = """
+local key = KEYS[1]
+local written = {}
+
+for i = 2, #ARGV, 2 do
+    if redis.call('HGET', key, ARGV[i]) == ARGV[1] then
+        redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+        table.insert(written, ARGV[i])
+    end
+end
+
+return written
+"""
+# Lua-скрипт для освобождения аренды (lease): ключ удаляется, только если он принадлежит владельцу ARGV[1]
+release_lease_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# Lua-скрипт для начисления блоков автокликера, посчитанных на стороне приложения, с оптимистичной проверкой.
+# Баланс увеличивается на ARGV[2] милли-блоков, только если "last_update_time" не изменился с момента
+# чтения (ARGV[1]), иначе пользователь уже получил начисление вместе с кликами.
+# Возвращает новый баланс или nil, если начисление пропущено.
+set_accrued_balance_script = """
+local key = KEYS[1]
+local last_update_time = redis.call('HGET', key, 'last_update_time') or ''
+
+if last_update_time ~= ARGV[1] then
+    return nil
+end
+
+local new_balance = redis.call('HINCRBY', key, 'blocks_balance', ARGV[2])
+redis.call('HSET', key, 'last_update_time', ARGV[3])
+return new_balance
+"""
+# Lua-скрипт для списания цены покупки с баланса пользователя (KEYS[1]).
+# Сначала начисляются блоки автокликера с последнего обновления, затем, если баланса хватает,
+# списывается ARGV[1] милли-блоков, "last_update_time" сдвигается на ARGV[2], и если переданы
+# ARGV[3] и ARGV[4], полю ARGV[3] присваивается значение ARGV[4] (например, новое значение автокликера).
+# Возвращает {1, новый баланс, имя пользователя, начисленные автокликером милли-блоки, прежнее значение
+# поля ARGV[3] ('' - поля не было)} или {0, баланс, имя пользователя, 0, ''}, если баланса не хватает
+# (тогда данные не изменяются).
+# Если данных пользователя нет в Redis, возвращает nil.
+spend_balance_script = """
+local key = KEYS[1]
+local price = tonumber(ARGV[1])
+local current_time = tonumber(ARGV[2])
+
+if redis.call('EXISTS', key) == 0 then
+    return nil
+end
+
+local user_data = redis.call(
+    'HMGET', key, 'blocks_balance', 'clicks_per_sec', 'blocks_per_click', 'last_update_time', 'username'
+)
+local balance = tonumber(user_data[1]) or 0
+local clicks_per_sec = tonumber(user_data[2]) or 0
+local blocks_per_click = tonumber(user_data[3]) or 0
+local last_update_time = tonumber(user_data[4]) or current_time
+
+local timedelta = math.max(current_time - last_update_time, 0)
+local earned = math.floor(clicks_per_sec * timedelta * blocks_per_click * 1000 + 0.5)
+
+if balance + earned < price then
+    return {0, balance + earned, user_data[5], 0, ''}
 end
 
-return cjson.encode(user_clicks)
+local new_balance = redis.call('HINCRBY', key, 'blocks_balance', earned - price)
+redis.call('HSET', key, 'last_update_time', ARGV[2])
+local old_value = ''
+if ARGV[3] then
+    old_value = redis.call('HGET', key, ARGV[3]) or ''
+    redis.call('HSET', key, ARGV[3], ARGV[4])
+end
+return {1, new_balance, user_data[5], earned, old_value}
+"""
+# Lua-скрипт для возврата цены покупки, списанной `spend_balance_script`, если покупку не удалось сохранить.
+# Баланс пользователя (KEYS[1]) увеличивается на ARGV[1] милли-блоков, и если передан ARGV[2],
+# полю ARGV[2] возвращается прежнее значение ARGV[3] ('' - поле удаляется).
+# Возвращает {новый баланс, имя пользователя} или nil, если данных пользователя нет в Redis.
+refund_balance_script = """
+local key = KEYS[1]
+
+if redis.call('EXISTS', key) == 0 then
+    return nil
+end
+
+local new_balance = redis.call('HINCRBY', key, 'blocks_balance', ARGV[1])
+if ARGV[2] then
+    if ARGV[3] == '' then
+        redis.call('HDEL', key, ARGV[2])
+    else
+        redis.call('HSET', key, ARGV[2], ARGV[3])
+    end
+end
+return {new_balance, redis.call('HGET', key, 'username')}
 """
@@ -0,0 +1,195 @@
+"""
+Перевод балансов пользователей в Redis из блоков (дробные числа) в милли-блоки (целые числа).
+
+Переводятся поле "blocks_balance" хешей пользователей (в том числе в ключах старой схемы), шарды таблицы лидеров
+и таблицы лидеров за дни. Счетчики сумм балансов шардов после перевода записываются точными суммами
+переведенных балансов (см. `reconcile_leaderboard_totals`).
+
+Перевод нужно запускать при остановленных приложении и воркерах Celery, после миграции
+базы данных (`alembic upgrade head`). После перевода в Redis записывается ключ-отметка,
+повторный запуск ничего не меняет.
+
+Перевод каждого ключа идемпотентен, поэтому после сбоя его можно запустить заново:
+- хеш пользователя переводится lua-скриптом вместе с записью в него поля-отметки BALANCE_SCALE_FIELD
+  (поля удаляются после перевода всех ключей);
+- ZSET переводится во временный ключ, который атомарно переименовывается в исходный вместе
+  с записью ключа-отметки ZSET. Незаконченный временный ключ при повторном запуске строится заново.
+
+Запуск:
+    python -m app.redis_helpers.migrate_balances
+"""
+import asyncio
+
+from app.config import settings
+from app.redis_init import get_redis
+from app.utils.logger_init import logger
+from app.utils.data_processing_funcs import to_milli_blocks, BALANCE_SCALE
+from app.utils.leaderboard import get_leaderboard_keys, reconcile_leaderboard_totals
+
+BALANCES_SCALE_KEY = f"balances_scale:{settings.REDIS_NODE_TAG_3}"
+# поле-отметка переведенного хеша пользователя
+BALANCE_SCALE_FIELD = "balance_scale"
+
+# Lua-скрипт перевода баланса хеша пользователя (KEYS[1]) в милли-блоки (ARGV[1] - множитель).
+# Хеш с полем-отметкой уже переведен и не изменяется. Возвращает 1, если баланс переведен.
+convert_user_balance_script = """
+local key = KEYS[1]
+local scale = tonumber(ARGV[1])
+
+if redis.call('HEXISTS', key, ARGV[2]) == 1 then
+    return 0
+end
+local balance = redis.call('HGET', key, 'blocks_balance')
+if not balance then
+    return 0
+end
+local milli_blocks = math.floor((tonumber(balance) or 0) * scale + 0.5)
+redis.call('HSET', key, 'blocks_balance', string.format('%d', milli_blocks), ARGV[2], ARGV[1])
+return 1
+"""
+# Lua-скрипт замены ZSET (KEYS[1]) переведенной копией (KEYS[2]) с записью ключа-отметки (KEYS[3]).
+commit_sorted_set_script = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[1])
+end
+redis.call('SET', KEYS[3], ARGV[1])
+return 1
+"""
+
+
+def get_sorted_set_marker_key(key: str) -> str:
+    """Возвращает ключ-отметку переведенного ZSET (в том же слоте, что и ZSET)."""
+    return f"balances_scaled:{key}"
+
+
+def get_sorted_set_temp_key(key: str) -> str:
+    """Возвращает временный ключ переводимого ZSET (в том же слоте, что и ZSET)."""
+    return f"balances_scaling:{key}"
+
+
+def get_users_data_patterns() -> list[str]:
+    # ключи новой схемы и еще не перенесенные ключи старой схемы (см. `migrate_user_keys`)
+    return ["user_data:{*}"] + [
+        f"user_data:{redis_tag}:*" for redis_tag in [settings.REDIS_NODE_TAG_1, settings.REDIS_NODE_TAG_2]
+    ]
+
+
+async def convert_users_data(redis_client, batch_size: int = 1000) -> int:
+    """Переводит баланс в хешах пользователей в милли-блоки. Возвращает количество переведенных пользователей."""
+    convert_script = redis_client.register_script(convert_user_balance_script)
+
+    async def convert_batch(keys: list[str]) -> int:
+        # скрипт вызывается для каждого ключа отдельно (ключи в разных слотах), вызовы выполняются параллельно
+        results = await asyncio.gather(*[
+            convert_script(keys=[key], args=[BALANCE_SCALE, BALANCE_SCALE_FIELD]) for key in keys
+        ])
+        return sum(int(result) for result in results)
+
+    converted = 0
+    for pattern in get_users_data_patterns():
+        keys = []
+        async for key in redis_client.scan_iter(match=pattern, count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                converted += await convert_batch(keys)
+                keys = []
+        if keys:
+            converted += await convert_batch(keys)
+    return converted
+
+
+async def drop_users_scale_fields(redis_client, batch_size: int = 1000) -> None:
+    """Удаляет поля-отметки из хешей пользователей после перевода всех ключей."""
+    for pattern in get_users_data_patterns():
+        keys = []
+        async for key in redis_client.scan_iter(match=pattern, count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                await _drop_scale_fields(redis_client, keys)
+                keys = []
+        if keys:
+            await _drop_scale_fields(redis_client, keys)
+
+
+async def _drop_scale_fields(redis_client, keys: list[str]) -> None:
+    async with redis_client.pipeline() as pipe:
+        for key in keys:
+            await pipe.hdel(key, BALANCE_SCALE_FIELD)
+        await pipe.execute()
+
+
+async def convert_sorted_set(redis_client, key: str, batch_size: int = 1000) -> int:
+    """
+    Переводит значения ZSET (балансы или добытые блоки) в милли-блоки. Возвращает количество значений.
+
+    Значения записываются во временный ключ, исходный ZSET не изменяется до атомарной замены,
+    поэтому прерванный перевод можно повторить. Уже переведенный ZSET (есть ключ-отметка) пропускается.
+    """
+    marker_key = get_sorted_set_marker_key(key)
+    if await redis_client.exists(marker_key):
+        return 0
+    temp_key = get_sorted_set_temp_key(key)
+    await redis_client.delete(temp_key)
+
+    batch = {}
+    converted = 0
+    async for member, score in redis_client.zscan_iter(key, count=batch_size):
+        batch[member] = to_milli_blocks(score)
+        if len(batch) >= batch_size:
+            await redis_client.zadd(temp_key, batch)
+            converted += len(batch)
+            batch = {}
+    if batch:
+        await redis_client.zadd(temp_key, batch)
+        converted += len(batch)
+
+    commit_script = redis_client.register_script(commit_sorted_set_script)
+    await commit_script(keys=[key, temp_key, marker_key], args=[BALANCE_SCALE])
+    return converted
+
+
+async def get_sorted_set_keys(redis_client) -> list[str]:
+    """Возвращает ключи переводимых ZSET: шарды таблицы лидеров и добытые за день блоки."""
+    keys = get_leaderboard_keys()
+    async for key in redis_client.scan_iter(match="users_earned:{*}", count=1000):
+        if key.split(":")[-1].isdigit():
+            keys.append(key)
+        else:
+            # объединения за несколько дней и их отметки, будут созданы заново
+            await redis_client.delete(key)
+    return keys
+
+
+async def drop_sorted_sets_markers(redis_client, keys: list[str]) -> None:
+    for key in keys:
+        await redis_client.delete(get_sorted_set_marker_key(key))
+
+
+async def main() -> None:
+    redis_client = await get_redis()
+    if await redis_client.get(BALANCES_SCALE_KEY):
+        logger.info("Redis balances are already stored in milli-blocks.")
+        return
+
+    logger.info("Redis balances migration to milli-blocks started...")
+    users_count = await convert_users_data(redis_client)
+
+    sorted_set_keys = await get_sorted_set_keys(redis_client)
+    entries_count = 0
+    for key in sorted_set_keys:
+        entries_count += await convert_sorted_set(redis_client, key)
+    # счетчики сумм балансов шардов пересчитываются по переведенным балансам
+    await reconcile_leaderboard_totals(redis_client)
+
+    await redis_client.set(BALANCES_SCALE_KEY, BALANCE_SCALE)
+    # отметки больше не нужны: повторный запуск остановится на BALANCES_SCALE_KEY
+    await drop_users_scale_fields(redis_client)
+    await drop_sorted_sets_markers(redis_client, sorted_set_keys)
+    logger.info(
+        f"Redis balances migration finished: {users_count} users data, "
+        f"{entries_count} leaderboard and earned entries converted."
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
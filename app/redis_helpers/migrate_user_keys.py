@@ -0,0 +1,78 @@
+"""
+Перенос данных пользователей из старой схемы ключей Redis в новую.
+
+В старой схеме данные всех пользователей хранились под двумя хеш-тегами
+("user_data:{REDIS_NODE_TAG_1}:<id>" и "user_data:{REDIS_NODE_TAG_2}:<id>"),
+то есть всего в двух слотах кластера. В новой схеме хеш-тег - идентификатор пользователя
+("user_data:{<id>}"). Индексов пользователей с автокликером в старой схеме не было, пользователи с автокликером
+добавляются в индексы партиций ("autoclicker_users:{ac<partition>}") при запуске приложения
+(см. `add_users_with_autoclicker_to_redis`).
+
+Также из хешей пользователей новой схемы удаляются поля, которые больше не хранятся
+в Redis (см. HOT_USER_FIELDS в `app/users/user_state.py`).
+
+Перенос можно запускать на работающем приложении: приложение само переносит данные
+пользователя при первом обращении, а повторный перенос уже перенесенных данных ничего не меняет.
+После переноса можно отключить REDIS_LEGACY_KEYS_MIGRATION.
+
+Запуск:
+    python -m app.redis_helpers.migrate_user_keys
+"""
+import asyncio
+
+from app.config import settings
+from app.redis_init import get_redis
+from app.utils.logger_init import logger
+from app.users.user_state import USER_FIELDS, HOT_USER_FIELDS
+from app.utils.data_processing_funcs import migrate_legacy_user_data
+
+
+async def migrate_users_data(redis_client) -> int:
+    """Переносит данные всех пользователей из ключей старой схемы. Возвращает количество пользователей."""
+    migrated = 0
+    for redis_tag in [settings.REDIS_NODE_TAG_1, settings.REDIS_NODE_TAG_2]:
+        async for key in redis_client.scan_iter(match=f"user_data:{redis_tag}:*", count=1000):
+            user_id = key.split(":")[-1]
+            if await migrate_legacy_user_data(user_id, redis_client):
+                migrated += 1
+            if migrated and migrated % 10000 == 0:
+                logger.info(f"{migrated} users data migrated...")
+    return migrated
+
+
+async def trim_users_data(redis_client, batch_size: int = 1000) -> int:
+    """Удаляет из хешей пользователей поля, которые не относятся к HOT_USER_FIELDS. Возвращает количество ключей."""
+    cold_fields = [field for field in USER_FIELDS if field not in HOT_USER_FIELDS]
+    keys = []
+    trimmed = 0
+    async for key in redis_client.scan_iter(match="user_data:{*}", count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            trimmed += await _hdel_fields(redis_client, keys, cold_fields)
+            keys = []
+    if keys:
+        trimmed += await _hdel_fields(redis_client, keys, cold_fields)
+    return trimmed
+
+
+async def _hdel_fields(redis_client, keys: list[str], fields: list[str]) -> int:
+    async with redis_client.pipeline() as pipe:
+        for key in keys:
+            await pipe.hdel(key, *fields)
+        results = await pipe.execute()
+    return sum(1 for deleted in results if deleted)
+
+
+async def main() -> None:
+    redis_client = await get_redis()
+    logger.info("Redis user keys migration started...")
+    users_count = await migrate_users_data(redis_client)
+    trimmed_count = await trim_users_data(redis_client)
+    logger.info(
+        f"Redis user keys migration finished: {users_count} users data migrated, "
+        f"{trimmed_count} users data trimmed."
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from app.utils.logger_init import logger
+from app.redis_init import init_redis_pubsub_client
+
+
+class RedisUpdatesListener:
+    """
+    Получение обновлений общих данных приложения (например, шанса добычи) в каждом процессе.
+
+    Обновления приходят через pub/sub Redis. Так как сообщения pub/sub могут теряться
+    (например, при переподключении), для каждого вида данных можно задать периодическую
+    проверку (polling), которая читает актуальное значение из Redis.
+
+    Attributes:
+        reconnect_delay (float): Пауза перед переподключением к Redis после ошибки (в секундах).
+    """
+    def __init__(self, reconnect_delay: float = 1):
+        self.reconnect_delay = reconnect_delay
+        self._handlers: dict[str, Callable[[str], Awaitable[None]]] = {}
+        self._pollers: list[tuple[Callable[[], Awaitable[None]], float]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def subscribe(self, channel: str, handler: Callable[[str], Awaitable[None]]) -> None:
+        """Добавляет обработчик сообщений канала. Нужно вызывать до `start`."""
+        self._handlers[channel] = handler
+
+    def add_poller(self, poller: Callable[[], Awaitable[None]], interval: float) -> None:
+        """Добавляет периодическую проверку актуальности данных. Нужно вызывать до `start`."""
+        self._pollers.append((poller, interval))
+
+    async def _listen(self) -> None:
+        while True:
+            client = None
+            try:
+                client = await init_redis_pubsub_client()
+                if client is None:
+                    raise ConnectionError("Redis is not available for pub/sub.")
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(*self._handlers.keys())
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        try:
+                            await self._handlers[message["channel"]](message["data"])
+                        except Exception as err:
+                            logger.error(f"Ошибка обработки сообщения из канала {message['channel']}: {err}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error(f"Ошибка подписки на обновления в Redis: {err}")
+            finally:
+                if client is not None:
+                    await client.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _poll(self, poller: Callable[[], Awaitable[None]], interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await poller()
+            except Exception as err:
+                logger.error(f"Ошибка периодической проверки обновлений в Redis: {err}")
+
+    def start(self) -> None:
+        """Запускает подписку на каналы и периодические проверки."""
+        if self._tasks:
+            return
+        if self._handlers:
+            self._tasks.append(asyncio.create_task(self._listen()))
+        for poller, interval in self._pollers:
+            self._tasks.append(asyncio.create_task(self._poll(poller, interval)))
+        logger.info("Redis updates listener started.")
+
+    async def stop(self) -> None:
+        """Останавливает подписку и периодические проверки."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        logger.info("Redis updates listener stopped.")
+
+
+updates_listener: Optional[RedisUpdatesListener] = None
+
+
+def get_updates_listener() -> RedisUpdatesListener:
+    # слушатель создается при первом обращении, внутри работающего цикла событий
+    global updates_listener
+    if updates_listener is None:
+        updates_listener = RedisUpdatesListener()
+    return updates_listener
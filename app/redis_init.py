@@ -41,3 +41,32 @@ async def get_redis():
         logger.error("Failed to initialize Redis Cluster.")
         raise ConnectionError("Failed to initialize Redis Cluster.")
     return redis_client
+
+
+async def init_redis_pubsub_client():
+    """
+    Подключается к одной из нод кластера обычным (не кластерным) клиентом для pub/sub.
+
+    В Redis Cluster сообщения PUBLISH рассылаются всем нодам, поэтому для публикации
+    и подписки достаточно соединения с любой доступной нодой.
+    """
+    for node in settings.REDIS_NODES:
+        try:
+            client = a_redis.Redis(host=node["host"], port=int(node["port"]), decode_responses=True)
+            await client.ping()
+            return client
+        except r_exc.RedisError as err:
+            logger.error(f"Redis node {node['host']}:{node['port']} is not available for pub/sub: {err}")
+    return None
+
+redis_pubsub_client = None
+
+
+async def get_redis_pubsub():
+    global redis_pubsub_client
+    if redis_pubsub_client is None:
+        redis_pubsub_client = await init_redis_pubsub_client()
+    if redis_pubsub_client is None:
+        logger.error("Failed to connect to Redis for pub/sub.")
+        raise ConnectionError("Failed to connect to Redis for pub/sub.")
+    return redis_pubsub_client
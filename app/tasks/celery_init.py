@@ -17,7 +17,7 @@ celery.conf.timezone = "UTC"
 celery.conf.beat_schedule = {
     "set-mining-chance": {
         "task": "set_mining_chance_task",
-        "schedule": timedelta(hours=1),
+        "schedule": timedelta(seconds=settings.MINING_CHANCE_PERIOD),
     },
     "check_and_update_game_data_files": {
         "task": "check_and_update_game_data_files",
@@ -25,6 +25,14 @@ celery.conf.beat_schedule = {
     },
     "recalculate_users_data": {
         "task": "recalculate_users_data_task",
-        "schedule": timedelta(seconds=5)
+        "schedule": timedelta(seconds=settings.AUTOCLICKER_RECALC_PERIOD)
+    },
+    "publish_leaderboard_snapshot": {
+        "task": "publish_leaderboard_snapshot_task",
+        "schedule": timedelta(seconds=settings.LEADERBOARD_SNAPSHOT_PERIOD),
+    },
+    "reconcile_leaderboard_totals": {
+        "task": "reconcile_leaderboard_totals_task",
+        "schedule": timedelta(hours=1),
     }
 }
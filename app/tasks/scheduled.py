@@ -1,13 +1,21 @@
 import os
+import json
+import uuid
+import socket
 import asyncio
+from datetime import datetime
 from celery import shared_task
 
 from app.config import settings
+from app.redis_init import get_redis
 from app.utils.logger_init import celery_poc_logger
 from app.utils.boosts_init import init_game_boosts
 from app.utils.mining_chance_init import set_mining_chance
 from app.game_data.modificators import LAST_MODIFIED_DATA_FILES
 from app.utils.users_init import recalculate_users_data_in_redis
+from app.utils.leaderboard import reconcile_leaderboard_totals
+from app.utils.leaderboard_snapshot import publish_leaderboard_snapshot
+from app.utils.data_processing_funcs import acquire_lease, release_lease
 from app.utils.game_items_init import init_game_items, set_items_quantity_in_redis
 
 
@@ -24,16 +32,93 @@ def set_mining_chance_task():
 @shared_task(name="recalculate_users_data_task")
 def recalculate_users_data_task():
     """
-    Пересчитать и обновить в redis балансы пользователей с автокликером.
-    А так же подсчитать выпавшие предметы с кликов автокликера.
+    Ставит в очередь пересчет балансов пользователей с автокликером по партициям,
+    чтобы партиции обрабатывались параллельно разными воркерами.
     """
     celery_poc_logger.info("TASK STARTED: recalculate_users_data_task")
-    loop = asyncio.get_event_loop()
-    coroutine = recalculate_users_data_in_redis()
-    loop.run_until_complete(coroutine)
+    for partition in range(settings.AUTOCLICKER_PARTITIONS):
+        recalculate_partition_task.delay(partition)
     celery_poc_logger.info("TASK FINISHED: recalculate_users_data_task")
 
 
+@shared_task(name="recalculate_partition_task")
+def recalculate_partition_task(partition: int):
+    """
+    Пересчитать и обновить в redis балансы пользователей с автокликером одной партиции.
+    А так же подсчитать выпавшие предметы с кликов автокликера.
+
+    Партицию обрабатывает только воркер, взявший её аренду в Redis. Если предыдущий
+    пересчет партиции ещё не закончился, задача пропускается.
+    Не чаще одного раза за AUTOCLICKER_PERSIST_PERIOD посчитанные балансы партиции записываются в базу данных.
+    """
+    loop = asyncio.get_event_loop()
+    redis_client = loop.run_until_complete(get_redis())
+    lease_key = f"recalculate_lease:{{ac{partition}}}"
+    owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}"
+
+    if not loop.run_until_complete(
+            acquire_lease(lease_key, owner, settings.AUTOCLICKER_LEASE_MS, redis_client)
+    ):
+        celery_poc_logger.info(f"Partition {partition} is already being recalculated, skipped.")
+        return
+
+    try:
+        start_time = datetime.now().timestamp()
+        # ключ-отметка записи балансов в базу живет AUTOCLICKER_PERSIST_PERIOD секунд
+        persist = bool(loop.run_until_complete(redis_client.set(
+            f"balances_persisted:{{ac{partition}}}", owner, nx=True, ex=settings.AUTOCLICKER_PERSIST_PERIOD
+        )))
+        users_count = loop.run_until_complete(recalculate_users_data_in_redis(partition, persist=persist))
+        execution_time_ms = (datetime.now().timestamp() - start_time) * 1000
+        celery_poc_logger.info(
+            f"Partition {partition} recalculated: {users_count} users in {execution_time_ms:.2f} ms."
+        )
+        loop.run_until_complete(redis_client.hset(
+            f"recalculate_stats:{settings.REDIS_NODE_TAG_2}",
+            str(partition),
+            json.dumps({
+                "users": users_count,
+                "execution_time_ms": round(execution_time_ms, 2),
+                "finished_at": int(datetime.now().timestamp())
+            })
+        ))
+    except Exception as err:
+        celery_poc_logger.error(f"Ошибка при пересчете балансов партиции {partition}: {err}")
+    finally:
+        loop.run_until_complete(release_lease(lease_key, owner, redis_client))
+
+
+@shared_task(name="reconcile_leaderboard_totals_task")
+def reconcile_leaderboard_totals_task():
+    """
+    Сверить счетчики сумм балансов шардов таблицы лидеров с точными суммами балансов.
+    Расхождения записываются в лог, счетчики перезаписываются точными суммами.
+    """
+    celery_poc_logger.info("TASK STARTED: reconcile_leaderboard_totals_task")
+    loop = asyncio.get_event_loop()
+    try:
+        redis_client = loop.run_until_complete(get_redis())
+        totals = loop.run_until_complete(reconcile_leaderboard_totals(redis_client))
+        for shard, (total, exact_total) in totals.items():
+            if total != exact_total:
+                celery_poc_logger.warning(
+                    f"Leaderboard shard {shard} total drift: counter {total}, exact {exact_total}."
+                )
+    except Exception as err:
+        celery_poc_logger.error(f"Ошибка при сверке сумм балансов таблицы лидеров: {err}")
+    celery_poc_logger.info("TASK FINISHED: reconcile_leaderboard_totals_task")
+
+
+@shared_task(name="publish_leaderboard_snapshot_task")
+def publish_leaderboard_snapshot_task():
+    """Создать снимок таблицы лидеров и разослать его всем процессам приложения."""
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(publish_leaderboard_snapshot())
+    except Exception as err:
+        celery_poc_logger.error(f"Ошибка при создании снимка таблицы лидеров: {err}")
+
+
 @shared_task(name="check_and_update_game_data_files")
 def check_and_update_game_data_files():
     """
@@ -46,27 +46,30 @@ def add_items_to_db(user_id: int, item_key: str, items_count: int, image_id: int
 
 
 @shared_task
-def calculate_items_won_by_list(users_data: dict[str: int], redis_client) -> None:
+def calculate_items_won_by_list(users_data: dict[str, int]) -> None:
     """
     Подсчитывает количество выпавших игровых предметов для
     списка пользователей и обновляет данные в Redis.
 
     Args:
-        users_data (dict): Словарь, где ключи - это ключи данных пользователей
-            в redis, значения - количество кликов.
-        redis_client: Клиент Redis для взаимодействия с базой данных.
+        users_data (dict): Словарь, где ключи - это идентификаторы пользователей
+            (строкой, так как аргументы задачи передаются в JSON), значения - количество кликов.
 
     Returns:
         None
+
+    Notes:
+        Выпавшие предметы для всех пользователей считаются одним вызовом `roll_items_for_users`.
     """
-    from app.utils.users_init import calculate_items_won
+    from app.redis_init import get_redis
+    from app.utils.items_drop import roll_items_for_users
     try:
         loop = asyncio.get_event_loop()
-        coroutines = [
-            calculate_items_won(int(key.split(":")[-1]), count_clicks, redis_client)
-            for key, count_clicks in users_data.items()
-        ]
-        celery_poc_logger.error(f"OK {users_data}")
-        loop.run_until_complete(asyncio.gather(*coroutines))
+        users_clicks = {
+            int(user_id): int(count_clicks)
+            for user_id, count_clicks in users_data.items()
+        }
+        redis_client = loop.run_until_complete(get_redis())
+        loop.run_until_complete(roll_items_for_users(users_clicks, redis_client))
     except Exception as err:
         celery_poc_logger.error(f"Ошибка при подсчете выпавших предметов в фоне: {err}")
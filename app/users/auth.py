@@ -4,6 +4,7 @@ from jose import jwt
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
 from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.users.dao import UsersDAO
@@ -50,8 +51,8 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-async def authenticate_user(mail: EmailStr, password: str):
-    user = await UsersDAO.find_by_key(mail=mail)
+async def authenticate_user(mail: EmailStr, password: str, session: AsyncSession = None):
+    user = await UsersDAO.find_by_key(mail=mail, session=session)
     if not user:
         return None
     if not verify_password(password, user.hash_password):
@@ -60,11 +61,11 @@ async def authenticate_user(mail: EmailStr, password: str):
 
 
 # register new user
-async def add_new_user_to_db(user_data: SUserAuth, referral_link: str = None):
-    existing_username = await UsersDAO.find_one_or_none(username=user_data.username)
+async def add_new_user_to_db(user_data: SUserAuth, referral_link: str = None, session: AsyncSession = None):
+    existing_username = await UsersDAO.find_one_or_none(username=user_data.username, session=session)
     if existing_username:
         raise UsernameAlreadyExistsException
-    existing_mail = await UsersDAO.find_one_or_none(mail=user_data.mail)
+    existing_mail = await UsersDAO.find_one_or_none(mail=user_data.mail, session=session)
     if existing_mail:
         raise EmailAlreadyExistException
 
@@ -72,11 +73,13 @@ async def add_new_user_to_db(user_data: SUserAuth, referral_link: str = None):
         referer = None
     else:
         referer = await UsersDAO.find_one_or_none(
-            referral_link=f'{settings.FRONTEND_DOMAIN}/login.html?ref={referral_link}'
+            referral_link=f'{settings.FRONTEND_DOMAIN}/login.html?ref={referral_link}',
+            session=session
         )
 
     hashed_password = get_password_hash(user_data.password)
     created_user = await UsersDAO.add(
+        session=session,
         username=user_data.username,
         mail=user_data.mail,
         hash_password=hashed_password,
@@ -1,6 +1,7 @@
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import async_session_maker
+from app.database import get_dao_session
 from app.dao.base import BaseDAO
 from app.users.models import Users
 
@@ -9,28 +10,54 @@ class UsersDAO(BaseDAO):
     model = Users
 
     @classmethod
-    async def get_top_100_users(cls):
-        async with async_session_maker() as session:
+    async def get_top_100_users(cls, session: AsyncSession = None):
+        async with get_dao_session(session) as session:
             query = select(Users.username, Users.blocks_balance).order_by(desc(Users.blocks_balance)).limit(100)
             result = await session.execute(query)
             return result.mappings().all()
 
     @classmethod
-    async def fetch_users_by_key(cls, offset: int = 0, limit: int = None, **filter_by):
-        async with async_session_maker() as session:
-            query = select(cls.model.__table__.columns)
-
-            # Добавляем условие фильтрации для !=
-            for column, value in filter_by.items():
-                if value is not None:
-                    if isinstance(value, tuple):
-                        operator, val = value
-                        if operator == "!=":
-                            query = query.filter(getattr(cls.model, column) != val)
-                        else:
-                            query = query.filter(getattr(cls.model, column) == val)
+    async def update_balances(cls, balances: dict[int, int], update_time: int, session: AsyncSession = None):
+        """
+        Записывает балансы пользователей (в милли-блоках) одним запросом executemany.
+        Вместе с балансом записывается время, на которое он посчитан ("last_update_time").
+        """
+        if not balances:
+            return
+        table = cls.model.__table__
+        query = update(table).where(table.c.id == bindparam("user_id")).values(
+            blocks_balance=bindparam("balance"),
+            last_update_time=update_time
+        )
+        async with get_dao_session(session) as session:
+            await session.execute(
+                query, [{"user_id": int(user_id), "balance": int(balance)} for user_id, balance in balances.items()]
+            )
+            await session.commit()
+
+    @classmethod
+    def get_filter_criteria(cls, **filter_by) -> list:
+        """
+        Преобразует фильтр по ключу в условия SQLAlchemy.
+        Значение может быть кортежем (оператор, значение), поддерживается оператор "!=".
+        """
+        criteria = []
+        for column, value in filter_by.items():
+            if value is not None:
+                if isinstance(value, tuple):
+                    operator, val = value
+                    if operator == "!=":
+                        criteria.append(getattr(cls.model, column) != val)
                     else:
-                        query = query.filter(getattr(cls.model, column) == value)
+                        criteria.append(getattr(cls.model, column) == val)
+                else:
+                    criteria.append(getattr(cls.model, column) == value)
+        return criteria
+
+    @classmethod
+    async def fetch_users_by_key(cls, offset: int = 0, limit: int = None, session: AsyncSession = None, **filter_by):
+        async with get_dao_session(session) as session:
+            query = select(cls.model.__table__.columns).filter(*cls.get_filter_criteria(**filter_by))
 
             # Пагинация
             if limit is not None:
@@ -1,12 +1,20 @@
 from fastapi import Depends, Request
 from jose import jwt, JWTError
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Sequence
 
 from app.config import settings
 from app.users.dao import UsersDAO
+from app.users.token_cache import get_token_cache, is_token_revoked
+from app.users.user_state import UserState, encode_user_for_redis, decode_hot_fields, COLD_USER_FIELDS
 from app.redis_init import get_redis
-from app.utils.data_processing_funcs import sanitize_dict_for_redis
+from app.utils.logger_init import logger
+from app.utils.data_processing_funcs import (
+    accrue_autoclicker_balance,
+    get_user_data_key,
+    get_user_cold_data_key,
+    migrate_legacy_user_data
+)
 from app.utils.users_init import add_user_data_to_redis
 from app.exceptions import (
     TokenExpiredException,
@@ -15,6 +23,9 @@ from app.exceptions import (
     UserIsNotPresentException
 )
 
+# поля, необходимые для досчета баланса пользователя с автокликером
+ACCRUAL_FIELDS = ("blocks_balance", "clicks_per_sec", "blocks_per_click", "last_update_time")
+
 
 def get_token(request: Request):
     token = request.cookies.get("poc_access_token")
@@ -27,55 +38,53 @@ async def get_user_data_from_redis(user_id: int) -> Optional[dict]:
     """
     Получает данные пользователя из Redis.
 
-    Последовательно проверяет две ноды Redis (определенные через теги)
-    и возвращает данные, если они найдены. Добавляет ключ `redis_tag` в словарь
-    для указания, с какой ноды были получены данные.
-
     Args:
         user_id (int): Идентификатор пользователя.
 
     Returns:
-        Optional[dict]: Словарь с данными пользователя и ключом `redis_tag`,
-                        либо None, если пользователь не найден.
+        Optional[dict]: Словарь с данными пользователя, либо None, если пользователь не найден.
+
+    Notes:
+        Если данных нет, но включен перенос ключей старой схемы (REDIS_LEGACY_KEYS_MIGRATION),
+        данные пользователя переносятся из старого ключа и читаются повторно.
     """
     redis_client = await get_redis()
+    user_data_key = get_user_data_key(user_id)
 
-    # Проверка первой ноды
-    user_data = await redis_client.hgetall(f"user_data:{settings.REDIS_NODE_TAG_1}:{user_id}")
+    user_data = await redis_client.hgetall(user_data_key)
     if user_data:
-        user_data["redis_tag"] = settings.REDIS_NODE_TAG_1
         return user_data
 
-    # Проверка второй ноды
-    user_data = await redis_client.hgetall(f"user_data:{settings.REDIS_NODE_TAG_2}:{user_id}")
-    if user_data:
-        user_data["redis_tag"] = settings.REDIS_NODE_TAG_2
-        return user_data
+    if settings.REDIS_LEGACY_KEYS_MIGRATION and await migrate_legacy_user_data(user_id, redis_client):
+        return await redis_client.hgetall(user_data_key) or None
 
     # Данные пользователя не найдены
     return None
 
 
-async def get_current_user(token: str = Depends(get_token)) -> dict:
+def decode_access_token(token: str) -> dict:
     """
-    Извлекает текущего пользователя на основе переданного JWT-токена.
+    Декодирует JWT-токен и проверяет срок его действия.
 
     Args:
-        token (str): JWT-токен, извлекаемый из заголовков запроса.
+        token (str): JWT-токен.
 
     Returns:
-        dict: Словарь с данными пользователя, извлечённый из Redis или базы данных.
+        dict: Payload токена.
 
     Raises:
         IncorrectTokenFormatException: Если формат токена некорректен или его невозможно декодировать.
         TokenExpiredException: Если срок действия токена истёк.
-        UserIsNotPresentException: Если пользователь не найден в базе данных.
 
     Notes:
-        - Проверяет срок действия токена и достаёт идентификатор пользователя из его payload.
-        - Если данные пользователя отсутствуют в Redis, они извлекаются из базы данных,
-          форматируются и сохраняются в Redis для последующего использования.
+        Payload проверенного токена сохраняется в кеше процесса (см. `TokenPayloadCache`)
+        до истечения срока действия токена, повторные запросы с тем же токеном не проверяют подпись.
     """
+    cache = get_token_cache()
+    payload = cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
@@ -84,16 +93,211 @@ async def get_current_user(token: str = Depends(get_token)) -> dict:
     expire: str = payload.get("exp")
     if (not expire) or (int(expire) < datetime.utcnow().timestamp()):
         raise TokenExpiredException
+    if payload.get("sub"):
+        cache.set(token, payload)
+    return payload
+
+
+async def get_current_user_id(token: str = Depends(get_token)) -> int:
+    """
+    Извлекает идентификатор текущего пользователя из JWT-токена, не загружая его данные.
+
+    Args:
+        token (str): JWT-токен, извлекаемый из заголовков запроса.
+
+    Returns:
+        int: Идентификатор пользователя.
+
+    Raises:
+        IncorrectTokenFormatException: Если формат токена некорректен или его невозможно декодировать.
+        TokenExpiredException: Если срок действия токена истёк или токен отозван.
+        UserIsNotPresentException: Если в токене нет идентификатора пользователя.
+
+    Notes:
+        Payload проверенного токена берется из кеша процесса, но отзыв токена (выход или удаление
+        пользователя в любом процессе приложения) проверяется в Redis при каждом запросе
+        (см. `is_token_revoked`).
+    """
+    payload = decode_access_token(token)
     user_id = int(payload.get("sub"))
     if not user_id:
         raise UserIsNotPresentException
+    if await is_token_revoked(token, user_id, await get_redis()):
+        raise TokenExpiredException
+    return user_id
+
+
+async def get_user_data(user_id: int) -> dict:
+    """
+    Получает данные пользователя из Redis, а при их отсутствии - из базы данных.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+
+    Returns:
+        dict: Словарь с данными пользователя.
+
+    Raises:
+        UserIsNotPresentException: Если пользователь не найден в базе данных.
 
+    Notes:
+        - Возвращаются только поля HOT_USER_FIELDS (и служебные поля хеша), остальные поля
+          можно получить через `get_user_fields`.
+        - Если данные пользователя отсутствуют в Redis, они извлекаются из базы данных,
+          форматируются и сохраняются в Redis для последующего использования.
+        - Баланс пользователя с автокликером досчитывается на момент запроса
+          (см. `accrue_autoclicker_balance`), фоновая задача лишь периодически
+          записывает его в Redis для таблицы лидеров.
+    """
     user_data = await get_user_data_from_redis(user_id)
     if not user_data:
         user = await UsersDAO.find_by_model_id(user_id)
         if not user:
             raise UserIsNotPresentException
-        user_data = sanitize_dict_for_redis(user)
+        user_data = encode_user_for_redis(user)
         await add_user_data_to_redis(user_data)
+        await cache_user_cold_data(user, await get_redis())
+
+    return accrue_autoclicker_balance(decode_hot_fields(user_data))
+
+
+async def load_users_data(users_ids: list[int]) -> list[int]:
+    """
+    Загружает в Redis данные пользователей, которых там нет (например, перед повторным применением кликов).
+
+    Args:
+        users_ids (list[int]): Идентификаторы пользователей.
+
+    Returns:
+        list[int]: Идентификаторы пользователей, чьи данные загружены. Пользователи,
+            которых нет в базе данных (удалены), пропускаются.
+    """
+    loaded_ids = []
+    for user_id in users_ids:
+        try:
+            await get_user_data(user_id)
+        except UserIsNotPresentException:
+            logger.warning(f"User {user_id} is not present, his clicks are skipped.")
+            continue
+        loaded_ids.append(user_id)
+    return loaded_ids
+
+
+async def get_current_user(user_id: int = Depends(get_current_user_id)) -> dict:
+    """
+    Извлекает текущего пользователя на основе переданного JWT-токена.
+
+    Args:
+        user_id (int): Идентификатор пользователя, извлечённый из JWT-токена.
+
+    Returns:
+        dict: Словарь с данными пользователя, извлечённый из Redis или базы данных.
+
+    Raises:
+        UserIsNotPresentException: Если пользователь не найден в базе данных.
+    """
+    return await get_user_data(user_id)
+
+
+async def cache_user_cold_data(user, redis_client) -> dict:
+    """
+    Сохраняет в Redis редко используемые поля пользователя (COLD_USER_FIELDS) на USER_COLD_DATA_TTL секунд.
+
+    Args:
+        user: Строка таблицы `users`.
+        redis_client: Клиент Redis для выполнения запросов.
+
+    Returns:
+        dict: Сохраненные поля в формате Redis.
+    """
+    cold_data = encode_user_for_redis(user, COLD_USER_FIELDS)
+    cold_data_key = get_user_cold_data_key(user["id"])
+    async with redis_client.pipeline() as pipe:
+        await pipe.hset(cold_data_key, mapping=cold_data)
+        await pipe.expire(cold_data_key, settings.USER_COLD_DATA_TTL)
+        await pipe.execute()
+    return cold_data
+
+
+async def load_user_cold_data(user_id: int, redis_client) -> dict:
+    """
+    Загружает редко используемые поля пользователя из базы данных и кеширует их в Redis.
+
+    Raises:
+        UserIsNotPresentException: Если пользователь не найден в базе данных.
+    """
+    user = await UsersDAO.find_by_model_id(user_id)
+    if not user:
+        raise UserIsNotPresentException
+    return await cache_user_cold_data(user, redis_client)
+
+
+async def get_user_fields(user_id: int, fields: Sequence[str]) -> dict:
+    """
+    Получает из Redis только указанные поля данных пользователя за один запрос.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        fields (Sequence[str]): Имена нужных полей.
+
+    Returns:
+        dict: Словарь с полем `id` и указанными полями пользователя. Значения преобразованы
+            по типам колонок модели `Users` (см. `UserState`), например `role` - UserRole.
+
+    Raises:
+        UserIsNotPresentException: Если пользователь не найден в базе данных.
+
+    Notes:
+        - Если запрошен `blocks_balance`, дополнительно читаются поля для его досчета
+          (см. `accrue_autoclicker_balance`), но в результат они попадают только если запрошены.
+        - Поля HOT_USER_FIELDS читаются из хеша пользователя, поля COLD_USER_FIELDS - из ключа
+          `get_user_cold_data_key`, оба ключа читаются одним пайплайном (у них один хеш-тег).
+        - Если данных нет в Redis, пользователь загружается целиком через `get_user_data`
+          (с переносом ключа старой схемы или загрузкой из базы данных), а редко используемые
+          поля - из базы данных (см. `load_user_cold_data`).
+    """
+    result_fields = list(dict.fromkeys(["id", *fields]))
+    hot_fields = [field for field in result_fields if field not in COLD_USER_FIELDS]
+    hot_fields += [
+        field for field in ACCRUAL_FIELDS if "blocks_balance" in fields and field not in hot_fields
+    ]
+    cold_fields = [field for field in result_fields if field in COLD_USER_FIELDS]
+
+    redis_client = await get_redis()
+    async with redis_client.pipeline() as pipe:
+        await pipe.hmget(get_user_data_key(user_id), hot_fields)
+        if cold_fields:
+            await pipe.hmget(get_user_cold_data_key(user_id), cold_fields)
+        results = await pipe.execute()
+
+    hot_values = results[0]
+    if hot_values[0] is None:
+        user_data = await get_user_data(user_id)
+    else:
+        user_data = decode_hot_fields(dict(zip(hot_fields, hot_values)))
+        if "blocks_balance" in fields:
+            user_data = accrue_autoclicker_balance(user_data)
+
+    if cold_fields:
+        # ключ хранит все поля COLD_USER_FIELDS (None записывается как ""), поэтому отсутствие поля - промах
+        cold_values = results[1]
+        if cold_values[0] is None:
+            user_data.update(await load_user_cold_data(user_id, redis_client))
+        else:
+            user_data.update(zip(cold_fields, cold_values))
+
+    state = UserState.from_redis(user_data)
+    return {field: getattr(state, field) for field in result_fields}
+
+
+def get_current_user_fields(*fields: str):
+    """
+    Создает зависимость, возвращающую только указанные поля текущего пользователя (и его `id`).
+
+    Пример:
+        current_user=Depends(get_current_user_fields("role"))
+    """
+    async def current_user_fields(user_id: int = Depends(get_current_user_id)) -> dict:
+        return await get_user_fields(user_id, fields)
 
-    return user_data
+    return current_user_fields
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Float, Enum, JSON, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Date, ForeignKey, Float, Enum, JSON, Boolean
 from sqlalchemy.orm import relationship
 import enum
 from random import randint
@@ -25,7 +25,7 @@ class Users(Base):
     registration_date = Column(Date, nullable=False)
     referral_link = Column(String, nullable=False)
     referer = Column(ForeignKey("users.id", ondelete="SET NULL"))
-    blocks_balance = Column(Float, default=0.000)  # Пересчитывать в Celery каждые 10 сек., промежуточные данные хранить в Redis, итоговые записывать в БД
+    blocks_balance = Column(BigInteger, default=0)  # В милли-блоках (тысячных долях блока), актуальное значение хранится в Redis
     clicks_per_sec = Column(Float, default=0.000)  # Пересчитывать каждый раз при покупке autoclicker
     blocks_per_click = Column(Float, default=0.001)  # Пересчитывать каждый раз при покупке multiplier
     improvements = Column(JSON, default=[])  # TODO удалить?
@@ -1,14 +1,35 @@
-from fastapi import APIRouter, Response, Depends, HTTPException, status
+from fastapi import APIRouter, Request, Response, Depends, HTTPException, Query, status
+from fastapi_cache.decorator import cache
 
 from app.config import settings
 from app.redis_init import get_redis
 from app.utils.logger_init import logger
-from app.utils.users_init import add_user_data_to_redis, get_top_100_users, add_top_100_users_to_redis
+from app.utils.users_init import (
+    add_user_data_to_redis,
+    get_autoclicker_partition,
+    get_autoclicker_index_key
+)
 from app.utils.mining_chance_init import get_mining_chance_singleton
-from app.utils.data_processing_funcs import get_user_data_tag_in_redis
+from app.utils.data_processing_funcs import (
+    get_user_data_key,
+    get_user_cold_data_key,
+    get_legacy_user_data_keys,
+    from_milli_blocks
+)
 from app.users.schemas import SUserAuth, SUserLogin, SRestorePassword
 from app.users.dao import UsersDAO
-from app.users.dependencies import get_current_user
+from app.users.user_state import encode_user_for_redis
+from app.database import get_session
+from app.users.token_cache import revoke_token, revoke_user_tokens
+from app.users.models import UserRole
+from app.users.dependencies import (
+    get_current_user_id,
+    get_current_user_fields,
+    get_user_fields,
+    decode_access_token
+)
+from app.utils.leaderboard_snapshot import get_leaderboard_snapshot, publish_leaderboard_snapshot
+from app.utils.leaderboard import get_user_rank, get_users_around, get_leaderboard_page, get_top_earned_users
 
 from app.users.auth import (
     add_new_user_to_db,
@@ -21,10 +42,12 @@ from app.tasks.tasks import (
     send_restore_password_to_email
 )
 from app.exceptions import (
+    PoCException,
     AccessDeniedException,
     ObjectNotFoundException,
     IncorrectEmailCodeException,
-    IncorrectEmailOrPasswordException
+    IncorrectEmailOrPasswordException,
+    BadRequestException
 )
 
 
@@ -35,26 +58,31 @@ router = APIRouter(
 
 
 @router.post("/register")
-async def register_user(response: Response, user_data: SUserAuth):
-    created_user = await add_new_user_to_db(user_data)
-    await login_user(response, user_data)
-    await add_user_data_to_redis(created_user)
+async def register_user(response: Response, user_data: SUserAuth, session=Depends(get_session)):
+    created_user = await add_new_user_to_db(user_data, session=session)
+    await login_user(response, user_data, session)
+    await add_user_data_to_redis(encode_user_for_redis(created_user))
     send_verify_code_to_email.delay(created_user['mail_confirm_code'], user_data.mail)
     logger.info(f"User {user_data.username} registered.")
 
 
 @router.post("/register/{referral_link}")  # TODO refferal_link - do it optional and delete first router?????
-async def register_ref_user(response: Response, user_data: SUserAuth, referral_link: str):
-    created_user = await add_new_user_to_db(user_data, referral_link)
-    await login_user(response, user_data)
-    await add_user_data_to_redis(created_user)
+async def register_ref_user(
+        response: Response,
+        user_data: SUserAuth,
+        referral_link: str,
+        session=Depends(get_session)
+):
+    created_user = await add_new_user_to_db(user_data, referral_link, session=session)
+    await login_user(response, user_data, session)
+    await add_user_data_to_redis(encode_user_for_redis(created_user))
     send_verify_code_to_email.delay(created_user['mail_confirm_code'], user_data.mail)
     logger.info(f"User {user_data.username} registered.")
 
 
 @router.post("/login")
-async def login_user(response: Response, user_data: SUserLogin):
-    user = await authenticate_user(user_data.mail, user_data.password)
+async def login_user(response: Response, user_data: SUserLogin, session=Depends(get_session)):
+    user = await authenticate_user(user_data.mail, user_data.password, session)
     if not user:
         raise IncorrectEmailOrPasswordException
     access_token = create_access_token({"sub": str(user.id)})
@@ -78,56 +106,148 @@ async def restore_password(user_data: SRestorePassword):
 
 # verify email
 @router.get("/verify/{mail_confirm_code}")
-async def verify_email(mail_confirm_code: int, current_user=Depends(get_current_user), redis=Depends(get_redis)):
-    if bool(current_user["is_confirm_mail"]):
+async def verify_email(
+        mail_confirm_code: int,
+        current_user=Depends(get_current_user_fields("is_confirm_mail", "mail_confirm_code")),
+        redis=Depends(get_redis)
+):
+    if current_user["is_confirm_mail"]:
         # возвращаем исключение для перенаправления на index.html
         raise HTTPException(status_code=status.HTTP_301_MOVED_PERMANENTLY)
-    if int(current_user["mail_confirm_code"]) != mail_confirm_code:
+    if current_user["mail_confirm_code"] != mail_confirm_code:
         raise IncorrectEmailCodeException
 
-    await UsersDAO.edit(int(current_user["id"]), is_confirm_mail=True)
-    await redis.hset(
-        f"user_data:{current_user['redis_tag']}:{current_user['id']}",
-        mapping={"is_confirm_mail": "True"}
-    )
+    await UsersDAO.edit(current_user["id"], is_confirm_mail=True)
+    # поле хранится в кеше редко используемых полей, он будет загружен из базы данных заново
+    await redis.delete(get_user_cold_data_key(current_user["id"]))
     return {"detail": "Email is verify"}
 
 
 @router.post("/logout")
-async def logout_user(response: Response):
+async def logout_user(request: Request, response: Response, redis=Depends(get_redis)):
+    token = request.cookies.get("poc_access_token")
+    if token:
+        try:
+            payload = decode_access_token(token)
+        except PoCException:
+            # недействительный токен отзывать не нужно
+            payload = None
+        if payload and payload.get("sub"):
+            await revoke_token(token, int(payload["sub"]), redis)
     response.delete_cookie("poc_access_token")
     return {"detail": "User logout"}
 
 
 @router.get("/me")
-async def get_me_info(current_user=Depends(get_current_user)):
+async def get_me_info(
+        current_user=Depends(get_current_user_fields(
+            "username", "mail", "blocks_balance", "clicks_per_sec", "blocks_per_click", "referral_link"
+        ))
+):
     singleton = get_mining_chance_singleton()
     mining_chance = singleton.get_value()
     return {
         "username": current_user["username"],
         "mail": current_user["mail"],
-        "blocks_balance": float(current_user["blocks_balance"]),
-        "clicks_per_sec": int(float(current_user["clicks_per_sec"])),
-        "blocks_per_click": float(current_user["blocks_per_click"]),
+        "blocks_balance": from_milli_blocks(current_user["blocks_balance"]),
+        "clicks_per_sec": int(current_user["clicks_per_sec"]),
+        "blocks_per_click": current_user["blocks_per_click"],
         "referral_link": current_user["referral_link"],
         "mining_chance": mining_chance
     }
 
 
 @router.get("/leaders")
-async def get_leaders(current_user=Depends(get_current_user)):
+async def get_leaders(request: Request, user_id: int = Depends(get_current_user_id)):
+    """
+    Возвращает таблицу лидеров {имя пользователя: баланс} по убыванию баланса.
+
+    Снимок таблицы лидеров создается фоновой задачей и хранится в памяти процесса уже
+    сериализованным, поэтому запрос не обращается к Redis. Если снимок не изменился
+    (заголовок If-None-Match совпадает с ETag), возвращается 304 Not Modified.
+    """
+    snapshot = get_leaderboard_snapshot()
+    if snapshot is None or snapshot.is_stale():
+        snapshot = await publish_leaderboard_snapshot()
+
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=snapshot.data, media_type="application/json", headers=headers)
+
+
+def leaderboard_page_key_builder(func, namespace: str = "", request=None, response=None, args=None, kwargs=None):
+    # страница таблицы лидеров одинакова для всех пользователей, поэтому пользователь не входит в ключ
+    kwargs = kwargs or {}
+    return f"{namespace}:{func.__module__}:{func.__name__}:{kwargs.get('page')}:{kwargs.get('size')}"
+
+
+def format_leaderboard_users(users: list[tuple[int, str, float]]) -> list[dict]:
+    return [
+        {"rank": rank, "username": username, "blocks_balance": balance}
+        for rank, username, balance in users
+    ]
+
+
+@router.get("/leaders/me")
+@cache(expire=settings.LEADERBOARD_CACHE_SECONDS)
+async def get_my_rank(user_id: int = Depends(get_current_user_id)):
+    """Возвращает место текущего пользователя в таблице лидеров (None, если его там еще нет)."""
+    user = await get_user_fields(user_id, ("username", "blocks_balance"))
+    redis_client = await get_redis()
+    rank = await get_user_rank(user["username"], redis_client)
+    return {"username": user["username"], "blocks_balance": from_milli_blocks(user["blocks_balance"]), "rank": rank}
+
+
+@router.get("/leaders/around-me")
+@cache(expire=settings.LEADERBOARD_CACHE_SECONDS)
+async def get_leaders_around_me(
+        count: int = Query(default=10, ge=1, le=50),
+        user_id: int = Depends(get_current_user_id)
+):
+    """Возвращает `count` пользователей выше и ниже текущего пользователя в таблице лидеров."""
+    user = await get_user_fields(user_id, ("username", "blocks_balance"))
+    redis_client = await get_redis()
+    users = await get_users_around(user["username"], count, redis_client)
+    if users is None:
+        raise ObjectNotFoundException
+    return format_leaderboard_users(users)
+
+
+@router.get("/leaders/page")
+@cache(expire=settings.LEADERBOARD_CACHE_SECONDS, key_builder=leaderboard_page_key_builder)
+async def get_leaders_page(
+        page: int = Query(default=1, ge=1),
+        size: int = Query(default=50, ge=1, le=100),
+        user_id: int = Depends(get_current_user_id)
+):
+    """Возвращает страницу таблицы лидеров с местами пользователей."""
+    offset = (page - 1) * size
+    if offset + size > settings.LEADERBOARD_PAGE_MAX_OFFSET:
+        raise BadRequestException
+    redis_client = await get_redis()
+    return format_leaderboard_users(await get_leaderboard_page(offset, size, redis_client))
+
+
+@router.get("/leaders/daily")
+@cache(expire=settings.LEADERBOARD_CACHE_SECONDS, key_builder=leaderboard_page_key_builder)
+async def get_daily_leaders(user_id: int = Depends(get_current_user_id)):
+    """Возвращает таблицу лидеров {имя пользователя: добыто блоков} за текущий день (UTC)."""
+    redis_client = await get_redis()
+    return dict(await get_top_earned_users(1, settings.LEADERBOARD_SNAPSHOT_SIZE, redis_client))
+
+
+@router.get("/leaders/weekly")
+@cache(expire=settings.LEADERBOARD_CACHE_SECONDS, key_builder=leaderboard_page_key_builder)
+async def get_weekly_leaders(user_id: int = Depends(get_current_user_id)):
+    """Возвращает таблицу лидеров {имя пользователя: добыто блоков} за последние 7 дней (UTC)."""
     redis_client = await get_redis()
-    if not await redis_client.exists(f"top_100:{settings.REDIS_NODE_TAG_3}"):
-        top_users = await get_top_100_users()
-        await add_top_100_users_to_redis(top_users)
-    else:
-        top_users = await redis_client.hgetall(f"top_100:{settings.REDIS_NODE_TAG_3}")
-    return top_users
+    return dict(await get_top_earned_users(7, settings.LEADERBOARD_SNAPSHOT_SIZE, redis_client))
 
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, current_user=Depends(get_current_user), redis=Depends(get_redis)):
-    if current_user["role"] != "admin":
+async def delete_user(user_id: int, current_user=Depends(get_current_user_fields("role")), redis=Depends(get_redis)):
+    if current_user["role"] != UserRole.admin:
         raise AccessDeniedException
 
     user = await UsersDAO.find_one_or_none(id=user_id)
@@ -135,7 +255,10 @@ async def delete_user(user_id: int, current_user=Depends(get_current_user), redi
         raise ObjectNotFoundException
 
     await UsersDAO.delete(user_id)
-    redis_tag = await get_user_data_tag_in_redis(user_id, redis)
-    if redis_tag:
-        await redis.delete(f"user_data:{redis_tag}:{user_id}")
+    await revoke_user_tokens(user_id, redis)
+    for user_data_key in [
+        get_user_data_key(user_id), get_user_cold_data_key(user_id), *get_legacy_user_data_keys(user_id)
+    ]:
+        await redis.delete(user_data_key)
+    await redis.zrem(get_autoclicker_index_key(get_autoclicker_partition(user_id)), user_id)
     return {"detail": "User deleted successfully"}
@@ -0,0 +1,127 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+
+# поле хеша отозванных токенов: отозваны все токены пользователя
+USER_REVOKED_FIELD = "user"
+
+
+def get_token_digest(token: str) -> bytes:
+    """Возвращает дайджест токена, под которым хранится его payload (сам токен в памяти не хранится)."""
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def get_revoked_tokens_key(user_id: int) -> str:
+    """
+    Возвращает ключ отозванных токенов пользователя в Redis.
+
+    Хеш содержит дайджесты токенов, отозванных при выходе пользователя, и поле USER_REVOKED_FIELD,
+    если отозваны все токены пользователя (пользователь удален). Хеш-тег ключа - идентификатор
+    пользователя, как у его данных (см. `get_user_data_key`).
+    """
+    return f"revoked_tokens:{{{user_id}}}"
+
+
+class TokenPayloadCache:
+    """
+    Ограниченный LRU-кеш проверенных payload JWT-токенов в памяти процесса.
+
+    Клиент отправляет запросы с одним и тем же токеном весь срок его жизни, поэтому
+    подпись и срок действия токена проверяются один раз, а затем payload берется из кеша
+    до наступления `exp` токена.
+
+    Attributes:
+        max_size (int): Максимальное количество токенов в кеше.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._payloads: OrderedDict[bytes, dict] = OrderedDict()
+        self._users_tokens: dict[int, set[bytes]] = {}
+
+    def get(self, token: str) -> Optional[dict]:
+        """Возвращает payload токена из кеша или None, если токена нет в кеше или срок его действия истёк."""
+        digest = get_token_digest(token)
+        payload = self._payloads.get(digest)
+        if payload is None:
+            return None
+        if int(payload["exp"]) < datetime.utcnow().timestamp():
+            self._remove(digest)
+            return None
+        self._payloads.move_to_end(digest)
+        return payload
+
+    def set(self, token: str, payload: dict) -> None:
+        """Сохраняет проверенный payload токена, вытесняя давно не использованные токены."""
+        if self.max_size <= 0:
+            return
+        digest = get_token_digest(token)
+        self._payloads[digest] = payload
+        self._payloads.move_to_end(digest)
+        self._users_tokens.setdefault(int(payload["sub"]), set()).add(digest)
+        while len(self._payloads) > self.max_size:
+            self._remove(next(iter(self._payloads)))
+
+    def invalidate_token(self, token: str) -> None:
+        """Удаляет токен из кеша (например, при выходе пользователя)."""
+        self._remove(get_token_digest(token))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Удаляет из кеша все токены пользователя (например, при его удалении)."""
+        for digest in self._users_tokens.pop(int(user_id), set()):
+            self._payloads.pop(digest, None)
+
+    def _remove(self, digest: bytes) -> None:
+        payload = self._payloads.pop(digest, None)
+        if payload is None:
+            return
+        user_tokens = self._users_tokens.get(int(payload["sub"]))
+        if user_tokens is not None:
+            user_tokens.discard(digest)
+            if not user_tokens:
+                del self._users_tokens[int(payload["sub"])]
+
+
+token_cache = TokenPayloadCache(settings.JWT_CACHE_SIZE)
+
+
+def get_token_cache() -> TokenPayloadCache:
+    return token_cache
+
+
+async def revoke_token(token: str, user_id: int, redis_client) -> None:
+    """
+    Отзывает токен во всех процессах приложения (например, при выходе пользователя).
+
+    Дайджест токена записывается в хеш отозванных токенов пользователя на время жизни токена,
+    после которого токен отклоняется проверкой срока действия.
+    """
+    get_token_cache().invalidate_token(token)
+    key = get_revoked_tokens_key(user_id)
+    await redis_client.hset(key, get_token_digest(token).hex(), 1)
+    await redis_client.expire(key, settings.JWT_TOKEN_DELAY_MINUTES * 60)
+
+
+async def revoke_user_tokens(user_id: int, redis_client) -> None:
+    """Отзывает все токены пользователя во всех процессах приложения (например, при его удалении)."""
+    get_token_cache().invalidate_user(user_id)
+    key = get_revoked_tokens_key(user_id)
+    await redis_client.hset(key, USER_REVOKED_FIELD, 1)
+    await redis_client.expire(key, settings.JWT_TOKEN_DELAY_MINUTES * 60)
+
+
+async def is_token_revoked(token: str, user_id: int, redis_client) -> bool:
+    """
+    Проверяет одной командой HMGET, отозван ли токен или все токены пользователя.
+
+    Отозванный токен удаляется из кеша процесса.
+    """
+    revoked = await redis_client.hmget(
+        get_revoked_tokens_key(user_id), [get_token_digest(token).hex(), USER_REVOKED_FIELD]
+    )
+    if any(revoked):
+        get_token_cache().invalidate_token(token)
+        return True
+    return False
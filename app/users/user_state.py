@@ -0,0 +1,170 @@
+"""
+Состояние пользователя в Redis и преобразование его полей между Redis и базой данных.
+
+Типы полей берутся из колонок модели `Users`, поэтому кодеки не угадывают тип значения
+по его содержимому, а сразу применяют нужное преобразование. Для частых запросов есть
+быстрый путь `decode_hot_fields`, преобразующий только числовые поля баланса.
+
+В хеше пользователя в Redis хранятся только поля HOT_USER_FIELDS, остальные поля
+(COLD_USER_FIELDS) загружаются из базы данных по запросу и кешируются в отдельном ключе.
+"""
+import json
+from datetime import date
+from typing import Any, Callable, Mapping, Optional, Sequence
+
+from sqlalchemy import Boolean, Date, Enum, Float, Integer, JSON
+
+from app.users.models import Users
+
+# числовые поля, которые нужны почти каждому запросу (баланс и его досчет для автокликера)
+HOT_FIELDS = {
+    "blocks_balance": int,
+    "clicks_per_sec": float,
+    "blocks_per_click": float,
+    "last_update_time": float,
+}
+
+
+def _decode_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        # "last_update_time" после досчета баланса хранится с дробной частью
+        return int(float(value))
+
+
+def _decode_json(value: str) -> Any:
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def _encode_json(value: Any) -> str:
+    return json.dumps(value)
+
+
+def _encode_date(value: date) -> str:
+    return value.strftime('%Y-%m-%d')
+
+
+def _decode_date(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def _build_field_codecs(columns) -> tuple[dict[str, Callable], dict[str, Callable]]:
+    """
+    Создает кодеки полей пользователя по типам колонок модели.
+
+    Returns:
+        tuple: Словари {поле: функция} для записи в Redis и для чтения из Redis.
+    """
+    encoders, decoders = {}, {}
+    for column in columns:
+        column_type = column.type
+        if isinstance(column_type, Boolean):
+            encoders[column.key], decoders[column.key] = str, lambda v: v == "True"
+        elif isinstance(column_type, Integer) or column.foreign_keys:
+            # тип колонки с внешним ключом без явного типа выводится из колонки `id`
+            encoders[column.key], decoders[column.key] = int, _decode_int
+        elif isinstance(column_type, Float):
+            encoders[column.key], decoders[column.key] = float, float
+        elif isinstance(column_type, Date):
+            encoders[column.key], decoders[column.key] = _encode_date, _decode_date
+        elif isinstance(column_type, Enum) and column_type.enum_class is not None:
+            encoders[column.key] = lambda v: v.value if hasattr(v, "value") else v
+            decoders[column.key] = column_type.enum_class
+        elif isinstance(column_type, JSON):
+            encoders[column.key], decoders[column.key] = _encode_json, _decode_json
+        else:
+            encoders[column.key], decoders[column.key] = str, str
+    return encoders, decoders
+
+
+USER_FIELDS = tuple(Users.__table__.columns.keys())
+FIELD_ENCODERS, FIELD_DECODERS = _build_field_codecs(Users.__table__.columns)
+
+# поля хеша пользователя в Redis (`user_data:{<id>}`), нужные обработке кликов, автокликеру и таблице лидеров.
+# Короткие значения хранятся в компактном представлении хеша (listpack)
+HOT_USER_FIELDS = ("id", "username", "blocks_balance", "clicks_per_sec", "blocks_per_click", "last_update_time", "role")
+# остальные поля кешируются отдельно (`user_cold:{<id>}`) с ограниченным временем хранения.
+# Хеш пароля в Redis не хранится
+COLD_USER_FIELDS = tuple(
+    field for field in USER_FIELDS if field not in HOT_USER_FIELDS and field != "hash_password"
+)
+
+
+class UserState:
+    """
+    Данные пользователя с известными типами полей (по одному атрибуту на колонку модели `Users`).
+
+    Отсутствующие поля и пустые значения Redis ("") равны None.
+    Служебные поля хеша в Redis (например, счетчики "drop_skip:*") в состояние не попадают.
+    """
+    __slots__ = USER_FIELDS
+
+    def __init__(self, **fields):
+        for field in USER_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_redis(cls, user_data: Mapping[str, str]) -> "UserState":
+        """Создает состояние из хеша пользователя в Redis."""
+        state = cls.__new__(cls)
+        for field in USER_FIELDS:
+            value = user_data.get(field)
+            if value is None or value == "":
+                setattr(state, field, None)
+            elif isinstance(value, str):
+                setattr(state, field, FIELD_DECODERS[field](value))
+            elif FIELD_DECODERS[field] is _decode_int:
+                # значение уже преобразовано в число (например, `decode_hot_fields`), но может быть дробным
+                setattr(state, field, int(value))
+            else:
+                setattr(state, field, value)
+        return state
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> "UserState":
+        """Создает состояние из строки таблицы `users` (результата `mappings()`)."""
+        return cls(**row)
+
+    def to_redis(self, fields: Sequence[str] = HOT_USER_FIELDS) -> dict:
+        """Возвращает указанные поля для записи в Redis, None записывается как пустая строка."""
+        result = {}
+        for field in fields:
+            value = getattr(self, field)
+            result[field] = "" if value is None else FIELD_ENCODERS[field](value)
+        return result
+
+
+def encode_user_for_redis(row: Mapping[str, Any], fields: Sequence[str] = HOT_USER_FIELDS) -> dict:
+    """Преобразует строку таблицы `users` в словарь с указанными полями для записи в Redis."""
+    return UserState.from_row(row).to_redis(fields)
+
+
+def decode_hot_fields(user_data: Optional[dict]) -> Optional[dict]:
+    """
+    Быстрый путь: преобразует в числа только поля HOT_FIELDS, остальные поля остаются строками.
+
+    Словарь изменяется на месте и возвращается для удобства.
+    """
+    if not user_data:
+        return user_data
+    for field, decoder in HOT_FIELDS.items():
+        value = user_data.get(field)
+        if isinstance(value, str):
+            user_data[field] = decoder(value) if value else None
+    return user_data
+
+
+def drop_cold_fields(user_data: dict) -> dict:
+    """
+    Удаляет из данных пользователя поля, которые не хранятся в хеше пользователя в Redis.
+
+    Служебные поля хеша (например, счетчики "drop_skip:*") сохраняются. Словарь изменяется на месте.
+    """
+    for field in USER_FIELDS:
+        if field not in HOT_USER_FIELDS:
+            user_data.pop(field, None)
+    return user_data
@@ -1,12 +1,13 @@
 import json
 from typing import Optional, Type
-from datetime import datetime, date
+from datetime import datetime
 from fastapi import UploadFile, HTTPException
 from pydantic import BaseModel, ValidationError
 
 from app.utils.logger_init import logger
-from app.users.models import UserRole
 from app.config import settings
+from app.redis_helpers.functions import call_function
+from app.users.user_state import drop_cold_fields
 from app.exceptions import (
     FilepathNotSpecifiedException,
     ObjectNotFoundException,
@@ -14,73 +15,165 @@ from app.exceptions import (
 )
 
 
-def sanitize_dict_for_redis(user_data: dict) -> dict:
-    """Заменяет НЕ поддерживаемые в redis типы данных, из значений словаря, на поддерживаемые."""
-    return {
-        k: (
-            v.strftime('%Y-%m-%d') if isinstance(v, date) else
-            # add "v.strftime('%Y-%m-%d %H:%M:%S') if isinstance(v, datetime) else" for last_update_time
-            v.value if isinstance(v, UserRole) else
-            str(v) if isinstance(v, bool) else
-            str(v) if isinstance(v, list) else
-            (v if v is not None else '')
-        )
-        for k, v in user_data.items()
-    }
-
-
-def restore_types_from_redis(user_data: dict) -> dict:
-    """Восстанавливает оригинальные типы данных после получения из Redis."""
-    return {
-        k: (
-            None if v == "" else
-            True if v == 'True' else
-            False if v == 'False' else
-            int(v) if isinstance(v, str) and v.isdigit() else
-            float(v) if isinstance(v, str) and is_float(v) else
-            datetime.strptime(v, '%Y-%m-%d') if isinstance(v, str) and is_date(v) else
-            v
-        )
-        for k, v in user_data.items()
-    }
-
-
-def is_float(value: str) -> bool:
-    """Проверяет, можно ли преобразовать строку в float."""
-    try:
-        float(value)
-        return True
-    except ValueError:
-        return False
+# балансы хранятся целым числом тысячных долей блока (милли-блоков): в Redis, таблице лидеров и базе данных
+BALANCE_SCALE = 1000
 
 
-def is_date(value: str) -> bool:
-    """Проверяет, можно ли преобразовать строку в дату."""
-    try:
-        datetime.strptime(value, '%Y-%m-%d')
-        return True
-    except ValueError:
-        return False
+def to_milli_blocks(blocks) -> int:
+    """Переводит количество блоков (например, цену улучшения) в милли-блоки."""
+    return int(round(float(blocks) * BALANCE_SCALE))
+
 
+def from_milli_blocks(milli_blocks) -> Optional[float]:
+    """Переводит баланс в милли-блоках в количество блоков для ответа клиенту."""
+    if milli_blocks is None or milli_blocks == "":
+        return None
+    return int(float(milli_blocks)) / BALANCE_SCALE
 
-async def get_user_data_tag_in_redis(user_id: int, redis_client) -> Optional[str]:
+
+def accrue_autoclicker_balance(user_data: dict, current_time: float = None) -> dict:
     """
-    Проверяет, какой из тегов Redis содержит данные пользователя.
+    Начисляет пользователю блоки за работу автокликера с момента последнего обновления.
+
+    Args:
+        user_data (dict): Данные пользователя из Redis или базы данных.
+        current_time (float, optional): Время начисления в секундах от начала эпохи. По умолчанию - текущее.
+
+    Returns:
+        dict: Те же данные пользователя с пересчитанными "blocks_balance" и "last_update_time".
+
+    Notes:
+        Баланс (в милли-блоках) считается по формуле
+        balance + round(clicks_per_sec * blocks_per_click * (current_time - last_update_time) * BALANCE_SCALE)
+        и не записывается в Redis. Поэтому "last_update_time" в словаре тоже сдвигается на current_time,
+        чтобы при последующей записи этих данных блоки не были начислены повторно.
+    """
+    clicks_per_sec = float(user_data.get("clicks_per_sec") or 0)
+    if not clicks_per_sec:
+        return user_data
+
+    if current_time is None:
+        current_time = datetime.now().timestamp()
+    last_update_time = float(user_data.get("last_update_time") or current_time)
+    timedelta = max(current_time - last_update_time, 0)
+
+    user_data["blocks_balance"] = int(user_data.get("blocks_balance") or 0) + to_milli_blocks(
+        clicks_per_sec * timedelta * float(user_data["blocks_per_click"])
+    )
+    user_data["last_update_time"] = current_time
+    return user_data
+
+
+def get_user_data_key(user_id) -> str:
+    """
+    Возвращает ключ данных пользователя в Redis.
+
+    Хеш-тег ключа - идентификатор пользователя, поэтому данные пользователей
+    распределяются по всем слотам (и всем нодам) кластера.
+    """
+    return f"user_data:{{{user_id}}}"
+
+
+def get_user_cold_data_key(user_id) -> str:
+    """
+    Возвращает ключ редко используемых полей пользователя в Redis (почта, реферальная ссылка и т.д.).
+
+    Хеш-тег тот же, что у `get_user_data_key`, поэтому оба ключа читаются одним пайплайном с одной ноды.
+    """
+    return f"user_cold:{{{user_id}}}"
+
+
+def get_legacy_user_data_keys(user_id) -> list[str]:
+    """Возвращает ключи данных пользователя в старой схеме, где все пользователи хранились под двумя тегами."""
+    return [f"user_data:{redis_tag}:{user_id}" for redis_tag in [settings.REDIS_NODE_TAG_1, settings.REDIS_NODE_TAG_2]]
+
+
+async def migrate_legacy_user_data(user_id, redis_client) -> bool:
+    """
+    Переносит данные пользователя из ключа старой схемы в ключ `get_user_data_key`.
+
+    Args:
+        user_id: ID пользователя.
+        redis_client: Клиент Redis для выполнения запросов.
+
+    Returns:
+        bool: True, если данные пользователя найдены (перенесены или уже были в новом ключе).
+
+    Notes:
+        Время хранения ключа сохраняется. Если данные уже есть в новом ключе,
+        старый ключ просто удаляется, чтобы не перезаписать более свежие данные.
+        Переносятся только поля HOT_USER_FIELDS (и служебные поля), остальные поля
+        загружаются из базы данных при необходимости.
+    """
+    user_data_key = get_user_data_key(user_id)
+    legacy_keys = get_legacy_user_data_keys(user_id)
+    # оба старых ключа проверяются одним пайплайном, а не последовательными запросами
+    async with redis_client.pipeline() as pipe:
+        for legacy_key in legacy_keys:
+            await pipe.hgetall(legacy_key)
+        legacy_users_data = await pipe.execute()
+
+    migrated = False
+    for legacy_key, user_data in zip(legacy_keys, legacy_users_data):
+        if not user_data:
+            continue
+
+        if not migrated and not await redis_client.exists(user_data_key):
+            ttl = await redis_client.ttl(legacy_key)
+            user_data.pop("redis_tag", None)
+            await redis_client.hset(user_data_key, mapping=drop_cold_fields(user_data))
+            if ttl > 0:
+                await redis_client.expire(user_data_key, ttl)
+        await redis_client.delete(legacy_key)
+        migrated = True
+    return migrated
+
+
+async def get_user_data_key_in_redis(user_id: int, redis_client) -> Optional[str]:
+    """
+    Проверяет, есть ли данные пользователя в Redis.
 
     Args:
         user_id (int): ID пользователя для поиска данных.
         redis_client: Клиент Redis для выполнения запросов.
 
     Returns:
-        Optional[str]: Тег Redis, содержащий данные пользователя, или None, если данные не найдены.
+        Optional[str]: Ключ Redis с данными пользователя или None, если данные не найдены.
+
+    Notes:
+        Если включен перенос ключей старой схемы (REDIS_LEGACY_KEYS_MIGRATION), данные
+        пользователя из старого ключа переносятся в новый при первом обращении.
     """
-    for redis_tag in [settings.REDIS_NODE_TAG_1, settings.REDIS_NODE_TAG_2]:
-        key = f"user_data:{redis_tag}:{user_id}"
-        if await redis_client.exists(key):
-            return redis_tag
+    user_data_key = get_user_data_key(user_id)
+    if await redis_client.exists(user_data_key):
+        return user_data_key
+    if settings.REDIS_LEGACY_KEYS_MIGRATION and await migrate_legacy_user_data(user_id, redis_client):
+        return user_data_key
     return None
 
 
+async def acquire_lease(lease_key: str, owner: str, lease_ms: int, redis_client) -> bool:
+    """
+    Пытается взять аренду (lease) в Redis, чтобы работу выполнял только один обработчик.
+
+    Args:
+        lease_key (str): Ключ аренды.
+        owner (str): Уникальный идентификатор владельца аренды.
+        lease_ms (int): Время аренды в миллисекундах, по истечении которого она освобождается
+            автоматически (если владелец упал).
+        redis_client: Клиент Redis для выполнения запросов.
+
+    Returns:
+        bool: True, если аренда получена.
+    """
+    return bool(await redis_client.set(lease_key, owner, nx=True, px=lease_ms))
+
+
+async def release_lease(lease_key: str, owner: str, redis_client) -> None:
+    """Освобождает аренду, если она всё ещё принадлежит владельцу."""
+    await call_function(redis_client, "release_lease", keys=[lease_key], args=[owner])
+
+
 def log_execution_time_async(func):
     """
     Декоратор для логирования времени выполнения функции.
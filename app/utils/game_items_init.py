@@ -3,6 +3,7 @@ from app.utils.logger_init import logger
 from app.config import settings
 from app.redis_init import get_redis
 from app.boosts.dao import ImprovementsDAO
+from app.utils.items_drop import reset_items_drop_table
 from app.game_data.game_entity_models import GameItem, get_items_registry
 
 
@@ -56,6 +57,7 @@ async def init_game_items(items_data: dict = None) -> None:
         for boost_name, boost_values in items_data.items():
             boost = GameItem(boost_name, **boost_values)
             game_items_registry.add_entity(boost_name, boost)
+        reset_items_drop_table()
         logger.info("Game items create successful.")
     except Exception as err:
         logger.error(f"{err}")
@@ -0,0 +1,261 @@
+import json
+import numpy as np
+from typing import Optional
+
+from app.config import settings
+from app.redis_init import get_redis_pubsub
+from app.redis_helpers.functions import call_function
+from app.utils.logger_init import logger
+from app.tasks.tasks import add_items_to_db
+from app.game_data.game_entity_models import GameItemsRegistry, get_items_registry
+
+rng = np.random.default_rng()
+MAX_DROP_SKIP = 2 ** 53  # значение счетчика для предметов, которые не могут выпасть
+ITEMS_DROP_CHANNEL = "items_drop_updates"
+
+
+class ItemsDropTable:
+    """
+    Таблица игровых предметов в виде массивов NumPy для пакетного подсчета выпавших предметов.
+
+    Attributes:
+        item_keys (list[str]): Названия предметов, порядок совпадает с порядком элементов массивов.
+        drop_chances (np.ndarray): Шанс выпадения каждого предмета за один клик.
+        maximum_amounts (np.ndarray): Максимальное количество каждого предмета в игре.
+        image_ids (list[int]): Идентификаторы изображений предметов.
+    """
+    def __init__(self, items_registry: GameItemsRegistry):
+        items = items_registry.get_all_entities()
+        self.item_keys: list[str] = list(items.keys())
+        self.drop_chances = np.array(
+            [float(item.get_value("drop_chance")) for item in items.values()], dtype=np.float64
+        )
+        self.maximum_amounts = np.array(
+            [int(item.get_value("maximum_amount")) for item in items.values()], dtype=np.int64
+        )
+        self.image_ids: list[int] = [item.get_value("image_id") for item in items.values()]
+
+    def roll(self, users_clicks: np.ndarray, current_quantities: np.ndarray) -> np.ndarray:
+        """
+        Подсчитывает выпавшие предметы для группы пользователей одним вызовом генератора.
+
+        Args:
+            users_clicks (np.ndarray): Количество кликов каждого пользователя.
+            current_quantities (np.ndarray): Количество уже выпавших экземпляров каждого предмета.
+
+        Returns:
+            np.ndarray: Матрица пользователи × предметы с количеством выпавших предметов.
+
+        Notes:
+            Если выпавших предметов больше, чем осталось в игре, они достаются пользователям
+            в порядке следования, остальным - ничего.
+        """
+        remaining = np.maximum(self.maximum_amounts - current_quantities, 0)
+        won = rng.binomial(users_clicks[:, None], self.drop_chances[None, :])
+
+        # ограничиваем выпавшие предметы оставшимся в игре количеством
+        cumulative_won = np.minimum(np.cumsum(won, axis=0), remaining[None, :])
+        return np.diff(cumulative_won, axis=0, prepend=0)
+
+
+items_drop_table: Optional[ItemsDropTable] = None
+
+
+async def get_items_drop_table() -> ItemsDropTable:
+    """Возвращает таблицу игровых предметов, создавая её из реестра при первом обращении."""
+    global items_drop_table
+    if items_drop_table is None:
+        items_drop_table = ItemsDropTable(await get_items_registry())
+    return items_drop_table
+
+
+def reset_items_drop_table() -> None:
+    """Сбрасывает таблицу игровых предметов, чтобы она была пересоздана из обновлённого реестра."""
+    global items_drop_table
+    items_drop_table = None
+
+
+async def publish_items_won(users_won: dict[int, int]) -> None:
+    """
+    Сообщает всем процессам приложения о выпавших пользователям предметах через канал ITEMS_DROP_CHANNEL
+    (процессы отправляют сообщение подключенным по WebSocket пользователям, см. `app.clicks.ws_updates`).
+
+    Args:
+        users_won (dict[int, int]): Количество выпавших предметов для каждого пользователя.
+    """
+    try:
+        pubsub_client = await get_redis_pubsub()
+        for user_id, items_won in users_won.items():
+            await pubsub_client.publish(
+                ITEMS_DROP_CHANNEL, json.dumps({"user_id": int(user_id), "items_won": int(items_won)})
+            )
+    except Exception as err:
+        # выпавшие предметы уже начислены, пользователь увидит их при следующем запросе
+        logger.error(f"Ошибка публикации выпавших предметов: {err}")
+
+
+async def roll_items_for_users(users_clicks: dict[int, int], redis_client) -> dict[int, int]:
+    """
+    Подсчитывает выпавшие игровые предметы для группы пользователей и обновляет их количество в Redis.
+
+    Args:
+        users_clicks (dict[int, int]): Словарь, где ключи - идентификаторы пользователей,
+            значения - количество совершённых ими кликов.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        dict[int, int]: Общее количество выпавших предметов для каждого пользователя, которому они выпали.
+
+    Notes:
+        - Количество предметов читается из Redis одной командой HMGET, выпавшие предметы
+          для всех пользователей и предметов считаются одним вызовом `ItemsDropTable.roll`.
+        - Счетчики предметов увеличиваются одним пакетом команд HINCRBY.
+        - Добавление предметов в базу данных происходит асинхронно.
+        - О выпавших предметах сообщается всем процессам приложения (см. `publish_items_won`).
+    """
+    table = await get_items_drop_table()
+    if not users_clicks or not table.item_keys:
+        return {}
+
+    quantities_key = f"item_quantities:{settings.REDIS_NODE_TAG_1}"
+    current_quantities = np.array(
+        [int(quantity or 0) for quantity in await redis_client.hmget(quantities_key, table.item_keys)],
+        dtype=np.int64
+    )
+    users_ids = list(users_clicks.keys())
+    clicks = np.array([int(users_clicks[user_id]) for user_id in users_ids], dtype=np.int64)
+
+    won = table.roll(clicks, current_quantities)
+    if not won.any():
+        return {}
+
+    won_per_item = won.sum(axis=0)
+    async with redis_client.pipeline() as pipe:
+        for item_index in np.flatnonzero(won_per_item):
+            await pipe.hincrby(quantities_key, table.item_keys[item_index], int(won_per_item[item_index]))
+        await pipe.execute()
+
+    users_won = {}
+    for user_index, item_index in zip(*np.nonzero(won)):
+        user_id = users_ids[user_index]
+        won_items = int(won[user_index, item_index])
+        users_won[user_id] = users_won.get(user_id, 0) + won_items
+        add_items_to_db.delay(
+            user_id=user_id,
+            item_key=table.item_keys[item_index],
+            items_count=won_items,
+            image_id=table.image_ids[item_index]
+        )
+    await publish_items_won(users_won)
+    return users_won
+
+
+def sample_drops_after_skip(drop_chance: float, clicks_after_drop: int, drops: int) -> tuple[int, int]:
+    """
+    Досчитывает выпадения предмета после истечения счетчика кликов до следующего выпадения
+    и разыгрывает новое значение счетчика.
+
+    Args:
+        drop_chance (float): Шанс выпадения предмета за один клик.
+        clicks_after_drop (int): Количество кликов, совершённых после последнего выпадения
+            (или всех кликов, если счетчик еще не был задан).
+        drops (int): Количество уже выпавших предметов.
+
+    Returns:
+        tuple[int, int]: Количество выпавших предметов и количество кликов до следующего выпадения.
+
+    Notes:
+        Число кликов до выпадения имеет геометрическое распределение, поэтому математическое
+        ожидание количества выпавших предметов совпадает с биномиальным розыгрышем на каждый клик.
+    """
+    if drop_chance <= 0:
+        return drops, MAX_DROP_SKIP
+    while True:
+        skip = int(rng.geometric(min(drop_chance, 1.0)))
+        if skip > clicks_after_drop:
+            return drops, skip - clicks_after_drop
+        drops += 1
+        clicks_after_drop -= skip
+
+
+async def resolve_expired_drop_skips(
+        user_id: int,
+        user_data_key: str,
+        drop_claim: str,
+        expired_skips: list[str],
+        redis_client
+) -> int:
+    """
+    Обрабатывает истекшие (или еще не заданные) счетчики кликов до выпадения предметов пользователя.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        user_data_key (str): Ключ данных пользователя в Redis.
+        drop_claim (str): Метка заявки на счетчики, которую вернул lua-скрипт `apply_clicks_script`.
+        expired_skips (list[str]): Плоский список троек (предмет, клики после выпадения,
+            количество выпавших предметов), который возвращает lua-скрипт `apply_clicks_script`.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        int: Общее количество выпавших пользователю предметов.
+
+    Notes:
+        - Новые значения счетчиков записываются одним вызовом `set_drop_skips_script`, только если
+          счетчики все еще заявлены этим вызовом. Предметы начисляются только по записанным счетчикам,
+          поэтому одно выпадение не начисляется дважды при одновременной обработке кликов.
+        - Если выпавших предметов больше, чем осталось в игре, пользователь получает только оставшиеся.
+        - О выпавших предметах сообщается всем процессам приложения (см. `publish_items_won`).
+    """
+    table = await get_items_drop_table()
+    items_indexes = {item_key: index for index, item_key in enumerate(table.item_keys)}
+    new_skips = {}
+    items_won = {}
+
+    for i in range(0, len(expired_skips), 3):
+        item_key = expired_skips[i]
+        if item_key not in items_indexes:
+            continue
+        drop_chance = float(table.drop_chances[items_indexes[item_key]])
+        drops, next_skip = sample_drops_after_skip(
+            drop_chance, int(expired_skips[i + 1]), int(expired_skips[i + 2])
+        )
+        new_skips[f"drop_skip:{item_key}"] = next_skip
+        if drops:
+            items_won[item_key] = drops
+
+    if not new_skips:
+        return 0
+    args = [drop_claim]
+    for field, next_skip in new_skips.items():
+        args.extend((field, next_skip))
+    written = await call_function(redis_client, "set_drop_skips", keys=[user_data_key], args=args)
+    written = set(written or [])
+    items_won = {
+        item_key: drops for item_key, drops in items_won.items() if f"drop_skip:{item_key}" in written
+    }
+    if not items_won:
+        return 0
+
+    quantities_key = f"item_quantities:{settings.REDIS_NODE_TAG_1}"
+    won_keys = list(items_won.keys())
+    current_quantities = await redis_client.hmget(quantities_key, won_keys)
+
+    total_won = 0
+    for item_key, current_quantity in zip(won_keys, current_quantities):
+        item_index = items_indexes[item_key]
+        remaining = int(table.maximum_amounts[item_index]) - int(current_quantity or 0)
+        won_items = min(items_won[item_key], max(remaining, 0))
+        if not won_items:
+            continue
+
+        await redis_client.hincrby(quantities_key, item_key, won_items)
+        total_won += won_items
+        add_items_to_db.delay(
+            user_id=user_id,
+            item_key=item_key,
+            items_count=won_items,
+            image_id=table.image_ids[item_index]
+        )
+    if total_won:
+        await publish_items_won({user_id: total_won})
+    return total_won
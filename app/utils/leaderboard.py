@@ -0,0 +1,336 @@
+import heapq
+import zlib
+from typing import Optional
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.redis_helpers.functions import call_function, call_functions_pipeline
+from app.utils.data_processing_funcs import from_milli_blocks
+
+
+def get_leaderboard_shard(username: str) -> int:
+    """Возвращает номер шарда таблицы лидеров, в котором хранится баланс пользователя."""
+    return zlib.crc32(str(username).encode("utf-8")) % settings.LEADERBOARD_SHARDS
+
+
+def get_leaderboard_key(shard: int) -> str:
+    """Возвращает ключ ZSET шарда таблицы лидеров. У каждого шарда свой хеш-тег."""
+    return f"users_balances:{{lb{shard}}}"
+
+
+def get_leaderboard_keys() -> list[str]:
+    """Возвращает ключи всех шардов таблицы лидеров."""
+    return [get_leaderboard_key(shard) for shard in range(settings.LEADERBOARD_SHARDS)]
+
+
+def get_leaderboard_total_key(shard: int) -> str:
+    """Возвращает ключ счетчика суммы балансов шарда таблицы лидеров (в том же слоте, что и шард)."""
+    return f"users_balances_total:{{lb{shard}}}"
+
+
+def get_earned_key(shard: int, day: datetime) -> str:
+    """Возвращает ключ ZSET блоков, добытых пользователями шарда за день (UTC)."""
+    return f"users_earned:{{lb{shard}}}:{day.strftime('%Y%m%d')}"
+
+
+def get_shard_keys(shard: int, track_earned: bool) -> list[str]:
+    """Возвращает ключи шарда, передаваемые функции "set_users_balances"."""
+    keys = [get_leaderboard_key(shard), get_leaderboard_total_key(shard)]
+    if track_earned:
+        keys.append(get_earned_key(shard, datetime.utcnow()))
+    return keys
+
+
+async def leaderboard_exists(redis_client) -> bool:
+    """Проверяет, загружены ли балансы пользователей в таблицу лидеров."""
+    return bool(await redis_client.exists(*get_leaderboard_keys()))
+
+
+async def set_user_balance(username: str, balance: int, redis_client, earned: int = 0) -> None:
+    """
+    Записывает баланс пользователя (в милли-блоках) в его шард таблицы лидеров.
+
+    Начисленные пользователю милли-блоки `earned` учитываются в таблицах лидеров за день и неделю.
+    """
+    await call_function(
+        redis_client,
+        "set_users_balances",
+        keys=get_shard_keys(get_leaderboard_shard(username), int(earned) > 0),
+        args=[settings.LEADERBOARD_EARNED_TTL, username, balance, int(earned)]
+    )
+
+
+async def set_users_balances(balances: dict, redis_client, earned: dict = None) -> None:
+    """
+    Записывает балансы группы пользователей в таблицу лидеров.
+
+    Args:
+        balances (dict): Словарь, где ключи - имена пользователей, значения - их балансы в милли-блоках.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+        earned (dict, optional): Начисленные пользователям милли-блоки {имя пользователя: милли-блоки}
+            для таблиц лидеров за день и неделю. None - при загрузке балансов из базы данных.
+
+    Notes:
+        Балансы группируются по шардам, для каждого шарда функция "set_users_balances" вызывается
+        один раз, все вызовы отправляются одним пайплайном. Та же функция изменяет счетчик
+        суммы балансов шарда.
+        Добытые блоки учитываются по начислениям, а не по разнице балансов, поэтому записи балансов
+        из разных мест приложения в любом порядке не завышают их.
+    """
+    earned = earned or {}
+    shards_balances = {}
+    shards_earned = set()
+    for username, balance in balances.items():
+        shard = get_leaderboard_shard(username)
+        user_earned = int(earned.get(username) or 0)
+        shards_balances.setdefault(shard, []).extend([username, balance, user_earned])
+        if user_earned > 0:
+            shards_earned.add(shard)
+
+    await call_functions_pipeline(redis_client, [
+        (
+            "set_users_balances",
+            get_shard_keys(shard, shard in shards_earned),
+            [settings.LEADERBOARD_EARNED_TTL, *shard_balances]
+        )
+        for shard, shard_balances in shards_balances.items()
+    ])
+
+
+async def get_top_users(top_n: int, redis_client) -> list[tuple[str, float]]:
+    """
+    Получает топ N пользователей по размеру баланса из всех шардов таблицы лидеров.
+
+    Args:
+        top_n (int): Количество пользователей, которых нужно выбрать.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        list[tuple[str, float]]: Список пар (имя пользователя, баланс в блоках) по убыванию баланса.
+
+    Notes:
+        Из каждого шарда берется его топ N, затем списки объединяются с выбором N наибольших.
+    """
+    shards_top = await call_functions_pipeline(redis_client, [
+        ("top_users", [key], [top_n]) for key in get_leaderboard_keys()
+    ])
+    users = (
+        (username, int(balance))
+        for shard_top in shards_top
+        for username, balance in shard_top
+    )
+    return [
+        (username, from_milli_blocks(balance))
+        for username, balance in heapq.nlargest(top_n, users, key=lambda user: user[1])
+    ]
+
+
+async def get_user_rank(username: str, redis_client) -> Optional[int]:
+    """
+    Возвращает место пользователя в таблице лидеров (начиная с 1).
+
+    Args:
+        username (str): Имя пользователя.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        Optional[int]: Место пользователя или None, если его нет в таблице лидеров.
+
+    Notes:
+        Место - количество пользователей во всех шардах с балансом больше, чем у пользователя, плюс один.
+        Для каждого шарда это одна команда ZCOUNT (O(log N)).
+    """
+    balance = await get_user_balance(username, redis_client)
+    if balance is None:
+        return None
+    return await count_users_above(balance, redis_client) + 1
+
+
+async def get_user_balance(username: str, redis_client) -> Optional[int]:
+    """Возвращает баланс пользователя (в милли-блоках) из таблицы лидеров или None, если его там нет."""
+    balance = await redis_client.zscore(get_leaderboard_key(get_leaderboard_shard(username)), username)
+    return None if balance is None else int(balance)
+
+
+async def count_users_above(balance: int, redis_client) -> int:
+    """Возвращает количество пользователей во всех шардах с балансом (в милли-блоках) больше указанного."""
+    async with redis_client.pipeline() as pipe:
+        for key in get_leaderboard_keys():
+            await pipe.zcount(key, f"({balance}", "+inf")
+        counts = await pipe.execute()
+    return sum(counts)
+
+
+async def get_users_around(username: str, count: int, redis_client) -> Optional[list[tuple[int, str, float]]]:
+    """
+    Возвращает пользователей таблицы лидеров вокруг пользователя.
+
+    Args:
+        username (str): Имя пользователя.
+        count (int): Количество пользователей выше и ниже пользователя.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        Optional[list[tuple[int, str, float]]]: Список троек (место, имя пользователя, баланс в блоках)
+            по убыванию баланса, включая самого пользователя, или None, если его нет в таблице лидеров.
+
+    Notes:
+        Из каждого шарда берутся `count` ближайших пользователей с большим балансом и `count`
+        с таким же или меньшим (ZRANGEBYSCORE с LIMIT, O(log N + count)), затем выбираются
+        ближайшие среди всех шардов. Пользователи с одинаковым балансом получают места после пользователя.
+    """
+    balance = await get_user_balance(username, redis_client)
+    if balance is None:
+        return None
+    rank = await count_users_above(balance, redis_client) + 1
+
+    async with redis_client.pipeline() as pipe:
+        for key in get_leaderboard_keys():
+            await pipe.zrangebyscore(key, f"({balance}", "+inf", start=0, num=count, withscores=True)
+            await pipe.zrevrangebyscore(key, balance, "-inf", start=0, num=count + 1, withscores=True)
+        results = await pipe.execute()
+
+    above = heapq.nsmallest(
+        count, (user for shard_above in results[0::2] for user in shard_above), key=lambda user: user[1]
+    )
+    below = heapq.nlargest(
+        count,
+        (user for shard_below in results[1::2] for user in shard_below if user[0] != username),
+        key=lambda user: user[1]
+    )
+
+    users = [
+        (rank - i - 1, user_name, from_milli_blocks(user_balance)) for i, (user_name, user_balance) in enumerate(above)
+    ][::-1]
+    users.append((rank, username, from_milli_blocks(balance)))
+    users.extend(
+        (rank + i + 1, user_name, from_milli_blocks(user_balance)) for i, (user_name, user_balance) in enumerate(below)
+    )
+    return users
+
+
+async def get_leaderboard_page(offset: int, limit: int, redis_client) -> list[tuple[int, str, float]]:
+    """
+    Возвращает страницу таблицы лидеров.
+
+    Args:
+        offset (int): Количество пропускаемых пользователей с начала таблицы лидеров.
+        limit (int): Количество пользователей на странице.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        list[tuple[int, str, float]]: Список троек (место, имя пользователя, баланс в блоках) по убыванию баланса.
+
+    Notes:
+        Из каждого шарда берутся первые offset + limit пользователей, поэтому глубина страниц
+        ограничивается настройкой LEADERBOARD_PAGE_MAX_OFFSET.
+    """
+    top_users = await get_top_users(offset + limit, redis_client)
+    return [
+        (offset + i + 1, username, balance)
+        for i, (username, balance) in enumerate(top_users[offset:offset + limit])
+    ]
+
+
+async def get_top_earned_users(days: int, top_n: int, redis_client) -> list[tuple[str, float]]:
+    """
+    Получает топ N пользователей по количеству блоков, добытых за последние дни.
+
+    Args:
+        days (int): Количество последних дней (UTC), включая текущий. 1 - за сегодня, 7 - за неделю.
+        top_n (int): Количество пользователей, которых нужно выбрать.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+
+    Returns:
+        list[tuple[str, float]]: Список пар (имя пользователя, добыто блоков) по убыванию.
+
+    Notes:
+        - Добытые блоки учитываются в ZSET за каждый день для каждого шарда, ключи за прошлые дни
+          удаляются автоматически по истечении LEADERBOARD_EARNED_TTL.
+        - Для нескольких дней ZSET за дни шарда объединяются командой ZUNIONSTORE в ключ,
+          который хранится LEADERBOARD_CACHE_SECONDS и используется повторно. Проверка, построение
+          объединения и выборка топа выполняются одним вызовом функции "top_earned_users" на шард.
+    """
+    today = datetime.utcnow()
+    if days == 1:
+        async with redis_client.pipeline() as pipe:
+            for shard in range(settings.LEADERBOARD_SHARDS):
+                await pipe.zrevrange(get_earned_key(shard, today), 0, top_n - 1, withscores=True)
+            shards_top = await pipe.execute()
+    else:
+        shards_result = await call_functions_pipeline(redis_client, [
+            (
+                "top_earned_users",
+                [
+                    f"users_earned:{{lb{shard}}}:last{days}",
+                    f"users_earned:{{lb{shard}}}:last{days}:built",
+                    *[get_earned_key(shard, today - timedelta(days=day)) for day in range(days)]
+                ],
+                [settings.LEADERBOARD_CACHE_SECONDS, top_n]
+            )
+            for shard in range(settings.LEADERBOARD_SHARDS)
+        ])
+        shards_top = [zip(shard_result[0::2], shard_result[1::2]) for shard_result in shards_result]
+    users = ((username, int(float(earned))) for shard_top in shards_top for username, earned in shard_top)
+    return [
+        (username, from_milli_blocks(earned))
+        for username, earned in heapq.nlargest(top_n, users, key=lambda user: user[1])
+    ]
+
+
+async def get_total_balance(redis_client) -> int:
+    """
+    Возвращает сумму балансов всех пользователей (количество сгенерированных блоков) в милли-блоках.
+
+    Notes:
+        Сумма складывается из счетчиков шардов, которые изменяются вместе с балансами,
+        поэтому не зависит от количества пользователей. Если счетчика шарда еще нет,
+        он вычисляется по балансам шарда (см. `reconcile_leaderboard_totals`).
+    """
+    total_keys = [get_leaderboard_total_key(shard) for shard in range(settings.LEADERBOARD_SHARDS)]
+    async with redis_client.pipeline() as pipe:
+        for key in total_keys:
+            await pipe.get(key)
+        totals = await pipe.execute()
+
+    missing_shards = [shard for shard, total in enumerate(totals) if total is None]
+    if missing_shards:
+        reconciled = await reconcile_leaderboard_totals(redis_client, missing_shards)
+        for shard in missing_shards:
+            totals[shard] = reconciled[shard][1]
+    return sum(int(total) for total in totals)
+
+
+async def reconcile_leaderboard_totals(redis_client, shards: list[int] = None) -> dict[int, tuple[int, int]]:
+    """
+    Сверяет счетчики сумм балансов шардов с точными суммами и исправляет их.
+
+    Args:
+        redis_client: Клиент Redis для взаимодействия с базой данных.
+        shards (list[int], optional): Номера шардов для сверки. По умолчанию - все шарды.
+
+    Returns:
+        dict[int, tuple[int, int]]: Для каждого шарда пара (значение счетчика, точная сумма) в милли-блоках.
+
+    Notes:
+        Точная сумма считается перебором всех балансов шарда (O(N)), поэтому сверка
+        выполняется только в периодической фоновой задаче.
+    """
+    if shards is None:
+        shards = list(range(settings.LEADERBOARD_SHARDS))
+    results = await call_functions_pipeline(redis_client, [
+        ("reconcile_total", [get_leaderboard_key(shard), get_leaderboard_total_key(shard)], [])
+        for shard in shards
+    ])
+    return {
+        shard: (int(total), int(exact_total))
+        for shard, (total, exact_total) in zip(shards, results)
+    }
+
+
+async def delete_leaderboard(redis_client) -> None:
+    """Удаляет все шарды таблицы лидеров вместе со счетчиками сумм балансов."""
+    await redis_client.delete(
+        *get_leaderboard_keys(),
+        *[get_leaderboard_total_key(shard) for shard in range(settings.LEADERBOARD_SHARDS)]
+    )
@@ -0,0 +1,159 @@
+import json
+import time
+import hashlib
+from typing import Optional
+
+from app.config import settings
+from app.redis_init import get_redis, get_redis_pubsub
+from app.utils.logger_init import logger
+from app.utils.leaderboard import get_top_users
+from app.redis_helpers.updates_listener import get_updates_listener
+
+# формат сообщения изменился (версия из Redis и время публикации), поэтому ключ и канал новые
+LEADERBOARD_SNAPSHOT_KEY = f"leaderboard_snapshot_v2:{settings.REDIS_NODE_TAG_3}"
+LEADERBOARD_SNAPSHOT_VERSION_KEY = f"leaderboard_snapshot_version:{settings.REDIS_NODE_TAG_3}"
+LEADERBOARD_SNAPSHOT_CHANNEL = "leaderboard_snapshot_updates_v2"
+
+
+class LeaderboardSnapshot:
+    """
+    Сериализованный снимок таблицы лидеров (топ N пользователей по убыванию баланса).
+
+    Attributes:
+        data (bytes): Снимок в формате JSON {имя пользователя: баланс}, готовый для отправки клиенту.
+        etag (str): ETag снимка для ответов 304 Not Modified.
+        version (int): Номер снимка (INCR в Redis), более новый снимок имеет больший номер.
+        published_at (int): Время создания снимка по часам Redis (TIME) в миллисекундах.
+        received_at (float): Момент создания снимка по монотонным часам этого процесса.
+
+    Notes:
+        Версия и время публикации берутся из Redis, а возраст снимка считается по монотонным часам
+        процесса, поэтому расхождение часов между хостами Celery и приложения не влияет на проверку
+        устаревания снимка.
+    """
+    __slots__ = ("data", "etag", "version", "published_at", "received_at")
+
+    def __init__(self, data: bytes, etag: str, version: int, published_at: int, age_ms: int = 0):
+        self.data = data
+        self.etag = etag
+        self.version = version
+        self.published_at = published_at
+        self.received_at = time.monotonic() - max(age_ms, 0) / 1000
+
+    @classmethod
+    def build(cls, top_users: list[tuple[str, float]], version: int, published_at: int) -> "LeaderboardSnapshot":
+        """Сериализует топ пользователей один раз при создании снимка."""
+        data = json.dumps(dict(top_users), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        return cls(data, etag, version, published_at)
+
+    def is_stale(self) -> bool:
+        """Проверяет, что снимок давно не обновлялся (например, фоновая задача не запущена)."""
+        return time.monotonic() - self.received_at > settings.LEADERBOARD_SNAPSHOT_PERIOD * 3
+
+    def to_message(self) -> str:
+        """Упаковывает снимок в сообщение pub/sub (и значение в Redis) без повторной сериализации JSON."""
+        return f"{self.version}:{self.published_at}:{self.etag}:{self.data.decode('utf-8')}"
+
+    @classmethod
+    def from_message(cls, message: str, now_ms: int = None) -> "LeaderboardSnapshot":
+        """
+        Распаковывает снимок из сообщения.
+
+        Args:
+            message (str): Сообщение, созданное `to_message`.
+            now_ms (int, optional): Текущее время по часам Redis для подсчета возраста снимка.
+                None - снимок считается только что опубликованным (сообщение pub/sub).
+        """
+        version, published_at, etag, data = message.split(":", 3)
+        age_ms = 0 if now_ms is None else now_ms - int(published_at)
+        return cls(data.encode("utf-8"), etag, int(version), int(published_at), age_ms)
+
+
+async def get_redis_time_ms(redis_client) -> int:
+    """Возвращает текущее время по часам ноды Redis со снимком таблицы лидеров (в миллисекундах)."""
+    seconds, microseconds = await redis_client.time(
+        target_nodes=redis_client.get_node_from_key(LEADERBOARD_SNAPSHOT_KEY)
+    )
+    return int(seconds) * 1000 + int(microseconds) // 1000
+
+
+leaderboard_snapshot: Optional[LeaderboardSnapshot] = None
+
+
+def get_leaderboard_snapshot() -> Optional[LeaderboardSnapshot]:
+    """Возвращает снимок таблицы лидеров из памяти процесса или None, если его еще нет."""
+    return leaderboard_snapshot
+
+
+def set_leaderboard_snapshot(snapshot: LeaderboardSnapshot) -> bool:
+    """Сохраняет снимок в памяти процесса, если он новее текущего. Возвращает True, если снимок сохранен."""
+    global leaderboard_snapshot
+    if leaderboard_snapshot is not None and snapshot.version <= leaderboard_snapshot.version:
+        return False
+    leaderboard_snapshot = snapshot
+    return True
+
+
+async def publish_leaderboard_snapshot() -> LeaderboardSnapshot:
+    """
+    Создает снимок таблицы лидеров и рассылает его всем процессам приложения.
+
+    Returns:
+        LeaderboardSnapshot: Созданный снимок.
+
+    Notes:
+        Снимок записывается в Redis (для процессов, пропустивших сообщение, и для новых процессов)
+        и публикуется в канал LEADERBOARD_SNAPSHOT_CHANNEL. Номер версии снимка выдает Redis (INCR),
+        время публикации берется из часов Redis (TIME).
+    """
+    redis_client = await get_redis()
+    top_users = await get_top_users(settings.LEADERBOARD_SNAPSHOT_SIZE, redis_client)
+    version = await redis_client.incr(LEADERBOARD_SNAPSHOT_VERSION_KEY)
+    snapshot = LeaderboardSnapshot.build(top_users, version, await get_redis_time_ms(redis_client))
+    message = snapshot.to_message()
+
+    await redis_client.set(LEADERBOARD_SNAPSHOT_KEY, message)
+    set_leaderboard_snapshot(snapshot)
+    try:
+        pubsub_client = await get_redis_pubsub()
+        await pubsub_client.publish(LEADERBOARD_SNAPSHOT_CHANNEL, message)
+    except Exception as err:
+        # процессы приложения получат снимок при периодической проверке
+        logger.error(f"Ошибка публикации снимка таблицы лидеров: {err}")
+    return snapshot
+
+
+async def load_leaderboard_snapshot() -> bool:
+    """
+    Загружает в память процесса последний опубликованный снимок таблицы лидеров из Redis.
+
+    Returns:
+        bool: True, если снимок есть в Redis.
+    """
+    redis_client = await get_redis()
+    message = await redis_client.get(LEADERBOARD_SNAPSHOT_KEY)
+    if message is None:
+        return False
+    version = int(message.split(":", 1)[0])
+    if leaderboard_snapshot is None or version > leaderboard_snapshot.version:
+        # возраст снимка считается по часам Redis, только если снимок новый
+        set_leaderboard_snapshot(LeaderboardSnapshot.from_message(message, await get_redis_time_ms(redis_client)))
+    return True
+
+
+async def handle_leaderboard_snapshot_message(message: str) -> None:
+    """Сохраняет в памяти процесса снимок таблицы лидеров из канала LEADERBOARD_SNAPSHOT_CHANNEL."""
+    set_leaderboard_snapshot(LeaderboardSnapshot.from_message(message))
+
+
+def start_leaderboard_snapshot_updates() -> None:
+    """
+    Подписывает процесс на обновления снимка таблицы лидеров.
+
+    Снимки приходят через pub/sub, дополнительно раз в LEADERBOARD_SNAPSHOT_PERIOD секунд
+    снимок проверяется в Redis на случай потерянного сообщения.
+    """
+    listener = get_updates_listener()
+    listener.subscribe(LEADERBOARD_SNAPSHOT_CHANNEL, handle_leaderboard_snapshot_message)
+    listener.add_poller(load_leaderboard_snapshot, settings.LEADERBOARD_SNAPSHOT_PERIOD)
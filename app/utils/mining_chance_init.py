@@ -1,13 +1,27 @@
+import json
+from typing import Callable
+
 from app.utils.logger_init import logger
 from app.config import settings
-from app.redis_init import get_redis
-from app.redis_helpers.lua_scripts import total_sum_script
+from app.redis_init import get_redis, get_redis_pubsub
+from app.utils.leaderboard import leaderboard_exists, get_total_balance
+from app.utils.data_processing_funcs import from_milli_blocks
 from app.general_app_data.dao import MiningChanceDAO
+from app.redis_helpers.updates_listener import get_updates_listener
+
+
+MINING_CHANCE_KEY = f"mining_chance:{settings.REDIS_NODE_TAG_3}"
+MINING_CHANCE_VERSION_KEY = f"mining_chance_version:{settings.REDIS_NODE_TAG_3}"
+MINING_CHANCE_CHANNEL = "mining_chance_updates"
+
+# обработчики изменения шанса добычи в процессе (например, отправка нового значения по WebSocket)
+mining_chance_handlers: list[Callable[[float], None]] = []
 
 
 class MiningChanceSingleton:
     _instance = None
     _value = None
+    _version = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -19,34 +33,120 @@ class MiningChanceSingleton:
             raise ValueError("Mining chance is not set.")
         return self._value
 
-    def set_value(self, value):
+    def get_version(self):
+        return self._version
+
+    def set_value(self, value, version: int = None) -> bool:
+        """
+        Записывает значение шанса добычи.
+
+        Если указана версия, значение записывается, только если она новее текущей,
+        чтобы запоздавшее обновление не перезаписало более свежее значение.
+        Возвращает True, если значение записано.
+        """
+        if version is not None and self._version is not None and version <= self._version:
+            return False
         self._value = value
+        if version is not None:
+            self._version = version
+        return True
 
 
 def get_mining_chance_singleton() -> MiningChanceSingleton:
     return MiningChanceSingleton()
 
 
+def add_mining_chance_handler(handler: Callable[[float], None]) -> None:
+    """Добавляет обработчик, который вызывается с новым значением при изменении шанса добычи в процессе."""
+    mining_chance_handlers.append(handler)
+
+
+def notify_mining_chance_handlers(value: float) -> None:
+    for handler in mining_chance_handlers:
+        try:
+            handler(value)
+        except Exception as err:
+            logger.error(f"Ошибка обработки нового шанса добычи: {err}")
+
+
 async def set_mining_chance() -> None:
     """
-    Берет сумму балансов всех пользователей из Redis ("users_balances:{REDIS_NODE_TAG_3}"),
-    подсчитывает вероятность добычи блока и записывает значение в синглтон.
+    Берет сумму балансов всех пользователей из шардов таблицы лидеров в Redis,
+    подсчитывает вероятность добычи блока и публикует новое значение для всех процессов приложения.
 
     Returns:
         None
+
+    Notes:
+        Значение записывается в Redis вместе с новой версией, и об изменении сообщается
+        в канал MINING_CHANCE_CHANNEL. Процессы, подписанные на канал (см. `start_mining_chance_updates`),
+        обновляют значение в своем синглтоне без перезапуска и вызывают обработчики изменения
+        (см. `add_mining_chance_handler`).
     """
     redis_client = await get_redis()
     mining_chance = 1
-    key = f"users_balances:{settings.REDIS_NODE_TAG_3}"
 
-    if await redis_client.exists(key):
+    if await leaderboard_exists(redis_client):
         logger.info("Mining chance calculation started...")
-        script = redis_client.register_script(total_sum_script)
-        total_sum = await script(keys=[key])
+        total_sum = from_milli_blocks(await get_total_balance(redis_client))
         mining_chance = round((1 - total_sum / settings.MAX_BLOCKS), 4)
 
+    version = await redis_client.incr(MINING_CHANCE_VERSION_KEY)
+    await redis_client.hset(MINING_CHANCE_KEY, mapping={"value": mining_chance, "version": version})
+
     singleton = get_mining_chance_singleton()
-    singleton.set_value(mining_chance)
+    if singleton.set_value(mining_chance, version):
+        notify_mining_chance_handlers(mining_chance)
     await MiningChanceDAO.add(value=mining_chance)
 
+    try:
+        pubsub_client = await get_redis_pubsub()
+        await pubsub_client.publish(MINING_CHANCE_CHANNEL, json.dumps({"value": mining_chance, "version": version}))
+    except Exception as err:
+        # процессы приложения получат новое значение при периодической проверке
+        logger.error(f"Ошибка публикации нового шанса добычи: {err}")
+
     logger.info("Mining chance calculated successfully.")
+
+
+async def load_mining_chance() -> bool:
+    """
+    Загружает в синглтон последнее опубликованное значение шанса добычи из Redis.
+
+    Returns:
+        bool: True, если значение есть в Redis.
+    """
+    redis_client = await get_redis()
+    value, version = await redis_client.hmget(MINING_CHANCE_KEY, "value", "version")
+    if value is None or version is None:
+        return False
+    if get_mining_chance_singleton().set_value(float(value), int(version)):
+        logger.info(f"Mining chance updated to {value} (version {version}).")
+        notify_mining_chance_handlers(float(value))
+    return True
+
+
+async def init_mining_chance() -> None:
+    """Загружает опубликованное значение шанса добычи, а если его еще нет - подсчитывает его."""
+    if not await load_mining_chance():
+        await set_mining_chance()
+
+
+async def handle_mining_chance_message(message: str) -> None:
+    """Обновляет шанс добычи в синглтоне по сообщению из канала MINING_CHANCE_CHANNEL."""
+    data = json.loads(message)
+    if get_mining_chance_singleton().set_value(float(data["value"]), int(data["version"])):
+        logger.info(f"Mining chance updated to {data['value']} (version {data['version']}).")
+        notify_mining_chance_handlers(float(data["value"]))
+
+
+def start_mining_chance_updates() -> None:
+    """
+    Подписывает процесс на обновления шанса добычи.
+
+    Сообщения приходят через pub/sub, дополнительно раз в MINING_CHANCE_POLL_PERIOD секунд
+    значение проверяется в Redis на случай потерянного сообщения.
+    """
+    listener = get_updates_listener()
+    listener.subscribe(MINING_CHANCE_CHANNEL, handle_mining_chance_message)
+    listener.add_poller(load_mining_chance, settings.MINING_CHANCE_POLL_PERIOD)
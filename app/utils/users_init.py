@@ -1,7 +1,5 @@
-import json
 import numpy as np
 from typing import Optional
-from itertools import islice
 from datetime import datetime
 from typing import AsyncIterator
 
@@ -10,90 +8,49 @@ from app.users.dao import UsersDAO
 from app.redis_init import get_redis
 from app.utils.logger_init import logger
 from app.tasks.tasks import calculate_items_won_by_list
-from app.tasks.tasks import add_items_to_db
-from app.utils.game_items_init import get_items_registry
+from app.utils.items_drop import get_items_drop_table, resolve_expired_drop_skips
 from app.utils.data_processing_funcs import log_execution_time_async
-from app.utils.data_processing_funcs import sanitize_dict_for_redis
-from app.redis_helpers.lua_scripts import (
-    top_users_script,
-    recalculate_user_data_script,
-    add_user_data_script,
-    add_user_balance_script
+from app.utils.data_processing_funcs import get_user_data_key, from_milli_blocks, BALANCE_SCALE
+from app.users.user_state import encode_user_for_redis, drop_cold_fields
+from app.redis_helpers.functions import call_function, call_functions_pipeline
+from app.utils.leaderboard import (
+    leaderboard_exists,
+    set_user_balance,
+    set_users_balances,
+    delete_leaderboard
 )
 
 
-async def calculate_items_won(user_id: int, count_clicks: int, redis_client) -> Optional[int]:
+async def fetch_all_users_by_key(key: dict, batch_size: int = None) -> AsyncIterator[list]:
     """
-    Подсчитывает количество выпавших игровых предметов для пользователя и обновляет данные в Redis.
+    Генерирует данные по ключу из базы данных пакетами заданного размера.
 
     Args:
-        user_id (int): Идентификатор пользователя, для которого вычисляются выпавшие предметы.
-        count_clicks (int): Количество кликов, совершённых пользователем.
-        redis_client: Клиент Redis для взаимодействия с базой данных.
+        key (dict): Словарь с параметрами для фильтрации записей.
+        batch_size (int): Размер пакета, по умолчанию DB_STREAM_BATCH_SIZE.
 
-    Returns:
-        Optional[int]: Общее количество выпавших предметов или None, если предметы не выпали.
+    Yields:
+        list: Список записей, соответствующих фильтру по ключу, размером не более `batch_size`.
 
     Notes:
-        - Проверяется шанс выпадения для каждого предмета.
-        - Если общее количество выпавших предметов превышает максимум, предмет больше не учитывается.
-        - Обновления количества предметов и их добавление в базу данных происходят асинхронно.
+        - Записи выбираются по возрастанию id, пакет за пакетом (см. `BaseDAO.stream_all`).
     """
-    item_quantities = await redis_client.hgetall(f"item_quantities:{settings.REDIS_NODE_TAG_1}")
-    items_registry = await get_items_registry()
-    updates = {}
-    total_won = 0
-
-    for item_key, item_details in items_registry.get_all_entities().items():
-        # уточняем, количество уже выпавших предметов и его ограничение
-        current_quantity = int(item_quantities.get(item_key, 0))
-        max_quantity = item_details.get_value("maximum_amount")
-        if current_quantity >= max_quantity:
-            items_registry.delete_entity(item_key)
-            continue
-
-        # вычисляем количество выпавших предметов на основе шанса
-        drop_chance = float(item_details.get_value("drop_chance"))
-        won_items = np.random.binomial(count_clicks, drop_chance)
-
-        if won_items:
-            updates[item_key] = current_quantity + won_items
-            total_won += won_items
-
-            add_items_to_db.delay(
-                user_id=user_id,
-                item_key=item_key,
-                items_count=won_items,
-                image_id=item_details.get_value("image_id")
-            )
+    async for records in UsersDAO.stream_all(*UsersDAO.get_filter_criteria(**key), batch_size=batch_size):
+        yield records
 
-    if updates:
-        await redis_client.hmset(f"item_quantities:{settings.REDIS_NODE_TAG_1}", updates)
 
-    return total_won
+# время хранения данных пользователя без автокликера в Redis с последнего обращения (в секундах)
+USER_DATA_TTL = 3600
 
 
-async def fetch_all_users_by_key(key: dict, batch_size: int = 100) -> AsyncIterator[list]:
-    """
-    Генерирует данные по ключу из базы данных пакетами заданного размера.
+def get_autoclicker_partition(user_id: int) -> int:
+    """Возвращает номер партиции фонового пересчета, к которой относится пользователь."""
+    return user_id % settings.AUTOCLICKER_PARTITIONS
 
-    Args:
-        key (dict): Словарь с параметрами для фильтрации записей.
-        batch_size (int): Размер пакета, который будет извлечён за одну итерацию.
 
-    Yields:
-        list: Список записей, соответствующих фильтру по ключу, размером не более `batch_size`.
-
-    Notes:
-        - Используется пагинация для извлечения всех записей, соответствующих фильтру.
-    """
-    offset = 0
-    while True:
-        records = await UsersDAO.fetch_users_by_key(offset=offset, limit=batch_size, **key)
-        if not records:
-            break
-        yield records
-        offset += batch_size
+def get_autoclicker_index_key(partition: int) -> str:
+    """Возвращает ключ индекса пользователей с автокликером для партиции."""
+    return f"autoclicker_users:{{ac{partition}}}"
 
 
 async def add_user_data_to_redis(user_data: dict, balance_update: bool = False) -> None:
@@ -109,6 +66,9 @@ async def add_user_data_to_redis(user_data: dict, balance_update: bool = False)
         Если флаг balance_update == True, то в значение "last_update_time" будет добавлено
         текущее время, в секундах от начала эпохи. Это необходимо для подсчета балансов пользователей
         с автокликером в фоновой задаче.
+        Пользователи с автокликером добавляются в индекс своей партиции
+        (см. `get_autoclicker_index_key`), по которому фоновая задача выбирает пользователей для пересчета.
+        В Redis записываются только поля HOT_USER_FIELDS, остальные поля словаря отбрасываются.
         Добавление данных происходит на стороне Redis с помощью lua-скриптов.
         Это гарантирует атомарность операций, чтобы избежать состояния гонки при обновлении
         данных из разных мест приложения.
@@ -116,27 +76,159 @@ async def add_user_data_to_redis(user_data: dict, balance_update: bool = False)
     redis_client = await get_redis()
 
     ttl = 0
-    if not user_data.get("clicks_per_sec"):
-        ttl = 3600  # Если пользователь без автокликера, то хранить его данные один час
-        user_data['redis_tag'] = settings.REDIS_NODE_TAG_1
-    else:
-        user_data['redis_tag'] = settings.REDIS_NODE_TAG_2
+    has_autoclicker = bool(float(user_data.get("clicks_per_sec") or 0))
+    if not has_autoclicker:
+        ttl = USER_DATA_TTL
 
-    user_data_key = f"user_data:{user_data.get('redis_tag')}:{user_data['id']}"
-    balances_key = f"users_balances:{settings.REDIS_NODE_TAG_3}"
+    # поле из старой схемы ключей, где пользователи хранились под двумя тегами
+    user_data.pop("redis_tag", None)
+    drop_cold_fields(user_data)
+    user_data_key = get_user_data_key(user_data["id"])
+    index_key = get_autoclicker_index_key(get_autoclicker_partition(int(user_data["id"])))
 
     if balance_update:
         user_data["last_update_time"] = datetime.now().timestamp()
 
-    add_data_script = redis_client.register_script(add_user_data_script)
-    add_balance_script = redis_client.register_script(add_user_balance_script)
     flat_user_data = [str(k) for pair in user_data.items() for k in pair]
 
-    await add_data_script(keys=[user_data_key], args=[ttl, *flat_user_data])
-    await add_balance_script(
-        keys=[balances_key],
-        args=[user_data.get("username"), user_data.get("blocks_balance")]
+    await call_function(redis_client, "add_user_data", keys=[user_data_key], args=[ttl, *flat_user_data])
+    await set_user_balance(user_data.get("username"), user_data.get("blocks_balance"), redis_client)
+
+    if has_autoclicker:
+        # добавляем пользователя в индекс для фонового пересчета (не сдвигая уже назначенное время)
+        await redis_client.zadd(index_key, {user_data["id"]: datetime.now().timestamp()}, nx=True)
+
+
+async def add_autoclicker_user(user_id: int, redis_client) -> None:
+    """
+    Делает хранение данных пользователя, купившего автокликер, бессрочным
+    и добавляет его в индекс партиции для фонового пересчета баланса.
+    """
+    await redis_client.persist(get_user_data_key(user_id))
+    index_key = get_autoclicker_index_key(get_autoclicker_partition(user_id))
+    await redis_client.zadd(index_key, {user_id: datetime.now().timestamp()}, nx=True)
+
+
+async def apply_clicks_to_user(user_data: dict, clicks: int, mining_chance: float) -> Optional[tuple[float, int]]:
+    """
+    Атомарно применяет клики пользователя к его данным в Redis.
+
+    Args:
+        user_data (dict): Словарь с данными пользователя, должен содержать `id`.
+        clicks (int): Количество кликов, совершённых пользователем.
+        mining_chance (float): Текущая вероятность добычи блока.
+
+    Returns:
+        Optional[tuple[float, int]]: Новый баланс пользователя (в блоках) и количество выпавших ему предметов
+            или None, если данных пользователя нет в Redis.
+
+    Notes:
+        Баланс пересчитывается на стороне Redis lua-скриптом (вместе с начислением за автокликер
+        с момента последнего обновления), без чтения и перезаписи всех полей пользователя.
+        Это исключает потерю обновлений при одновременном пересчете балансов в фоновой задаче.
+        Тот же скрипт уменьшает счетчики кликов до выпадения предметов, розыгрыш
+        происходит только при истечении счетчика (см. `resolve_expired_drop_skips`).
+        Время жизни данных пользователя без автокликера продлевается на USER_DATA_TTL с каждым кликом.
+    """
+    redis_client = await get_redis()
+    user_data_key = get_user_data_key(user_data["id"])
+    items_drop_table = await get_items_drop_table()
+
+    result = await call_function(
+        redis_client,
+        "apply_clicks",
+        keys=[user_data_key],
+        args=[clicks, mining_chance, datetime.now().timestamp(), USER_DATA_TTL, "", *items_drop_table.item_keys]
     )
+    if result is None:
+        return None
+
+    new_balance, username, earned, drop_claim, *expired_skips = result
+    await set_user_balance(username, new_balance, redis_client, earned)
+
+    items_won = 0
+    if expired_skips:
+        items_won = await resolve_expired_drop_skips(
+            int(user_data["id"]), user_data_key, drop_claim, expired_skips, redis_client
+        )
+    return from_milli_blocks(new_balance), items_won
+
+
+async def apply_clicks_batch(
+        users_clicks: dict[int, int],
+        mining_chance: float,
+        sent_users: Optional[set] = None,
+        stream_ids: Optional[dict[int, str]] = None
+) -> dict[int, Optional[tuple[float, int]]]:
+    """
+    Применяет накопленные клики группы пользователей к их данным в Redis одним пакетом команд.
+
+    Args:
+        users_clicks (dict[int, int]): Словарь, где ключи - идентификаторы пользователей,
+            значения - количество кликов.
+        mining_chance (float): Текущая вероятность добычи блока.
+        sent_users (set, optional): Множество, в которое добавляются идентификаторы пользователей,
+            чьи клики отправлены в Redis (и могли быть применены, даже если функция завершилась ошибкой).
+        stream_ids (dict[int, str], optional): Id последнего события Redis Stream с кликами каждого
+            пользователя. Клики пользователя применяются, только если его последнее примененное событие
+            старше, и вместе с ними записывается новый id (повторная обработка событий ничего не меняет).
+
+    Returns:
+        dict[int, Optional[tuple[float, int]]]: Новые балансы пользователей (в блоках) и количество выпавших
+            им предметов. None - данных пользователя нет в Redis и клики не применены: данные нужно
+            загрузить (см. `load_users_data`) и применить клики повторно.
+
+    Notes:
+        Для каждого пользователя выполняется тот же lua-скрипт, что и в `apply_clicks_to_user`,
+        но все вызовы отправляются в Redis одним пайплайном, а балансы в таблице лидеров
+        обновляются одной командой ZADD на шард.
+    """
+    redis_client = await get_redis()
+    current_time = datetime.now().timestamp()
+    users_ids = list(users_clicks.keys())
+    items_drop_table = await get_items_drop_table()
+    if sent_users is None:
+        sent_users = set()
+    if stream_ids is None:
+        stream_ids = {}
+
+    # при ошибке пайплайна неизвестно, какие вызовы успели выполниться
+    sent_users.update(users_ids)
+    results = await call_functions_pipeline(redis_client, [
+        (
+            "apply_clicks",
+            [get_user_data_key(user_id)],
+            [
+                users_clicks[user_id], mining_chance, current_time, USER_DATA_TTL,
+                stream_ids.get(user_id, ""), *items_drop_table.item_keys
+            ]
+        )
+        for user_id in users_ids
+    ])
+
+    users_results = {}
+    leaderboard_balances = {}
+    leaderboard_earned = {}
+    for user_id, result in zip(users_ids, results):
+        if result is None:
+            # данных пользователя нет в Redis, скрипт ничего не изменил
+            sent_users.discard(user_id)
+            users_results[user_id] = None
+            continue
+
+        new_balance, username, earned, drop_claim, *expired_skips = result
+        leaderboard_balances[username] = new_balance
+        leaderboard_earned[username] = earned
+        items_won = 0
+        if expired_skips:
+            items_won = await resolve_expired_drop_skips(
+                user_id, get_user_data_key(user_id), drop_claim, expired_skips, redis_client
+            )
+        users_results[user_id] = (from_milli_blocks(new_balance), items_won)
+
+    if leaderboard_balances:
+        await set_users_balances(leaderboard_balances, redis_client, leaderboard_earned)
+    return users_results
 
 
 @log_execution_time_async
@@ -149,142 +241,212 @@ async def add_users_with_autoclicker_to_redis() -> None:
     с помощью фоновой задачи в Celery.
     """
     logger.info("Adding users with atoclicker to redis has been launched...")
-    async for batch in fetch_all_users_by_key(key={"clicks_per_sec": ("!=", 0)}, batch_size=100):
+    async for batch in fetch_all_users_by_key(key={"clicks_per_sec": ("!=", 0)}):
         for record in batch:
-            user_data = sanitize_dict_for_redis(record)
+            user_data = encode_user_for_redis(record)
             await add_user_data_to_redis(user_data)
     logger.info("Users with atoclicker loads successful to redis.")
 
 
 @log_execution_time_async
-async def add_all_users_balances_to_redis(batch_size: int = 100) -> None:
+async def add_all_users_balances_to_redis(batch_size: int = None) -> None:
     """
     Загружает балансы всех пользователей в redis из БД.
     Для дальнейшего подсчета mining_chance и составления таблицы лидеров.
     """
     redis_client = await get_redis()
-    if not await redis_client.exists(f"users_balances:{settings.REDIS_NODE_TAG_3}"):
+    if not await leaderboard_exists(redis_client):
         logger.info("Adding all users balances to redis has been launched...")
-
-        offset = 0
-        while True:
-            records = await UsersDAO.find_all(offset=offset, limit=batch_size)
-            if not records:
-                break
-            async with redis_client.pipeline() as pipe:
-                for user in records:
-                    await pipe.zadd(
-                        f"users_balances:{settings.REDIS_NODE_TAG_3}",
-                        {f"{user.get('username')}": user.get("blocks_balance", 0.0)}
-                    )
-                await pipe.execute()
-            offset += batch_size
+        # таблица лидеров до разбиения на шарды и оставшиеся счетчики сумм балансов шардов
+        await redis_client.delete(f"users_balances:{settings.REDIS_NODE_TAG_3}")
+        await delete_leaderboard(redis_client)
+
+        async for records in UsersDAO.stream_all(batch_size=batch_size, columns=("username", "blocks_balance")):
+            await set_users_balances(
+                {f"{user.get('username')}": user.get("blocks_balance") or 0 for user in records},
+                redis_client
+            )
         logger.info("All users balances loads successful to redis.")
 
 
-async def get_top_users(top_n: int, zset_key: str, redis_client) -> list[list[str, str]]:
+async def recalculate_users_batch(
+        users_ids: list[str],
+        index_key: str,
+        current_time: int,
+        next_due_time: int,
+        redis_client
+) -> dict:
     """
-    Получает топ N пользователей из Redis ZSET с использованием скрипта Lua.
+    Начисляет блоки за работу автокликера группе пользователей на стороне Redis.
 
     Args:
-        top_n (int): Количество пользователей, которых нужно выбрать.
-        zset_key (str): Ключ ZSET в Redis, содержащий данные пользователей.
-        redis_client: Клиент для взаимодействия с Redis.
+        users_ids (list[str]): Идентификаторы пользователей из индекса партиции.
+        index_key (str): Ключ индекса пользователей с автокликером партиции.
+        current_time (int): Время пересчета в секундах от начала эпохи.
+        next_due_time (int): Время следующего пересчета пользователей.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
 
     Returns:
-        list[list[str, str]]: Список списков, где каждый элемент содержит имя пользователя и его баланс.
-    """
-    script = redis_client.register_script(top_users_script)
-    result = await script(keys=[zset_key], args=[top_n])
-    return result
-
+        dict: {"user_clicks": {id пользователя: клики}, "balances": {имя пользователя: баланс},
+            "earned": {имя пользователя: начислено}, "users_balances": {id пользователя: баланс}}.
 
-async def get_top_100_users() -> dict:
-    """
-    Получает топ-100 пользователей с их балансами из Redis.
-
-    Returns:
-        dict: Словарь, где ключи — это имена пользователей, а значения — их балансы.
+    Notes:
+        Данные пользователей хранятся в разных слотах кластера, поэтому функция "recalculate_user_data"
+        вызывается для каждого пользователя отдельно, но все вызовы отправляются одним пайплайном.
+        Пересчитанным пользователям назначается время следующего пересчета,
+        отсутствующие в Redis пользователи удаляются из индекса.
     """
-    redis_client = await get_redis()
-    key = f"users_balances:{settings.REDIS_NODE_TAG_3}"
-
-    top_users = {}
-    if await redis_client.exists(f"{key}"):
-        users = await get_top_users(100, key, redis_client)
-        top_users = {}
-
-        for user in users:
-            username = user[0]
-            balance = float(user[1])
-            top_users[username] = balance
-
-    return top_users
-
-
-async def add_top_100_users_to_redis(top_users: dict = None) -> None:
+    results = await call_functions_pipeline(redis_client, [
+        ("recalculate_user_data", [get_user_data_key(user_id)], [current_time])
+        for user_id in users_ids
+    ])
+
+    user_clicks = {}
+    balances = {}
+    earned = {}
+    users_balances = {}
+    missing_ids = []
+    for user_id, result in zip(users_ids, results):
+        if result is None:
+            missing_ids.append(user_id)
+            continue
+        username, new_balance, clicks, user_earned = result
+        user_clicks[user_id] = float(clicks)
+        balances[username] = new_balance
+        earned[username] = int(user_earned)
+        users_balances[int(user_id)] = int(new_balance)
+
+    if missing_ids:
+        await redis_client.zrem(index_key, *missing_ids)
+    if user_clicks:
+        await redis_client.zadd(index_key, {user_id: next_due_time for user_id in user_clicks})
+    return {"user_clicks": user_clicks, "balances": balances, "earned": earned, "users_balances": users_balances}
+
+
+async def accrue_users_batch_vectorized(
+        users_ids: list[str],
+        index_key: str,
+        current_time: int,
+        next_due_time: int,
+        redis_client
+) -> dict:
     """
-    Добавляет топ-100 пользователей с их балансами в Redis с временем жизни ключа в 10 секунд.
+    Начисляет блоки за работу автокликера группе пользователей на стороне приложения.
 
     Args:
-        top_users (dict): Словарь, где ключи — это имена пользователей, а значения — их балансы.
+        users_ids (list[str]): Идентификаторы пользователей из индекса партиции.
+        index_key (str): Ключ индекса пользователей с автокликером партиции.
+        current_time (int): Время пересчета в секундах от начала эпохи.
+        next_due_time (int): Время следующего пересчета пользователей.
+        redis_client: Клиент Redis для взаимодействия с базой данных.
 
     Returns:
-        None
-    """
-    redis_client = await get_redis()
+        dict: Результат в том же формате, что и у `recalculate_users_batch`.
 
-    if top_users is None:
-        top_users = await get_top_100_users()
-
-    await redis_client.hset(
-        f"top_100:{settings.REDIS_NODE_TAG_3}",
-        mapping=top_users
+    Notes:
+        - Данные пользователей читаются пайплайном HMGET только нужных полей,
+          начисления всех пользователей считаются одной векторной операцией NumPy.
+        - Начисления записываются пайплайном вызовов функции "set_accrued_balance", который
+          проверяет, что "last_update_time" не изменился с момента чтения, и увеличивает баланс.
+          Если пользователь успел отправить клики, скрипт кликов уже начислил ему блоки
+          автокликера, и такой пользователь пропускается.
+        - В отличие от lua-скрипта, Redis не блокируется на время пересчета всей пачки.
+    """
+    keys_batch = [get_user_data_key(user_id) for user_id in users_ids]
+    async with redis_client.pipeline() as pipe:
+        for key in keys_batch:
+            await pipe.hmget(key, "clicks_per_sec", "blocks_per_click", "last_update_time", "username")
+        users_data = await pipe.execute()
+
+    # данных пользователя нет в Redis, удаляем его из индекса
+    missing_ids = [user_id for user_id, user_data in zip(users_ids, users_data) if user_data[3] is None]
+    present = [i for i, user_data in enumerate(users_data) if user_data[3] is not None]
+    if missing_ids:
+        await redis_client.zrem(index_key, *missing_ids)
+    if not present:
+        return {"user_clicks": {}, "balances": {}, "earned": {}, "users_balances": {}}
+
+    fields = np.array(
+        [[float(value or 0) for value in users_data[i][:2]] for i in present], dtype=np.float64
     )
-    await redis_client.expire(f"top_100:{settings.REDIS_NODE_TAG_3}", 10)
-
-
-@log_execution_time_async
-async def recalculate_users_data_in_redis(pattern: str = None, count=100) -> None:
+    last_update_times = np.array(
+        [float(users_data[i][2] or current_time) for i in present], dtype=np.float64
+    )
+    clicks_per_sec, blocks_per_click = fields.T
+    clicks = clicks_per_sec * np.maximum(current_time - last_update_times, 0)
+    # начисление в милли-блоках, баланс увеличивается на стороне Redis командой HINCRBY
+    earned = np.rint(clicks * blocks_per_click * BALANCE_SCALE).astype(np.int64)
+
+    written_balances = await call_functions_pipeline(redis_client, [
+        ("set_accrued_balance", [keys_batch[i]], [users_data[i][2] or "", int(user_earned), current_time])
+        for i, user_earned in zip(present, earned)
+    ])
+
+    await redis_client.zadd(index_key, {users_ids[i]: next_due_time for i in present})
+
+    user_clicks = {}
+    balances = {}
+    earned_by_user = {}
+    users_balances = {}
+    for i, user_clicks_count, user_earned, new_balance in zip(present, clicks, earned, written_balances):
+        if new_balance is not None:
+            user_clicks[users_ids[i]] = float(user_clicks_count)
+            balances[users_data[i][3]] = new_balance
+            earned_by_user[users_data[i][3]] = int(user_earned)
+            users_balances[int(users_ids[i])] = int(new_balance)
+    return {
+        "user_clicks": user_clicks, "balances": balances, "earned": earned_by_user, "users_balances": users_balances
+    }
+
+
+async def recalculate_users_data_in_redis(partition: int, count=100, persist: bool = False) -> int:
     """
-    Пересчитывает балансы пользователей в зависимости от значения автокликера,
+    Пересчитывает балансы пользователей партиции в зависимости от значения автокликера,
     умножителя и времени с последнего обновления.
 
     Args:
-        pattern (str, optional): Шаблон ключей для поиска пользователей в Redis.
-                                 По умолчанию используется шаблон для `REDIS_NODE_TAG_2`.
+        partition (int): Номер партиции (см. `get_autoclicker_partition`).
         count (int): Количество пользователей, обрабатываемых за один батч. По умолчанию 100.
+        persist (bool): Записать посчитанные балансы в базу данных (по одному запросу на батч).
 
     Returns:
-        None
+        int: Количество пересчитанных пользователей.
+
+    Notes:
+        Пользователи для пересчета берутся из индекса партиции порциями по `count`,
+        только те, у которых наступило время пересчета.
+        В зависимости от настройки AUTOCLICKER_ENGINE балансы считаются lua-скриптом на стороне Redis
+        ("lua") или на стороне приложения с помощью NumPy ("numpy", см. `accrue_users_batch_vectorized`).
+        Балансы в Redis посчитаны на момент `current_time`, поэтому в базу данных вместе с ними
+        записывается это же время в "last_update_time": при загрузке из базы начисление продолжится с него.
     """
-    users_keys = set()
-    balances_key = f"users_balances:{settings.REDIS_NODE_TAG_3}"
+    index_key = get_autoclicker_index_key(partition)
     redis_client = await get_redis()
-    if pattern is None:
-        pattern = f"user_data:{settings.REDIS_NODE_TAG_2}:*"
-
-    try:
-        def get_batches(s, batch_size):
-            it = iter(s)
-            while True:
-                batch = list(islice(it, batch_size))
-                if not batch:
-                    break
-                yield batch
-
-        async for key in redis_client.scan_iter(match=pattern):
-            users_keys.add(key)
-        script = redis_client.register_script(recalculate_user_data_script)
-
-        for keys_batch in get_batches(users_keys, count):
-            current_time = int(datetime.now().timestamp())
-            users_clicks = await script(
-                keys=keys_batch,
-                args=[json.dumps(keys_batch), current_time, balances_key]
+
+    current_time = int(datetime.now().timestamp())
+    next_due_time = current_time + settings.AUTOCLICKER_RECALC_PERIOD
+
+    users_clicks = {}
+    while True:
+        users_ids = await redis_client.zrangebyscore(index_key, "-inf", current_time, start=0, num=count)
+        if not users_ids:
+            break
+
+        if settings.AUTOCLICKER_ENGINE == "numpy":
+            result = await accrue_users_batch_vectorized(
+                users_ids, index_key, current_time, next_due_time, redis_client
+            )
+        else:
+            result = await recalculate_users_batch(
+                users_ids, index_key, current_time, next_due_time, redis_client
             )
-            calculate_items_won_by_list.delay(users_clicks, redis_client)
-    except Exception as err:
-        logger.error(f"Ошибка при пересчете балансов пользователей с автокликером: {err}\n{err.with_traceback()}")
-    finally:
-        await redis_client.close()
+        if result["balances"]:
+            await set_users_balances(result["balances"], redis_client, result["earned"])
+        if persist and result["users_balances"]:
+            await UsersDAO.update_balances(result["users_balances"], current_time)
+        if result["user_clicks"]:
+            users_clicks.update(result["user_clicks"])
+    # выпавшие предметы подсчитываются одним пакетом для всех пользователей партиции
+    if users_clicks:
+        calculate_items_won_by_list.delay(users_clicks)
+    return len(users_clicks)
@@ -0,0 +1,81 @@
+"""
+Микробенчмарки преобразования данных пользователя между Redis и Python (`app/users/user_state.py`).
+
+Сравниваются прежнее преобразование с угадыванием типа по значению, полное преобразование
+по схеме модели `Users` и быстрый путь, преобразующий только числовые поля баланса.
+
+Запуск (нужен файл .env, как для приложения):
+    python -m benchmarks.user_state_bench
+"""
+import timeit
+from datetime import datetime
+
+from app.users.user_state import UserState, decode_hot_fields
+
+REDIS_USER = {
+    "id": "12345",
+    "username": "benchmark_user",
+    "mail": "benchmark@mail.com",
+    "hash_password": "gAAAAABmXc2h0tJt1nYyZk1pZ3Bq",
+    "registration_date": "2024-06-01",
+    "referral_link": "http://127.0.0.1:3000/login.html?ref=AbCdEfGhIjKl",
+    "referer": "",
+    "blocks_balance": "15234781",
+    "clicks_per_sec": "3",
+    "blocks_per_click": "0.012",
+    "improvements": "",
+    "telegram_id": "",
+    "last_update_time": "1718000000.125",
+    "role": "user",
+    "mail_confirm_code": "123456",
+    "is_confirm_mail": "True",
+    "drop_skip:1": "2",
+}
+
+
+def legacy_restore_types(user_data: dict) -> dict:
+    """Прежнее преобразование: тип каждого поля угадывается по значению."""
+    def is_float(value: str) -> bool:
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+
+    def is_date(value: str) -> bool:
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+            return True
+        except ValueError:
+            return False
+
+    return {
+        k: (
+            None if v == "" else
+            True if v == 'True' else
+            False if v == 'False' else
+            int(v) if isinstance(v, str) and v.isdigit() else
+            float(v) if isinstance(v, str) and is_float(v) else
+            datetime.strptime(v, '%Y-%m-%d') if isinstance(v, str) and is_date(v) else
+            v
+        )
+        for k, v in user_data.items()
+    }
+
+
+BENCHMARKS = {
+    "legacy restore_types_from_redis": lambda: legacy_restore_types(REDIS_USER),
+    "UserState.from_redis": lambda: UserState.from_redis(REDIS_USER),
+    "UserState.to_redis": (lambda state: lambda: state.to_redis())(UserState.from_redis(REDIS_USER)),
+    "decode_hot_fields": lambda: decode_hot_fields(dict(REDIS_USER)),
+}
+
+
+def main(number: int = 100000) -> None:
+    for name, func in BENCHMARKS.items():
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:<36} {best / number * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Общие фикстуры тестов.
+
+Функции Redis (lua-скрипты библиотеки `app/redis_helpers/functions.py`) выполняются в fakeredis
+с поддержкой Lua, вместо Redis Cluster используется одна нода.
+
+Запуск:
+    python -m pytest tests
+"""
+import os
+from datetime import datetime
+
+from cryptography.fernet import Fernet
+
+# обязательные настройки приложения без значений по умолчанию (см. app/config.py)
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("SMTP_HOST", "localhost")
+os.environ.setdefault("SMTP_USER", "test")
+os.environ.setdefault("SMTP_PASSWORD", "test")
+os.environ.setdefault("SMTP_PORT", "25")
+os.environ.setdefault("MAX_BLOCKS", "1000000")
+
+import numpy as np
+import pytest
+import pytest_asyncio
+from fakeredis import aioredis as fake_aioredis
+
+from app import redis_init
+from app.utils import items_drop
+from app.utils.items_drop import ItemsDropTable
+from app.utils.data_processing_funcs import get_user_data_key
+from app.redis_helpers.functions import build_library_code
+
+
+class FakeRedisCluster(fake_aioredis.FakeRedis):
+    """Клиент fakeredis с методами Redis Cluster, которые использует приложение."""
+    def get_node_from_key(self, key: str):
+        # единственная нода, маршрутизация вызова не нужна
+        return None
+
+
+@pytest_asyncio.fixture
+async def redis_client(monkeypatch):
+    """Клиент fakeredis с загруженной библиотекой функций, который возвращают `get_redis` и `get_redis_pubsub`."""
+    client = FakeRedisCluster(decode_responses=True)
+    await client.execute_command("FUNCTION", "LOAD", "REPLACE", build_library_code())
+    monkeypatch.setattr(redis_init, "redis_client", client)
+    monkeypatch.setattr(redis_init, "redis_pubsub_client", client)
+    yield client
+    await client.close()
+
+
+@pytest.fixture
+def set_items_drop_table(monkeypatch):
+    """
+    Возвращает функцию, которая подменяет таблицу игровых предметов предметами с указанными шансами выпадения.
+
+    Добавление выпавших предметов в базу данных (задача Celery) отключается.
+    """
+    monkeypatch.setattr(items_drop.add_items_to_db, "delay", lambda **kwargs: None)
+
+    def set_table(drop_chances: dict[str, float], maximum_amount: int = 1000) -> ItemsDropTable:
+        table = ItemsDropTable.__new__(ItemsDropTable)
+        table.item_keys = list(drop_chances.keys())
+        table.drop_chances = np.array(list(drop_chances.values()), dtype=np.float64)
+        table.maximum_amounts = np.full(len(drop_chances), maximum_amount, dtype=np.int64)
+        table.image_ids = [None] * len(drop_chances)
+        monkeypatch.setattr(items_drop, "items_drop_table", table)
+        return table
+
+    return set_table
+
+
+@pytest.fixture
+def add_user(redis_client):
+    """Возвращает функцию, которая записывает хеш пользователя без автокликера в Redis."""
+    async def add(user_id: int, username: str, blocks_balance: int = 0, **fields) -> str:
+        key = get_user_data_key(user_id)
+        await redis_client.hset(key, mapping={
+            "id": user_id,
+            "username": username,
+            "blocks_balance": blocks_balance,
+            "clicks_per_sec": 0,
+            "blocks_per_click": 1,
+            "last_update_time": datetime.now().timestamp(),
+            **fields
+        })
+        await redis_client.expire(key, 3600)
+        return key
+
+    return add
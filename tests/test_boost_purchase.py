@@ -0,0 +1,55 @@
+import pytest
+
+from app.boosts.dao import ImprovementsDAO
+from app.boosts.processed_functions import purchase_boost
+from app.utils.leaderboard import get_leaderboard_key, get_leaderboard_shard
+from app.utils.users_init import get_autoclicker_index_key, get_autoclicker_partition
+
+USER_ID = 21
+USERNAME = "boost_user"
+BOOST_DATA = {"user_id": USER_ID, "name": "autoclicker", "level": 1, "redis_key": "autoclicker"}
+
+
+@pytest.fixture
+def current_user():
+    return {"id": USER_ID, "username": USERNAME, "blocks_balance": 10000}
+
+
+@pytest.mark.asyncio
+async def test_failed_purchase_is_refunded(redis_client, add_user, current_user, monkeypatch):
+    key = await add_user(USER_ID, USERNAME, blocks_balance=10000)
+
+    async def save_purchase(*args, **kwargs):
+        raise RuntimeError("database is unavailable")
+
+    monkeypatch.setattr(ImprovementsDAO, "save_purchase", save_purchase)
+    with pytest.raises(RuntimeError):
+        await purchase_boost(current_user, "autoclicker", 4.0, "2", None, BOOST_DATA)
+
+    assert int(await redis_client.hget(key, "blocks_balance")) == 10000
+    assert await redis_client.hget(key, "clicks_per_sec") == "0"
+    index_key = get_autoclicker_index_key(get_autoclicker_partition(USER_ID))
+    assert await redis_client.zscore(index_key, USER_ID) is None
+    assert await redis_client.zscore(get_leaderboard_key(get_leaderboard_shard(USERNAME)), USERNAME) == 10000
+
+
+@pytest.mark.asyncio
+async def test_purchase_is_saved_after_spending(redis_client, add_user, current_user, monkeypatch):
+    key = await add_user(USER_ID, USERNAME, blocks_balance=10000)
+    saved = {}
+
+    async def save_purchase(boost_id, boost_data, user_data, session=None):
+        # цена уже списана в Redis, а пользователь еще не добавлен в индекс автокликера
+        saved["balance"] = int(await redis_client.hget(key, "blocks_balance"))
+        saved["user_data"] = user_data
+        return {"id": 1, **boost_data}
+
+    monkeypatch.setattr(ImprovementsDAO, "save_purchase", save_purchase)
+    boost = await purchase_boost(current_user, "autoclicker", 4.0, "2", None, BOOST_DATA)
+
+    assert boost["level"] == 1
+    assert saved["balance"] == 6000
+    assert saved["user_data"]["blocks_balance"] == 6000
+    assert saved["user_data"]["clicks_per_sec"] == 2
+    index_key = get_autoclicker_index_key(get_autoclicker_partition(USER_ID))
+    assert await redis_client.zscore(index_key, USER_ID) is not None
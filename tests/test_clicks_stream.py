@@ -0,0 +1,71 @@
+import pytest
+import pytest_asyncio
+
+from app.config import settings
+from app.utils.mining_chance_init import get_mining_chance_singleton
+from app.clicks.stream_consumer import (
+    add_clicks_event_to_stream,
+    apply_clicks_events,
+    create_clicks_consumer_groups,
+    get_clicks_stream_key,
+    get_clicks_stream_partition,
+    process_clicks_partition
+)
+
+USER_ID = 7
+
+
+@pytest_asyncio.fixture
+async def stream_user(redis_client, add_user, set_items_drop_table):
+    set_items_drop_table({})
+    get_mining_chance_singleton().set_value(1.0)
+    await create_clicks_consumer_groups(redis_client)
+    return await add_user(USER_ID, "stream_user")
+
+
+async def read_new_events(redis_client, consumer_name: str) -> list:
+    stream_key = get_clicks_stream_key(get_clicks_stream_partition(USER_ID))
+    response = await redis_client.xreadgroup(
+        settings.CLICKS_STREAM_GROUP, consumer_name, {stream_key: ">"}, count=100
+    )
+    return response[0][1] if response else []
+
+
+@pytest.mark.asyncio
+async def test_replayed_events_are_applied_once(redis_client, stream_user):
+    await add_clicks_event_to_stream(USER_ID, 3, redis_client)
+    await add_clicks_event_to_stream(USER_ID, 4, redis_client)
+
+    # обработчик применил события, но упал до подтверждения
+    events = await read_new_events(redis_client, "crashed")
+    await apply_clicks_events(events, redis_client)
+    assert await redis_client.hget(stream_user, "blocks_balance") == "7000"
+
+    # другой обработчик забирает неподтвержденные события партиции и обрабатывает их повторно
+    processed = await process_clicks_partition(get_clicks_stream_partition(USER_ID), "next", redis_client)
+
+    assert processed == 2
+    assert await redis_client.hget(stream_user, "blocks_balance") == "7000"
+    stream_key = get_clicks_stream_key(get_clicks_stream_partition(USER_ID))
+    assert (await redis_client.xpending(stream_key, settings.CLICKS_STREAM_GROUP))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_new_events_after_replay_are_applied(redis_client, stream_user):
+    await add_clicks_event_to_stream(USER_ID, 5, redis_client)
+    await apply_clicks_events(await read_new_events(redis_client, "crashed"), redis_client)
+    await add_clicks_event_to_stream(USER_ID, 2, redis_client)
+
+    await process_clicks_partition(get_clicks_stream_partition(USER_ID), "next", redis_client)
+
+    assert await redis_client.hget(stream_user, "blocks_balance") == "7000"
+
+
+@pytest.mark.asyncio
+async def test_partition_is_skipped_while_leased(redis_client, stream_user):
+    partition = get_clicks_stream_partition(USER_ID)
+    await redis_client.set(f"clicks_stream_lease:{{cs{partition}}}", "other")
+    await add_clicks_event_to_stream(USER_ID, 5, redis_client)
+
+    assert await process_clicks_partition(partition, "next", redis_client) == 0
+    assert await redis_client.hget(stream_user, "blocks_balance") == "0"
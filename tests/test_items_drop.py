@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+
+from app.redis_helpers.functions import call_function
+from app.utils.items_drop import resolve_expired_drop_skips
+from app.utils.users_init import apply_clicks_to_user
+
+USER_ID = 11
+ITEM_KEY = "gem"
+FIELD = f"drop_skip:{ITEM_KEY}"
+
+
+@pytest_asyncio.fixture
+async def drop_user(redis_client, add_user, set_items_drop_table):
+    # шанс 1.0: предмет выпадает на каждом клике после истечения счетчика
+    set_items_drop_table({ITEM_KEY: 1.0})
+    return await add_user(USER_ID, "drop_user", **{FIELD: 2})
+
+
+async def call_apply_clicks(redis_client, key: str, clicks: int) -> list:
+    return await call_function(
+        redis_client,
+        "apply_clicks",
+        keys=[key],
+        args=[clicks, 1.0, datetime.now().timestamp(), 3600, "", ITEM_KEY]
+    )
+
+
+@pytest.mark.asyncio
+async def test_expired_skip_is_claimed_by_one_call(redis_client, drop_user):
+    # оба вызова применили клики до того, как первый записал новый счетчик
+    first = await call_apply_clicks(redis_client, drop_user, 5)
+    second = await call_apply_clicks(redis_client, drop_user, 5)
+
+    first_claim, first_skips = first[3], first[4:]
+    assert first_claim.startswith("claimed:")
+    assert first_skips == [ITEM_KEY, "3", "1"]
+    assert second[3] == ""
+    assert second[4:] == []
+
+    items_won = await resolve_expired_drop_skips(USER_ID, drop_user, first_claim, first_skips, redis_client)
+    assert items_won == 4
+    assert await redis_client.hget(drop_user, FIELD) == "1"
+
+
+@pytest.mark.asyncio
+async def test_stale_claim_is_reclaimed_and_old_claim_is_not_awarded(redis_client, drop_user):
+    first = await call_apply_clicks(redis_client, drop_user, 5)
+    stale_claim = first[3]
+    # заявка устарела: вызов, заявивший счетчик, не записал его вовремя
+    await redis_client.hset(drop_user, FIELD, f"claimed:1:{datetime.now().timestamp() - 120}")
+
+    second = await call_apply_clicks(redis_client, drop_user, 5)
+    assert second[3] not in ("", stale_claim)
+    assert second[4:] == [ITEM_KEY, "5", "0"]
+
+    assert await resolve_expired_drop_skips(USER_ID, drop_user, stale_claim, first[4:], redis_client) == 0
+    assert await resolve_expired_drop_skips(USER_ID, drop_user, second[3], second[4:], redis_client) == 5
+
+
+@pytest.mark.asyncio
+async def test_apply_clicks_awards_drop_and_sets_new_skip(redis_client, drop_user):
+    new_balance, items_won = await apply_clicks_to_user({"id": USER_ID}, 5, 1.0)
+
+    assert new_balance == 5
+    assert items_won == 4
+    assert await redis_client.hget(drop_user, FIELD) == "1"
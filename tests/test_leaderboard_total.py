@@ -0,0 +1,33 @@
+import pytest
+
+from app.utils.leaderboard import (
+    get_leaderboard_key,
+    get_leaderboard_shard,
+    get_leaderboard_total_key,
+    get_total_balance,
+    set_user_balance,
+    set_users_balances
+)
+
+USERNAME = "total_user"
+
+
+@pytest.mark.asyncio
+async def test_missing_total_is_seeded_with_exact_shard_sum(redis_client):
+    shard = get_leaderboard_shard(USERNAME)
+    await redis_client.zadd(get_leaderboard_key(shard), {"other_user": 5000, USERNAME: 1000})
+
+    # счетчика нет (удален или истек), баланс пользователя изменяется
+    await set_user_balance(USERNAME, 3000, redis_client, 2000)
+
+    assert int(await redis_client.get(get_leaderboard_total_key(shard))) == 8000
+
+
+@pytest.mark.asyncio
+async def test_existing_total_is_changed_by_delta(redis_client):
+    shard = get_leaderboard_shard(USERNAME)
+    await set_users_balances({USERNAME: 1000}, redis_client)
+    await set_users_balances({USERNAME: 4000}, redis_client)
+
+    assert int(await redis_client.get(get_leaderboard_total_key(shard))) == 4000
+    assert await get_total_balance(redis_client) == 4000
@@ -0,0 +1,33 @@
+import pytest
+
+from app.exceptions import TokenExpiredException
+from app.users.auth import create_access_token
+from app.users.dependencies import get_current_user_id
+from app.users.token_cache import get_token_cache, revoke_token, revoke_user_tokens
+
+USER_ID = 31
+
+
+@pytest.mark.asyncio
+async def test_revoked_token_is_rejected_after_cache_hit(redis_client):
+    token = create_access_token({"sub": str(USER_ID)})
+    other_token = create_access_token({"sub": str(USER_ID), "device": "other"})
+    assert await get_current_user_id(token) == USER_ID
+
+    # токен отозван в другом процессе: кеш этого процесса о нем не знает
+    await revoke_token(token, USER_ID, redis_client)
+    get_token_cache().set(token, {"sub": str(USER_ID), "exp": 2 ** 40})
+
+    with pytest.raises(TokenExpiredException):
+        await get_current_user_id(token)
+    assert await get_current_user_id(other_token) == USER_ID
+
+
+@pytest.mark.asyncio
+async def test_deleted_user_tokens_are_rejected(redis_client):
+    token = create_access_token({"sub": str(USER_ID)})
+    assert await get_current_user_id(token) == USER_ID
+
+    await revoke_user_tokens(USER_ID, redis_client)
+    with pytest.raises(TokenExpiredException):
+        await get_current_user_id(token)